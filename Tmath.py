@@ -74,4 +74,173 @@ def baseReturnOrt(b1: array, b2: array, v):
         The coordinates of the vector v in the canonical basis.
     """
     baseMatrix = np.column_stack((b1,b2))
-    return baseMatrix @ v
\ No newline at end of file
+    return baseMatrix @ v
+
+
+def rectangleVertices(center: array, hight: float, width: float, angle: float)->list[array]:
+    """
+    It gives the vertices of a rectangle.
+
+    Args:
+        center (array): The center of the rectangle.
+        hight (float): The height of the rectangle.
+        width (float): The width of the rectangle.
+        angle (float): The angle that the rectangle will be facing.
+
+    Returns:
+        A list with the 4 vertices of the rectangle.
+    """
+    vector1 = direction2D(angle)
+    vector2 = array([vector1[1], -vector1[0]])
+    vertex1 = center+(width*vector2 - hight*vector1)/2
+    vertex2 = center+(width*vector2 + hight*vector1)/2
+    vertex3 = center+(-width*vector2 + hight*vector1)/2
+    vertex4 = center+(-width*vector2 - hight*vector1)/2
+    return [vertex1, vertex2, vertex3, vertex4]
+
+def curveOffsets(curve: list[array], amplitudes: list[float])->list[list[array]]:
+    """
+    Given a curve (list of points), creates an offset to each side.
+
+    Args:
+        curve (list[array]): The points of the curve.
+        amplitudes (list[float]): The distance between the offsets at each point.
+
+    Returns:
+        A list with the two offsets.
+    """
+    offset1 = []
+    offset2 = []
+
+    for i in range(len(curve)-1):
+        tangent = curve[i+1]-curve[i]
+        orto = array([-tangent[1], tangent[0]])
+        orto = 0.5*amplitudes[i]*orto/np.linalg.norm(orto)
+        offset1.append(curve[i]+orto)
+        offset2.append(curve[i]-orto)
+    orto = array([-tangent[1], tangent[0]])
+    orto = 0.5*amplitudes[-1]*orto/np.linalg.norm(orto)
+    offset1.append(curve[-1]+orto)
+    offset2.append(curve[-1]-orto)
+    return [offset1, offset2]
+
+
+class quotientSpace:
+    """
+    Vectorized geometry of a rectangle with its sides glued (torus, Klein bottle or projective plane).
+
+    The space is tiled by a matrix of 6x6 cells, where the cell i,j is the fundamental domain with the vertical gluing applied if i is odd and the horizontal gluing applied if j is odd.
+    Two points are the same point of the space if they are images of each other on different cells.
+
+    Attributes:
+        dimX (float): Width of the fundamental domain.
+        dimY (float): Height of the fundamental domain.
+        hOrientation (sign): The relation between the orientation of the left and right sides.
+        vOrientation (sign): The relation between the orientation of the top and bottom sides.
+        cellScales (array): A 6x6x2 tensor where the element i,j is the diagonal of the linear part of the transform of the cell i,j.
+        cellOffsets (array): A 6x6x2 tensor where the element i,j is the translation of the transform of the cell i,j.
+    """
+    def __init__(self, dimX: float, dimY: float, hOrientation: int, vOrientation: int):
+        self.dimX = dimX
+        self.dimY = dimY
+        self.hOrientation = hOrientation
+        self.vOrientation = vOrientation
+        self.dims = np.array([dimX, dimY], float)
+
+        rows = np.arange(6)[:, None]
+        cols = np.arange(6)[None, :]
+        flipX = (rows%2==1) & (vOrientation==-1)
+        flipY = (cols%2==1) & (hOrientation==-1)
+
+        self.cellScales = np.empty((6,6,2))
+        self.cellScales[:,:,0] = np.where(flipX, -1, 1)
+        self.cellScales[:,:,1] = np.where(flipY, -1, 1)
+
+        self.cellOffsets = np.empty((6,6,2))
+        self.cellOffsets[:,:,0] = np.where(flipX, dimX, 0) + cols*dimX
+        self.cellOffsets[:,:,1] = np.where(flipY, dimY, 0) + rows*dimY
+
+    def images(self, localPoints: array)->array:
+        """
+        Given the local coordinates of N points, returns the normal coordinates of every point on each cell.
+
+        Args:
+            localPoints (array): An Nx2 array with the local coordinates.
+
+        Returns:
+            An Nx6x6x2 array where the element n,i,j are the normal coordinates of the point n on the i,j cell.
+        """
+        localPoints = np.asarray(localPoints, float).reshape(-1, 2)
+        return localPoints[:, None, None, :]*self.cellScales + self.cellOffsets
+
+    def canonicalize(self, points: array)->array:
+        """
+        Brings points into the fundamental domain, i.e., returns their local coordinates.
+
+        Args:
+            points (array): A point or an Nx2 array of points, in normal coordinates.
+
+        Returns:
+            The local coordinates, with the same shape as points.
+        """
+        points = np.asarray(points, float)
+        x = points[..., 0]
+        y = points[..., 1]
+        newX = x%self.dimX
+        newY = y%self.dimY
+        if self.hOrientation==-1:
+            newY = np.where(x%(2*self.dimX)>self.dimX, self.dimY-newY, newY)
+        if self.vOrientation==-1:
+            newX = np.where(y%(2*self.dimY)>self.dimY, self.dimX-newX, newX)
+        return np.stack((newX, newY), axis=-1)
+
+    def canonicalizePoint(self, x: float, y: float)->tuple[float]:
+        """
+        The scalar version of canonicalize: it brings a single point into the fundamental domain with plain float arithmetic.
+
+        Args:
+            x (float): The x normal coordinate of the point.
+            y (float): The y normal coordinate of the point.
+
+        Returns:
+            The local coordinates (x, y) of the point.
+        """
+        newX = x%self.dimX
+        newY = y%self.dimY
+        if self.hOrientation==-1 and x%(2*self.dimX)>self.dimX:
+            newY = self.dimY-newY
+        if self.vOrientation==-1 and y%(2*self.dimY)>self.dimY:
+            newX = self.dimX-newX
+        return newX, newY
+
+    def minimalImage(self, points: array, targets: array)->array:
+        """
+        Computes the shortest displacements from some targets to some points.
+
+        Args:
+            points (array): An Nx2 array of points, in normal coordinates.
+            targets (array): An Mx2 array of points, in normal coordinates.
+
+        Returns:
+            An NxMx2 array where the element n,m is the displacement from the target m to the nearest image of the point n.
+        """
+        images = self.images(self.canonicalize(np.asarray(points, float).reshape(-1, 2))).reshape(-1, 36, 2)
+        # Translating by twice the domain maps the space onto itself, so the targets are placed on the central cells, surrounded by images.
+        centered = np.asarray(targets, float).reshape(-1, 2)%(2*self.dims) + 2*self.dims
+        displacements = images[:, None, :, :] - centered[None, :, None, :]
+        squared = np.einsum("nmck,nmck->nmc", displacements, displacements)
+        nearest = squared.argmin(axis=2)
+        return np.take_along_axis(displacements, nearest[:, :, None, None], axis=2)[:, :, 0, :]
+
+    def distance(self, points: array, targets: array)->array:
+        """
+        Computes the distance on the space between some points and some targets.
+
+        Args:
+            points (array): An Nx2 array of points, in normal coordinates.
+            targets (array): An Mx2 array of points, in normal coordinates.
+
+        Returns:
+            An NxM array where the element n,m is the distance between the point n and the target m.
+        """
+        return np.linalg.norm(self.minimalImage(points, targets), axis=2)
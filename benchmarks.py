@@ -0,0 +1,306 @@
+"""
+Micro-benchmarks of the geometry, terrain and rendering hot paths.
+
+Usage: python benchmarks.py [--save] [--tolerance 0.25] [--filter name] [--repeat 7] [--no-cache]
+
+Each benchmark is timed several times and its median is compared with the one stored on the baseline file, so a change that makes a hot
+path slower than the tolerance is reported as a regression (and the exit code is 1). The inputs are generated with fixed seeds.
+The baseline records the machine and the Python version where it was measured: the times are only comparable on the same machine, so
+refresh it with --save when the reference machine changes.
+The topological canvases are drawn with the null renderer, so they run without a display. The benchmarks of the plain tkinter widgets
+(the decorations of the title screen) need one: on a headless machine run them under a virtual one (xvfb-run python benchmarks.py),
+otherwise they are skipped.
+The terrains compile their raster through the cache of the user folder, as in a race. With --no-cache, they compile it in memory and
+nothing is written there.
+"""
+from pathlib import Path
+import argparse
+import platform
+import random
+import json
+import time
+import sys
+
+import numpy as np
+
+from Tmath import quotientSpace, curveOffsets
+from simulation import raceSimulation, carInput
+from trajectory import trajectoryResampler, multiTrajectoryPlayer
+from tracks import selectTrack
+from renderer import nullRenderer
+from constants import *
+
+
+BENCHMARK_SEED = 8
+BENCHMARK_BASELINE = Path(__file__).parent / "benchmarkBaseline.json"
+
+benchmarks = {}
+
+
+def benchmark(name: str, number: int = 1, canvas: bool = False, cache: bool = False):
+    """Registers a benchmark.
+
+    The decorated function prepares the inputs and returns the function that is timed, so the preparation isn't measured.
+
+    Args:
+        name (str): The name of the benchmark.
+        number (int): The number of calls of each timing.
+        canvas (bool): If the benchmark needs a tkinter canvas. The function then receives the Tk root.
+        cache (bool): If the preparation can use the caches of the user folder. The function then receives useCache.
+    """
+    def register(setup):
+        benchmarks[name] = {"setup": setup, "number": number, "canvas": canvas, "cache": cache}
+        return setup
+    return register
+
+
+def recordedGhost(spaceName: str = TORUS_PRIVATE_NAME, mapName: str = MAP1_PRIVATE_NAME, duration: float = 120)->np.ndarray:
+    """Returns a long trajectory of a car driven with random (but seeded) inputs, sampled as a record."""
+    rng = np.random.default_rng(BENCHMARK_SEED)
+    race = raceSimulation(spaceName, mapName)
+    recorder = trajectoryResampler(race.space, RECORD_RATE)
+    inputs = carInput(throttle=True)
+    for tick in range(int(duration*PHYSICS_RATE)):
+        if tick%PHYSICS_RATE==0:
+            inputs = carInput(throttle=rng.random()<0.9, left=rng.random()<0.3, right=rng.random()<0.3)
+        race.step(inputs)
+        recorder.append(race.state.position[0, 0], race.state.position[0, 1], race.state.angle[0], race.time)
+    recorder.finish()
+    return recorder.buffer.data.copy()
+
+
+def randomPoints(n: int, dim: float = 750)->np.ndarray:
+    """Returns n seeded random points of the global space of a local space of size dim."""
+    return np.random.default_rng(BENCHMARK_SEED).uniform(0, 2*dim, (n, 2))
+
+
+@benchmark("curveOffsets", number=20)
+def benchCurveOffsets():
+    roads = selectTrack(MAP2_PRIVATE_NAME, 750, 750)["roads"]
+    return lambda: [curveOffsets(road["points"], [road["thickness"]]*len(road["points"])) for road in roads]
+
+
+@benchmark("ghost.sample", number=5)
+def benchGhostSample():
+    record = recordedGhost()
+    player = multiTrajectoryPlayer([record]*10, quotientSpace(750, 750, 1, 1))
+    times = np.arange(0, record["t"][-1], 1/TARGET_FPS)
+    def run():
+        player.cursors[:] = player.firstSegment
+        for t in times:
+            player.sample(t)
+    return run
+
+
+def createCanvas(spaceName: str = TORUS_PRIVATE_NAME):
+    """Returns a topological canvas drawn with the null renderer."""
+    from gameManager import selectSpace
+    return selectSpace(None, spaceName, 750, 80, renderer=nullRenderer())
+
+
+@benchmark("canvas.topologicalPoint", number=5)
+def benchTopologicalPoint():
+    TCanvas = createCanvas(KLEIN_PRIVATE_NAME)
+    points = randomPoints(200)/2
+    def run():
+        for x, y in points:
+            TCanvas.topologicalPoint(x, y)
+    return run
+
+
+@benchmark("canvas.reflectedPoint", number=5)
+def benchReflectedPoint():
+    TCanvas = createCanvas(RP2_PRIVATE_NAME)
+    points = randomPoints(200)
+    def run():
+        for point in points:
+            TCanvas.reflectedPoint(point)
+    return run
+
+
+def frictionBenchmark(mapName: str, raster: bool, useCache: bool):
+    """Times terrainManager.getFriction on a map of the torus, with the terrains compiled into a raster or looked up on the polygons."""
+    from gameManager import selectMap
+    TCanvas = createCanvas()
+    terrain = selectMap(TCanvas, mapName)
+    if raster and useCache:
+        terrain.compileRaster(mapName, TORUS_PRIVATE_NAME)
+    elif raster:
+        terrain.compileRaster()
+    points = randomPoints(200)
+    def run():
+        for point in points:
+            terrain.getFriction(point)
+    return run
+
+for mapName in MAPS:
+    benchmark("getFriction." + mapName, number=5, cache=True)(lambda useCache, mapName=mapName: frictionBenchmark(mapName, True, useCache))
+    benchmark("getFriction.polygons." + mapName, number=5)(lambda mapName=mapName: frictionBenchmark(mapName, False, False))
+
+
+@benchmark("polygon.checkIfPointInside", number=5)
+def benchPointInside():
+    from topologicalTerrain import ZHomology
+    TCanvas = createCanvas()
+    terrain = ZHomology(TCanvas)
+    points = randomPoints(200)
+    def run():
+        for road in terrain.terrains:
+            for point in points:
+                road.checkIfPointInside(point)
+    return run
+
+
+@benchmark("ghost.update", number=1)
+def benchGhostUpdate():
+    from topologicalTerrain import topologicalPseudoCircle
+    from topologicalCar import topologicalCar
+    from chronometer import finishLine, ghostFleet
+    TCanvas = createCanvas()
+    terrain = topologicalPseudoCircle(TCanvas)
+    car = topologicalCar(TCanvas, x0=20, y0=20, height=20, width=10, ground=terrain)
+    timer = finishLine(terrain.terrains[0], car, TORUS_PRIVATE_NAME, MAP1_PRIVATE_NAME, TORUS_PRIVATE_NAME, "")
+    record = recordedGhost()
+    fleet = ghostFleet(car, timer, ["G" + str(k) for k in range(MAX_GHOSTS)], TORUS_PRIVATE_NAME, MAP1_PRIVATE_NAME, records=[record]*MAX_GHOSTS)
+    timer.lapCounter.counting[0] = True
+    times = np.arange(0, record["t"][-1], 1/TARGET_FPS)[:600]
+    def run():
+        fleet.player.cursors[:] = fleet.player.firstSegment
+        for t in times:
+            fleet.update(t)
+            TCanvas.flush()
+    return run
+
+
+@benchmark("decorations.move", number=20, canvas=True)
+def benchDecorations(tk):
+    from tkinter import Canvas
+    from decoration import decorationFamily
+    random.seed(BENCHMARK_SEED)
+    canvas = Canvas(tk, width=750, height=750)
+    canvas.pack()
+    family = decorationFamily(canvas, 100, maxX=750, maxY=750)
+    return lambda: family.moveDecorations(1/TARGET_FPS)
+
+
+@benchmark("ZHomology.build", number=1)
+def benchZHomology():
+    from topologicalTerrain import ZHomology
+    def run():
+        TCanvas = createCanvas()
+        ZHomology(TCanvas)
+        TCanvas.flush()
+        TCanvas.destroy()
+    return run
+
+
+def createRoot():
+    """Returns a hidden Tk root, or None if there isn't a display."""
+    from tkinter import Tk, TclError
+    try:
+        tk = Tk()
+    except TclError:
+        return None
+    tk.withdraw()
+    return tk
+
+
+def timeBenchmark(name: str, repeat: int = 7, tk=None, useCache: bool = True)->dict:
+    """Times a benchmark.
+    Args:
+        name (str): The name of the benchmark.
+        repeat (int): The number of timings.
+        tk (Tk): The root of the canvas benchmarks.
+        useCache (bool): If the benchmarks can use the caches of the user folder.
+    Returns:
+        A dictionary of the form {"median": m, "min": m, "max": m} with the seconds per call.
+    """
+    entry = benchmarks[name]
+    np.random.seed(BENCHMARK_SEED)
+    random.seed(BENCHMARK_SEED)
+    if entry["canvas"]:
+        run = entry["setup"](tk)
+    elif entry["cache"]:
+        run = entry["setup"](useCache)
+    else:
+        run = entry["setup"]()
+    run()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(entry["number"]):
+            run()
+        timings.append((time.perf_counter() - start)/entry["number"])
+    return {"median": float(np.median(timings)), "min": min(timings), "max": max(timings)}
+
+
+def machineInfo()->dict:
+    """Returns a description of the machine and the versions that affect the timings."""
+    return {"machine": platform.machine(), "processor": platform.processor(), "system": platform.platform(),
+            "python": platform.python_version(), "numpy": np.__version__}
+
+
+def loadBaseline(directory: Path = BENCHMARK_BASELINE)->dict:
+    """Returns the stored baseline, of the form {"machine": machineInfo(), "benchmarks": {name: result}}. It is empty if there isn't one."""
+    if not directory.exists():
+        return {"machine": {}, "benchmarks": {}}
+    with open(directory, "r") as f:
+        return json.load(f)
+
+
+def saveBaseline(results: dict, directory: Path = BENCHMARK_BASELINE)->None:
+    """Stores the results as the new baseline of this machine, keeping the benchmarks that weren't run."""
+    baseline = loadBaseline(directory)
+    baseline["machine"] = machineInfo()
+    baseline["benchmarks"].update(results)
+    with open(directory, "w") as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+
+
+def compare(results: dict, baseline: dict, tolerance: float = 0.25)->list[str]:
+    """Prints each result against the baseline and returns the names of the benchmarks that are slower than the tolerance."""
+    regressions = []
+    for name, result in results.items():
+        line = "{:<32}{:>12.3f} ms".format(name, 1000*result["median"])
+        if name in baseline:
+            ratio = result["median"]/baseline[name]["median"]
+            line += "{:>9.2f}x".format(ratio)
+            if ratio>1+tolerance:
+                line += "  REGRESSION"
+                regressions.append(name)
+        print(line)
+    return regressions
+
+
+def main(argv: list[str] = None)->int:
+    parser = argparse.ArgumentParser(description="Runs the micro-benchmarks and compares them with the baseline.")
+    parser.add_argument("--save", action="store_true", help="store the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="relative slowdown reported as a regression")
+    parser.add_argument("--filter", default="", help="only run the benchmarks whose name contains this text")
+    parser.add_argument("--repeat", type=int, default=7, help="number of timings of each benchmark")
+    parser.add_argument("--baseline", type=Path, default=BENCHMARK_BASELINE, help="file of the baseline")
+    parser.add_argument("--no-cache", dest="useCache", action="store_false", help="don't read or write the caches of the user folder")
+    args = parser.parse_args(argv)
+
+    names = [name for name in benchmarks if args.filter in name]
+    tk = createRoot() if any(benchmarks[name]["canvas"] for name in names) else None
+    results = {}
+    for name in names:
+        if benchmarks[name]["canvas"] and tk is None:
+            print("{:<32}{:>15}".format(name, "skipped (no display, use xvfb-run)"))
+            continue
+        results[name] = timeBenchmark(name, args.repeat, tk, args.useCache)
+    if tk is not None:
+        tk.destroy()
+
+    baseline = loadBaseline(args.baseline)
+    if baseline["machine"] and baseline["machine"]!=machineInfo():
+        print("The baseline was measured on another machine:", baseline["machine"])
+    regressions = compare(results, baseline["benchmarks"], args.tolerance)
+    if args.save:
+        saveBaseline(results, args.baseline)
+    return 1 if regressions and not args.save else 0
+
+
+if __name__=="__main__":
+    sys.exit(main())
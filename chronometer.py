@@ -1,9 +1,11 @@
-from time import time
 import numpy as np
 
 from topologicalObjects import topologicalThickCurve, topologicalPolygon
-from filesManager import saveRecord, loadRecord
+from filesManager import saveRecord, saveReplay, loadRecord, ENCODING_RAW, ENCODING_DELTA
 from topologicalCar import topologicalCar
+from simulation import lapCounter
+from replay import inputRecorder, createReplay, simulateReplay, verifyReplay
+from trajectory import trajectoryBuffer, trajectoryResampler, simplifyTrajectory, multiTrajectoryPlayer
 from Tmath import direction2D
 from constants import *
 
@@ -14,22 +16,29 @@ class finishLine():
         car (topologicalCar): The car that will be racing.
         size (float): The height of the finish line.
         TOTAL_LAPS (int): The total number of laps that have to be completed to finish the race.
+        lapCounter (lapCounter): The lap counter of the simulation core that keeps the laps and the time of the car.
         laps (int): The number of laps completed by the car.
         active (bool): Represents if the finish line is active, i.e., if the car crosses the line, it counts as a lap. This attribute is meant to prevent crossing the finish line and going backward from counting as one lap.
         counting (bool): Represents if the timer is counting.
-        startTime (float): The time when the race began (the car crossed the line for the first time).
         time (float): The time passed since the beginning of the race.
-        newTrajectory (list[dict]): The record of the trajectory of the car once it starts the race.
-        rival (rival): The replay of the loaded rival.
+        newTrajectory (trajectoryBuffer): The record of the trajectory of the car once it starts the race, sampled at RECORD_RATE.
+        recorder (trajectoryResampler): Resamples the position of the car on each physics step into newTrajectory.
+        startState (carState): The state of the car before the first physics step.
+        inputs (inputRecorder): The keys pressed on each physics step until the car finishes the race.
+        finishTick (int): The physics step on which the car finished the race.
+        lapTimes (list[float]): The race time at which each lap was completed.
+        ghosts (ghostFleet): The replay of the loaded rivals. None if the race has no rivals.
         hitbox (topologicalPolygon): The hitbox of the finish line.
      """
 
-    def __init__(self, curve:topologicalThickCurve, car: topologicalCar, spaceName:str, mapName: str, space: str, playerName:str, rivalName=None, size = 20):
+    def __init__(self, curve:topologicalThickCurve, car: topologicalCar, spaceName:str, mapName: str, space: str, playerName:str, rivalNames:list[str]=(), size = 20, useCache:bool = True):
         """Creates the finish line.
         Args:
             curve (topologicalThickCurve): The curve where the finish line will be placed (at the start).
             car (topologicalCar): The car that will be recorded.
+            rivalNames (list[str]): The names of the players whose records will race against the car.
             size (float): The height of the finish line.
+            useCache (bool): If False, the trajectories of the rivals aren't read from or written to the cache of the replays.
         """
 
         self.TCanvas = curve.TCanvas
@@ -38,25 +47,27 @@ class finishLine():
         self.curve = curve
 
         self.TOTAL_LAPS = 3
-        self.laps = 0
-        self.active = True
-        self.counting = False
-        self.startTime = 0
-        self.time = 0
         
         self.playerName = playerName
         self.mapName = mapName
         self.spaceName = spaceName
 
         self._createVisuals()
+        self.lapCounter = lapCounter(self.TCanvas.space, self.hitbox.localVertices, totalLaps=self.TOTAL_LAPS)
 
         self.placeCarBehindFinishLine()
 
-        self.newTrajectory = [{"x":self.hitbox.position[0], "y":self.hitbox.position[1], "angle": self.car.angle, "t":0}]
-        if rivalName:
-            self.rival = rival.cloneCar(car, self, rivalName, space, mapName)
+        self.newTrajectory = trajectoryBuffer()
+        self.recorder = trajectoryResampler(self.TCanvas.space, RECORD_RATE, self.newTrajectory)
+        self.recorder.append(self.hitbox.position[0], self.hitbox.position[1], self.car.angle, 0)
+        self.startState = self.car.state.copy()
+        self.inputs = inputRecorder()
+        self.finishTick = None
+        self.lapTimes = []
+        if rivalNames:
+            self.ghosts = ghostFleet(car, self, rivalNames, space, mapName, useCache=useCache)
         else:
-            self.rival = None
+            self.ghosts = None
 
     def _createVisuals(self):
         """Creates the visual representation of the finish line."""
@@ -72,7 +83,7 @@ class finishLine():
         angle = np.arctan2(direction[1], direction[0])
         self.angle = angle
         
-        self.hitbox = topologicalPolygon.rectangle(self.TCanvas, center, self.size, amplitude, angle)
+        self.hitbox = topologicalPolygon.rectangle(self.TCanvas, center, self.size, amplitude, angle, tags=[STATIC_TAG])
         vec1 = self.hitbox.localVertices[1]-self.hitbox.localVertices[0]
         vec1 = squareSide*vec1/np.linalg.norm(vec1)
         vec2 = self.hitbox.localVertices[-1]-self.hitbox.localVertices[0]
@@ -85,116 +96,204 @@ class finishLine():
                     color = "black"
                 else:
                     color = "white"
-                topologicalPolygon.square(self.TCanvas,squarePosition,squareSide,angle, fill=color)
+                topologicalPolygon.square(self.TCanvas,squarePosition,squareSide,angle, fill=color, tags=[STATIC_TAG])
     
     def placeCarBehindFinishLine(self, distance: int = 30):
         """Places de car just behind th finish line"""
         displacement = self.hitbox.position - self.car.body.position
         displacement = displacement - distance*direction2D(self.angle)
-        self.car.move(displacement)
-        self.car.body.TRotation(self.angle-self.car.angle)
         self.car.angle = self.angle
+        self.car.move(displacement)
         self.car.rise()
 
+    @property
+    def laps(self)->int:
+        return int(self.lapCounter.laps[0])
+
+    @property
+    def active(self)->bool:
+        return bool(self.lapCounter.active[0])
+
+    @property
+    def counting(self)->bool:
+        return bool(self.lapCounter.counting[0])
+
+    @property
+    def time(self)->float:
+        return float(self.lapCounter.time[0])
+
     def checkLaps(self):
         """Checks if the car has completed a lap and keeps track of how many laps have been completed."""
-        position = self.car.body.position
-        if self.active:
-            if self.hitbox.checkIfPointInside(position):
-                if self.laps==0:
-                    self.startTime = time()
-                    print("STARTING RACE")
-                    self.counting = True
-                    if self.rival:
-                        self.rival.start()
-                elif self.laps==self.TOTAL_LAPS:
-                    print("RACE FINISHED", self.time)
-                    self.active=False
-                    self.counting = False
-                self.laps = self.laps + 1
-                self.active = False
-        else:
-            distance = self.hitbox.computeDistanceToPoint(self.car.getPosition())
-            if distance>self.TCanvas.dimX/3:
-                self.active=True
+        laps = self.laps
+        started, finished = self.lapCounter.check(self.car.getPosition())
+        if laps>0 and self.laps>laps:
+            self.lapTimes.append(self.time)
+        if started[0]:
+            print("STARTING RACE")
+            if self.ghosts:
+                self.ghosts.start()
+        elif finished[0]:
+            self.recorder.finish()
+            self.finishTick = self.inputs.ticks
+            print("RACE FINISHED", self.time)
 
 
 
     def saveRecord(self):
         if self.laps>self.TOTAL_LAPS and self.playerName!="":
-            saveRecord(self.mapName, self.spaceName, self.playerName, self.newTrajectory)
+            if RECORD_INPUTS:
+                replay = createReplay(self.mapName, self.spaceName, self.playerName, (self.TCanvas.dimX, self.TCanvas.dimY),
+                                      self.startState, self.inputs, self.finishTick, self.time)
+                result = simulateReplay(replay)
+                if verifyReplay(replay, result):
+                    saveReplay(self.mapName, self.spaceName, self.playerName, replay, result["trajectory"])
+                    return
+                print("WARNING: THE REPLAY COULDN'T BE VERIFIED, SAVING THE TRAJECTORY")
+            trajectory = self.newTrajectory.data
+            encoding = ENCODING_RAW
+            if RECORD_COMPRESSION:
+                trajectory = simplifyTrajectory(trajectory, self.TCanvas.space, RECORD_TOLERANCE, RECORD_ANGLE_TOLERANCE)
+                encoding = ENCODING_DELTA
+            saveRecord(self.mapName, self.spaceName, self.playerName, trajectory, encoding)
 
     def updateRecord(self):
         """Updates the record of the playable car."""
         if self.counting:
-            self.newTrajectory.append({"x":self.car.body.position[0],
-                                "y":self.car.body.position[1],
-                                "angle": self.car.angle,
-                                "t":self.time})
+            position = self.car.getPosition()
+            self.recorder.append(position[0], position[1], self.car.angle, self.time)
 
-    def update(self):
-        """Updates all the necessary things."""
+    def update(self, dt:float=None):
+        """Updates all the race-like features after a physics step.
+        Args:
+            dt (float): The time step. By default, the time elapsed since the last frame.
+        """
+        if dt is None:
+            dt = self.TCanvas.getDelta()
+        if self.finishTick is None:
+            self.inputs.append(self.car.inputCode)
         if self.counting:
-            self.time = time() - self.startTime
+            self.lapCounter.advanceTime(dt)
             if self.time>600: #Don't save if it last more than 10 min
                 self.playerName = ""
             if self.playerName!="":
                 self.updateRecord()
-        if self.rival:
-            self.rival.update()
         
         self.checkLaps()
 
+    def render(self, alpha:float=1, step:float=0):
+        """Updates the visual features (the rivals) once per frame.
+        Args:
+            alpha (float): The interpolation factor between the last two physics steps at which the frame is rendered.
+            step (float): The duration of a physics step.
+        """
+        if self.ghosts:
+            self.ghosts.update(max(self.time - (1-alpha)*step, 0))
+
 
 
 class rival(topologicalPolygon):
-    """Emulates a car following a given trajectory.
+    """Emulates a car following a given trajectory. Its pose is set by the ghostFleet that owns it.
     Attributes:
-        timer (finishLine): The finishLine that manages the records.
-        trajectory (list[dict]): A list of times, positions, and angles of the car.
-        step (int): The index of the trajectory list that the clone is at right now.
+        name (str): The name of the player of the record.
+        angle (float): The angle at which the clone is oriented.
     """
 
     @classmethod
-    def cloneCar(cls, car:topologicalCar, timer:finishLine, rivalName:str, space:str, map:str):
+    def cloneCar(cls, car:topologicalCar, timer:finishLine, rivalName:str):
         """Clones a given car and sets it up to race."""
 
-        rival = super().rectangle(car.TCanvas, car.body.position, car.height, car.width, timer.angle, fill=MAINCOLOR_DARK)
-        rival.timer = timer
-
-        rival.trajectory = []
+        rival = super().rectangle(car.TCanvas, car.body.position, car.height, car.width, timer.angle, fill=MAINCOLOR_DARK, tags=[GHOST_TAG])
+        rival.name = rivalName
         rival.angle = timer.angle
-        rival.step = 0
-        rival.hide()
-        rival.record = loadRecord(space, map, rivalName)
-        rival.TMove(*(np.array([rival.record[0]["x"],rival.record[0]["y"]])-rival.position))
         return rival
-    
+
+
+class ghostFleet:
+    """Races the records of several players at once.
+
+    The trajectories are played back together, so placing all the rivals takes one vectorized interpolation and one computation of the
+    coordinates of all their copies per frame. Only the copies on visible cells are updated, the others are rebuilt when they come into view.
+    All the rivals share the GHOST_TAG, so they are shown and hidden with a single command.
+
+    Attributes:
+        TCanvas (topologicalCanvas): The topological canvas where the rivals live.
+        timer (finishLine): The finishLine that manages the records.
+        rivals (list[rival]): The clones of the car, one per record.
+        player (multiTrajectoryPlayer): The playback of the trajectories of the rivals.
+        modelAngle (float): The angle at which the clones were created.
+        modelVertices (array): The vertices of the clones relative to their position, as they were created.
+        rotate (bool): If False, the clones are only translated, which is cheaper than placing all their copies.
+    """
+    def __init__(self, car:topologicalCar, timer:finishLine, rivalNames:list[str], space:str, map:str, records:list=None, useCache:bool=True):
+        """Loads the records and creates the clones.
+        Args:
+            car (topologicalCar): The car that is cloned.
+            timer (finishLine): The finishLine that manages the records.
+            rivalNames (list[str]): The names of the players whose records are raced.
+            space (str): The private name of the space.
+            map (str): The private name of the map.
+            records (list): The trajectories of the rivals, in the order of their names. By default, they are loaded from their records.
+            useCache (bool): If False, the trajectories of the replays aren't read from or written to their cache.
+        """
+        self.TCanvas = car.TCanvas
+        self.timer = timer
+        dims = (self.TCanvas.dimX, self.TCanvas.dimY)
+        self.rivals = [rival.cloneCar(car, timer, name) for name in rivalNames]
+        if records is None:
+            records = [loadRecord(space, map, name, dims, useCache) for name in rivalNames]
+        self.player = multiTrajectoryPlayer(records, self.TCanvas.space)
+        self.modelAngle = timer.angle
+        self.modelVertices = self.rivals[0].modelVertices
+        self.rotate = True
+        self.stop()
+        self.place(0)
+
+    def __len__(self)->int:
+        return len(self.rivals)
+
     def start(self):
         """Starts the run."""
-        self.unhide()
+        self.TCanvas.queueCommand("itemconfigure", GHOST_TAG, "-state", "normal")
 
     def stop(self):
         """Stops the run."""
-        self.hide()
-
-    def update(self):
-        """Updates the clone's position and angle based on the time elapsed and the loaded trajectory."""
-        if self.timer.counting:
-            for t in range(self.step,len(self.record)-1):
-                if self.record[t]["t"]>self.timer.time:
-                    prevPoint = np.array([self.record[t]["x"],self.record[t]["y"]])
-                    nextPoint= np.array([self.record[t+1]["x"],self.record[t+1]["y"]])
-                    distance = nextPoint-prevPoint
-                    if np.dot(distance, distance)<self.TCanvas.dimX*self.TCanvas.dimY:
-                        tInterp = (self.timer.time-self.record[t]["t"])/(self.record[t+1]["t"]-self.record[t]["t"])
-                        self.step = t
-                        prevPoint = np.array([self.record[t]["x"],self.record[t]["y"]])
-                        nextPoint= np.array([self.record[t+1]["x"],self.record[t+1]["y"]])
-                        d = (nextPoint-prevPoint)*tInterp-(self.position-prevPoint)
-                        self.move(d[0], d[1])
-                        dAngle = self.record[t]["angle"]-self.angle
-                        self.TRotation(dAngle)
-                        self.angle = self.record[t]["angle"]
-                    
-                    break
+        self.TCanvas.queueCommand("itemconfigure", GHOST_TAG, "-state", "hidden")
+
+    def place(self, time:float)->None:
+        """Places all the clones at the pose of their trajectories at a certain time.
+
+        The vertices of all the clones are computed together and converted to the coordinates of all the copies in a single step.
+        """
+        positions, angles = self.player.sample(time)
+        rotations = angles - self.modelAngle
+        cos, sin = np.cos(rotations)[:, None], np.sin(rotations)[:, None]
+        modelX, modelY = self.modelVertices[:, 0], self.modelVertices[:, 1]
+        vertices = np.stack((modelX*cos - modelY*sin, modelX*sin + modelY*cos), axis=2) + positions[:, None, :]
+        copies = self.TCanvas.cellsCoordinates(vertices.reshape(-1, 2)).reshape(6, 6, len(self.rivals), -1)
+        for k, clone in enumerate(self.rivals):
+            clone.position = positions[k]
+            clone.angle = float(angles[k])
+            clone.poseAngle = float(rotations[k])
+            clone.vertices = vertices[k]
+            clone.placeCopies(copies[:, :, k])
+
+    def update(self, time:float=None):
+        """Places the clones at the position and angle of their trajectories at the time elapsed.
+        Args:
+            time (float): The race time to show. By default, the time of the timer.
+        """
+        if time is None:
+            time = self.timer.time
+        if not self.timer.counting:
+            return
+        if self.rotate:
+            self.place(time)
+            return
+        positions, angles = self.player.sample(time)
+        for k, clone in enumerate(self.rivals):
+            clone.angle = float(angles[k])
+            displacement = positions[k] - clone.position
+            if np.dot(displacement, displacement)<self.TCanvas.dimX*self.TCanvas.dimY:
+                clone.move(*displacement)
+            else:
+                clone.setPose(positions[k], clone.poseAngle)
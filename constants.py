@@ -31,6 +31,9 @@ RP2_PUBLIC_NAME = "Projective Plane"
 
 SPACES = [TORUS_PRIVATE_NAME, KLEIN_PRIVATE_NAME, RP2_PRIVATE_NAME]
 
+# [hOrientation, vOrientation] of each space
+SPACE_ORIENTATIONS = {TORUS_PRIVATE_NAME: [1, 1], KLEIN_PRIVATE_NAME: [1, -1], RP2_PRIVATE_NAME: [-1, -1]}
+
 MAP1_PRIVATE_NAME = "pseudo"
 MAP1_PUBLIC_NAME = "Pseudo-Circle"
 MAP2_PRIVATE_NAME = "Z"
@@ -40,4 +43,29 @@ MAPS = [MAP1_PRIVATE_NAME, MAP2_PRIVATE_NAME]
 
 PLAYER_NAME_LEN = 15
 
+INPUT_BITS = {"w": 1, "a": 2, "s": 4, "d": 8} # Bit of each driving key in the encoded inputs
+
+PHYSICS_RATE = 120 # Physics steps per second
+TARGET_FPS = 60
+HUD_DEGRADED_INTERVAL = 6 # Frames between HUD updates when the game runs slow
+
+RECORD_RATE = 30 # Samples per second of the recorded trajectories
+RECORD_COMPRESSION = False # Simplify and delta-encode the saved trajectories (lossy)
+RECORD_TOLERANCE = 0.5 # Maximum position error of the simplified trajectories (pixels)
+RECORD_ANGLE_TOLERANCE = 0.01 # Maximum angle error of the simplified trajectories (radians)
+RECORD_INPUTS = True # Save the records as replays of the inputs instead of trajectories
+
+GHOST_TAG = "ghost" # Canvas tag shared by all the rivals
+MAX_GHOSTS = 10 # Maximum number of rivals in a race
+TOP_GHOSTS = 5 # Number of rivals of the "top" option of the title screen
+
+PROFILER_PHASES = ["redraw", "hud", "physics", "laps", "car", "ghosts", "flush"] # Phases of the frame timed by the profiler
+PROFILER_WINDOW = 300 # Frames of the rolling percentiles of the profiler
+PROFILER_KEY = "F3" # Key that shows and hides the profiler overlay
+PROFILER_OVERLAY_INTERVAL = 30 # Frames between updates of the profiler overlay
+PROFILER_EXPORT = True # Save the time of each phase of each frame to a CSV file when the race ends
+
+STATIC_TAG = "static" # Canvas tag of the geometry of the track, which never changes during a race
+BAKE_STATIC_TRACK = True # Draw the static geometry as one image per cell instead of vector items
+
 IMG_SIZE = (64, 64)
\ No newline at end of file
@@ -1,8 +1,16 @@
+from contextlib import contextmanager
 from pathlib import Path
 from PIL import Image
+import numpy as np
+import hashlib
+import sqlite3
+import struct
 import json
+import zlib
 import sys
 
+from trajectory import deltaEncode, deltaDecode
+from replay import simulateReplay
 from constants import *
 
 
@@ -18,49 +26,546 @@ def checkFolders():
             direction.mkdir(parents=True, exist_ok=True)
 
 
-def getRecords(space: str, map: str)-> dict:
-    """Gets the records of the players.
+RECORD_MAGIC = b"TRREC"
+RECORD_VERSION = 2
+RECORD_HEADER = struct.Struct("<5sHHHHdQ") # magic, version, length of map, space and player names, finalTime, number of samples
+RECORD_ENCODING = struct.Struct("<H") # encoding of the columns (since version 2)
+RECORD_COLUMNS = [("t", np.float64), ("x", np.float32), ("y", np.float32), ("angle", np.float32)]
+RECORD_QUANTA = {"t": 1e-4, "x": 1e-2, "y": 1e-2, "angle": 1e-4} # resolution of the columns when they are delta-encoded
+RECORD_ALIGNMENT = 8
+
+REPLAY_MAGIC = b"TRRPL"
+REPLAY_VERSION = 1
+REPLAY_HEADER = struct.Struct("<5sHI") # magic, version, length of the JSON metadata
+
+ENCODING_RAW = 0 # packed columns
+ENCODING_DELTA = 1 # quantized, delta-encoded and zlib-compressed columns, each one preceded by its length in bytes (uint32)
+
+
+def getRecordDir(map: str, space: str, playerName: str, binary: bool = True)->Path:
+    """Returns the path of the record of a player.
     Args:
+        map (str): The private name of the map.
         space (str): The private name of the space.
+        playerName (str): The name of the player.
+        binary (bool): If True, the path of the binary record. Otherwise, the path of the old JSON record.
+    """
+    return USER_DIR / map / space / ("record" + playerName + (".rec" if binary else ".json"))
+
+
+def writeBinaryRecord(directory: Path, map: str, space: str, playerName: str, trajectory, finalTime: float, encoding: int = ENCODING_RAW)->None:
+    """Writes a record in the binary format.
+
+    The file starts with a header (RECORD_HEADER) followed by the names of the map, the space and the player in UTF-8 and the encoding (RECORD_ENCODING).
+    Then, aligned to RECORD_ALIGNMENT bytes, it has each column of RECORD_COLUMNS one after the other.
+
+    Args:
+        directory (Path): The path of the file.
         map (str): The private name of the map.
+        space (str): The private name of the space.
+        playerName (str): The name of the player.
+        trajectory: The samples of the trajectory. Anything indexable by the column names (a structured array or a dictionary of arrays).
+        finalTime (float): The time of the race.
+        encoding (int): ENCODING_RAW to pack the columns as they are or ENCODING_DELTA to compress them (lossy, see RECORD_QUANTA).
+    """
+    names = [name.encode("utf-8") for name in (map, space, playerName)]
+    nSamples = len(trajectory["t"])
+    header = RECORD_HEADER.pack(RECORD_MAGIC, RECORD_VERSION, *[len(name) for name in names], finalTime, nSamples) + b"".join(names)
+    header += RECORD_ENCODING.pack(encoding)
+    header += bytes(-len(header)%RECORD_ALIGNMENT)
+    temporal = directory.with_suffix(".tmp")
+    with open(temporal, "wb") as f:
+        f.write(header)
+        for column, dtype in RECORD_COLUMNS:
+            if encoding==ENCODING_DELTA:
+                packed = zlib.compress(deltaEncode(trajectory[column], RECORD_QUANTA[column]).astype("<i4").tobytes(), 9)
+                f.write(struct.pack("<I", len(packed)) + packed)
+            else:
+                f.write(np.ascontiguousarray(trajectory[column], dtype=np.dtype(dtype).newbyteorder("<")).tobytes())
+    temporal.replace(directory)
+
+
+def readRecordHeader(directory: Path)->dict:
+    """Reads the header of a binary record.
     Returns:
-        A dictionari of the form {"time":t, "name":n} with the time on the format min:sec with only one digit to the mins.
+        A dictionary of the form {"map": m, "space": s, "player": p, "finalTime": t, "samples": n, "encoding": e, "offset": o}, where o is the position of the first column in the file.
     """
-    direction = USER_DIR / map / space
-    JSONFiles = list(direction.glob('*.json'))
-    rivals = []
-    for fileDir in JSONFiles:
-        with open(fileDir, "r", encoding="utf-8") as file:
-            record = json.load(file)
-            secInMin = 60
-            timeStr = str(round(record["finalTime"])//secInMin) + ":" + str(round(record["finalTime"])%secInMin)
-            rivals.append({"time":timeStr, "name": record["player"]})
-    
-    orderedRivals = sorted(rivals, key=lambda x: x["time"])
-    return orderedRivals
-
-def saveRecord(map: str, space: str, playerName: str, trajectory: dict) -> bool:
-    """Saves the record as a file named recordplayer.json in the respective file (map/space/).
-    If a record already existed, only saves the new time if it is lower than the previous one.
+    with open(directory, "rb") as f:
+        fixed = f.read(RECORD_HEADER.size)
+        if len(fixed)<RECORD_HEADER.size:
+            raise ValueError("Truncated record: " + str(directory))
+        magic, version, mapLen, spaceLen, playerLen, finalTime, nSamples = RECORD_HEADER.unpack(fixed)
+        if magic!=RECORD_MAGIC:
+            raise ValueError("Not a record file: " + str(directory))
+        if version>RECORD_VERSION:
+            raise ValueError("Unsupported record version " + str(version) + ": " + str(directory))
+        names = f.read(mapLen+spaceLen+playerLen).decode("utf-8")
+        offset = RECORD_HEADER.size + mapLen + spaceLen + playerLen
+        encoding = ENCODING_RAW
+        if version>=2:
+            encoding, = RECORD_ENCODING.unpack(f.read(RECORD_ENCODING.size))
+            offset += RECORD_ENCODING.size
+    offset += -offset%RECORD_ALIGNMENT
+    return {"map": names[:mapLen], "space": names[mapLen:mapLen+spaceLen], "player": names[mapLen+spaceLen:],
+            "finalTime": finalTime, "samples": nSamples, "encoding": encoding, "offset": offset}
+
+
+def readBinaryRecord(directory: Path)->dict:
+    """Reads a binary record. The raw columns are memory-mapped (not copied) and the delta-encoded ones are decoded.
+    Returns:
+        The header (see readRecordHeader) with a key for each column of RECORD_COLUMNS.
+    """
+    record = readRecordHeader(directory)
+    offset = record["offset"]
+    nSamples = record["samples"]
+    if record["encoding"]==ENCODING_DELTA:
+        with open(directory, "rb") as f:
+            f.seek(offset)
+            for column, dtype in RECORD_COLUMNS:
+                length, = struct.unpack("<I", f.read(4))
+                deltas = np.frombuffer(zlib.decompress(f.read(length)), "<i4")
+                record[column] = deltaDecode(deltas, RECORD_QUANTA[column]).astype(dtype)
+        return record
+    if record["encoding"]!=ENCODING_RAW:
+        raise ValueError("Unsupported record encoding " + str(record["encoding"]) + ": " + str(directory))
+
+    for column, dtype in RECORD_COLUMNS:
+        dtype = np.dtype(dtype).newbyteorder("<")
+        if nSamples:
+            record[column] = np.memmap(directory, dtype=dtype, mode="r", offset=offset, shape=(nSamples,))
+        else:
+            record[column] = np.zeros(0, dtype)
+        offset += nSamples*dtype.itemsize
+    return record
+
+
+def readJSONRecord(directory: Path)->dict:
+    """Reads a record in the old JSON format and returns it in the same form as readBinaryRecord."""
+    with open(directory, "r", encoding="utf-8") as f:
+        record = json.load(f)
+    trajectory = record.pop("trajectory")
+    record["samples"] = len(trajectory)
+    for column, dtype in RECORD_COLUMNS:
+        record[column] = np.array([sample[column] for sample in trajectory], dtype)
+    return record
+
+
+def getReplayDir(map: str, space: str, playerName: str)->Path:
+    """Returns the path of the replay of a player."""
+    return USER_DIR / map / space / ("record" + playerName + ".rpl")
+
+
+def getReplayCacheDir(directory: Path, key: str)->Path:
+    """Returns the path of the cached trajectory of a replay, next to the replay (see readReplayTrajectory)."""
+    return directory.parent / "replays" / directory.stem[len("record"):] / (key + ".rec")
+
+
+def replayCacheKey(replay: dict, dims: tuple[float])->str:
+    """Returns a hash that identifies a replay and the dimensions where its trajectory is shown."""
+    metadata = {key: replay[key] for key in ("map", "space", "player", "dimX", "dimY", "rate", "start", "finishTick", "finalTime")}
+    digest = hashlib.sha1(json.dumps(metadata, sort_keys=True).encode("utf-8"))
+    digest.update(np.ascontiguousarray(replay["codes"], np.uint8).tobytes())
+    digest.update(np.ascontiguousarray(replay["counts"], "<u4").tobytes())
+    digest.update(np.array([dims[0], dims[1], RECORD_RATE], np.float64).tobytes())
+    return digest.hexdigest()[:16]
+
+
+def cacheReplayTrajectory(directory: Path, replay: dict, dims: tuple[float], trajectory)->None:
+    """Caches the trajectory of a replay, simulated on certain dimensions, as a binary record."""
+    cacheDir = getReplayCacheDir(directory, replayCacheKey(replay, dims))
+    cacheDir.parent.mkdir(parents=True, exist_ok=True)
+    writeBinaryRecord(cacheDir, replay["map"], replay["space"], replay["player"], trajectory, replay["finalTime"])
+
+
+def readReplayTrajectory(directory: Path, replay: dict, dims: tuple[float] = None, useCache: bool = True)->dict:
+    """Returns the trajectory of a replay. It is only re-simulated if it hasn't been cached on these dimensions yet.
+    Args:
+        directory (Path): The path of the replay.
+        replay (dict): The replay (see readReplay).
+        dims (tuple[float]): The width and height of the local space where the trajectory will be shown. By default, the ones where it was recorded.
+        useCache (bool): If False, the replay is always re-simulated and nothing is written to disk.
+    Returns:
+        A dictionary with an array for each column of RECORD_COLUMNS.
     """
-    directory = USER_DIR / map / space / ("record" + playerName + ".json")
-    finalTime = trajectory[-1]["t"]
+    dims = (replay["dimX"], replay["dimY"]) if dims is None else dims
+    cacheDir = getReplayCacheDir(directory, replayCacheKey(replay, dims))
+    if useCache and cacheDir.exists():
+        try:
+            record = readBinaryRecord(cacheDir)
+            return {column: record[column] for column, _ in RECORD_COLUMNS}
+        except (OSError, ValueError):
+            pass
+    trajectory = simulateReplay(replay, dims)["trajectory"]
+    if useCache:
+        cacheReplayTrajectory(directory, replay, dims, trajectory)
+    return {column: trajectory[column] for column, _ in RECORD_COLUMNS}
+
+
+def writeReplay(directory: Path, replay: dict)->None:
+    """Writes a replay (see replay.py).
+
+    The file starts with a header (REPLAY_HEADER) followed by the metadata of the replay in JSON.
+    Then, aligned to RECORD_ALIGNMENT bytes, it has the codes of the runs (uint8) and their counts (uint32).
+    """
+    metadata = {key: value for key, value in replay.items() if key not in ("codes", "counts")}
+    metadata["runs"] = len(replay["codes"])
+    metadata = json.dumps(metadata).encode("utf-8")
+    header = REPLAY_HEADER.pack(REPLAY_MAGIC, REPLAY_VERSION, len(metadata)) + metadata
+    header += bytes(-len(header)%RECORD_ALIGNMENT)
+    codes = np.ascontiguousarray(replay["codes"], np.uint8).tobytes()
+    codes += bytes(-len(codes)%RECORD_ALIGNMENT)
+    temporal = directory.with_suffix(".tmp")
+    with open(temporal, "wb") as f:
+        f.write(header + codes + np.ascontiguousarray(replay["counts"], "<u4").tobytes())
+    temporal.replace(directory)
+
+
+def readReplayHeader(directory: Path)->dict:
+    """Reads the metadata of a replay (everything except its inputs)."""
+    with open(directory, "rb") as f:
+        fixed = f.read(REPLAY_HEADER.size)
+        if len(fixed)<REPLAY_HEADER.size:
+            raise ValueError("Truncated replay: " + str(directory))
+        magic, version, length = REPLAY_HEADER.unpack(fixed)
+        if magic!=REPLAY_MAGIC:
+            raise ValueError("Not a replay file: " + str(directory))
+        if version>REPLAY_VERSION:
+            raise ValueError("Unsupported replay version " + str(version) + ": " + str(directory))
+        replay = json.loads(f.read(length).decode("utf-8"))
+    offset = REPLAY_HEADER.size + length
+    replay["offset"] = offset + -offset%RECORD_ALIGNMENT
+    return replay
+
+
+def readReplay(directory: Path)->dict:
+    """Reads a replay (see replay.py)."""
+    replay = readReplayHeader(directory)
+    nRuns = replay["runs"]
+    with open(directory, "rb") as f:
+        f.seek(replay["offset"])
+        replay["codes"] = np.frombuffer(f.read(nRuns), np.uint8)
+        f.read(-nRuns%RECORD_ALIGNMENT)
+        replay["counts"] = np.frombuffer(f.read(4*nRuns), "<u4")
+    return replay
+
+
+def readRecord(map: str, space: str, playerName: str, dims: tuple[float] = None, useCache: bool = True)->dict:
+    """Reads the record of a player as a trajectory, from a replay, a binary record or a JSON record (in this order of preference).
+    The trajectory of a replay is re-simulated the first time it is read on some dimensions and cached (see readReplayTrajectory).
+
+    Args:
+        dims (tuple[float]): The width and height of the local space where the record will be shown. Only the replays use it, to scale the positions.
+        useCache (bool): If False, the trajectory of a replay isn't read from or written to the cache.
+    """
+    directory = getReplayDir(map, space, playerName)
+    if directory.exists():
+        replay = readReplay(directory)
+        trajectory = readReplayTrajectory(directory, replay, dims, useCache)
+        record = {key: value for key, value in replay.items() if key not in ("codes", "counts")}
+        record.update(trajectory)
+        record["samples"] = len(trajectory["t"])
+        return record
+    directory = getRecordDir(map, space, playerName)
     if directory.exists():
-        with open(directory, "r") as oldRecord:
-            if finalTime >= json.load(oldRecord)["finalTime"]:
-                return False
-    trajectoryFile = {"map": map, "space": space, "player": playerName, "trajectory": trajectory, "finalTime": finalTime}
-    with open(directory, "w") as f:
-        json.dump(trajectoryFile, f, indent=2)
+        return readBinaryRecord(directory)
+    return readJSONRecord(getRecordDir(map, space, playerName, binary=False))
+
+
+def getRecordFiles(map: str, space: str, root: Path = USER_DIR)->dict:
+    """Returns a dictionary with the path of the record of each player of a map and space. The replays are preferred to the binary records and these to the JSON ones."""
+    direction = Path(root) / map / space
+    files = {}
+    for suffix in ("json", "rec", "rpl"):
+        for fileDir in sorted(direction.glob("record*." + suffix)):
+            files[fileDir.stem[len("record"):]] = fileDir
+    return files
+
+
+def readRecordSummary(directory: Path)->dict:
+    """Reads the name of the player, the final time and the number of samples of a record without loading its trajectory when it is binary."""
+    if directory.suffix==".rec":
+        return readRecordHeader(directory)
+    if directory.suffix==".rpl":
+        summary = readReplayHeader(directory)
+        if "samples" not in summary: #Replays saved before the number of samples was stored
+            summary["samples"] = len(readReplayTrajectory(directory, readReplay(directory))["t"])
+        return summary
+    return readJSONRecord(directory)
+
+
+def removeRecordFiles(map: str, space: str, playerName: str, keep: Path = None)->None:
+    """Removes the records of a player, except the one given, and the cached trajectories of its replays."""
+    for directory in (getRecordDir(map, space, playerName, binary=False), getRecordDir(map, space, playerName), getReplayDir(map, space, playerName)):
+        if directory!=keep and directory.exists():
+            directory.unlink()
+    for cacheDir in getReplayCacheDir(getReplayDir(map, space, playerName), "").parent.glob("*.rec"):
+        cacheDir.unlink()
+
+
+class recordStore:
+    """An SQLite index with the metadata of the records, so the leaderboards don't have to read the record files.
+
+    The trajectories stay on the record files and are only read when a rival is loaded.
+    The index of a map and space is reconciled with its folder when the folder has changed since the last time (new, replaced or removed files).
+    Each operation opens its own connection, so the store can be used from any thread.
+
+    Attributes:
+        root (Path): The folder with the maps.
+        directory (Path): The path of the database.
+    """
+    def __init__(self, root: Path = USER_DIR):
+        self.root = Path(root)
+        self.directory = self.root / "records.sqlite"
+        with self._connect() as connection:
+            connection.executescript("""
+                CREATE TABLE IF NOT EXISTS records (
+                    map TEXT NOT NULL, space TEXT NOT NULL, player TEXT NOT NULL,
+                    name TEXT NOT NULL, finalTime REAL NOT NULL, samples INTEGER NOT NULL,
+                    path TEXT NOT NULL, mtime INTEGER NOT NULL,
+                    PRIMARY KEY (map, space, player));
+                CREATE INDEX IF NOT EXISTS recordsByTime ON records (map, space, finalTime);
+                CREATE TABLE IF NOT EXISTS folders (
+                    map TEXT NOT NULL, space TEXT NOT NULL, mtime INTEGER NOT NULL,
+                    PRIMARY KEY (map, space));
+            """)
+
+    @contextmanager
+    def _connect(self):
+        """Opens a connection that commits when the block ends without errors and is always closed."""
+        self.root.mkdir(parents=True, exist_ok=True)
+        connection = sqlite3.connect(self.directory, timeout=10)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def register(self, map: str, space: str, playerName: str, directory: Path, summary: dict, connection: sqlite3.Connection = None)->None:
+        """Adds or replaces the metadata of a record.
+        Args:
+            map (str): The private name of the map.
+            space (str): The private name of the space.
+            playerName (str): The name of the player that identifies the record.
+            directory (Path): The path of the record.
+            summary (dict): The header of the record (see readRecordSummary).
+        """
+        row = (map, space, playerName, str(summary["player"]), float(summary["finalTime"]), int(summary["samples"]), str(directory), directory.stat().st_mtime_ns)
+        if connection is None:
+            with self._connect() as connection:
+                connection.execute("INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?, ?, ?, ?, ?)", row)
+        else:
+            connection.execute("INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?, ?, ?, ?, ?)", row)
+
+    def sync(self, map: str, space: str)->None:
+        """Reconciles the index of a map and space with the record files of its folder."""
+        folder = self.root / map / space
+        if not folder.exists():
+            return
+        folderTime = folder.stat().st_mtime_ns
+        with self._connect() as connection:
+            row = connection.execute("SELECT mtime FROM folders WHERE map=? AND space=?", (map, space)).fetchone()
+            if row and row[0]==folderTime:
+                return
+            indexed = {player: (path, mtime) for player, path, mtime in
+                       connection.execute("SELECT player, path, mtime FROM records WHERE map=? AND space=?", (map, space))}
+            files = getRecordFiles(map, space, self.root)
+            for playerName, directory in files.items():
+                if indexed.get(playerName)!=(str(directory), directory.stat().st_mtime_ns):
+                    try:
+                        self.register(map, space, playerName, directory, readRecordSummary(directory), connection)
+                    except (OSError, ValueError, KeyError):
+                        continue
+            for playerName in indexed.keys()-files.keys():
+                connection.execute("DELETE FROM records WHERE map=? AND space=? AND player=?", (map, space, playerName))
+            connection.execute("INSERT OR REPLACE INTO folders VALUES (?, ?, ?)", (map, space, folderTime))
+
+    def topRecords(self, map: str, space: str, k: int = None)->list[dict]:
+        """Returns the best records of a map and space sorted by time.
+        Args:
+            map (str): The private name of the map.
+            space (str): The private name of the space.
+            k (int): The number of records. All of them if it is None.
+        Returns:
+            A list of dictionaries of the form {"player": p, "name": n, "finalTime": t, "samples": s}.
+        """
+        self.sync(map, space)
+        with self._connect() as connection:
+            rows = connection.execute("SELECT player, name, finalTime, samples FROM records WHERE map=? AND space=? ORDER BY finalTime, player LIMIT ?",
+                                      (map, space, -1 if k is None else k)).fetchall()
+        return [{"player": player, "name": name, "finalTime": finalTime, "samples": samples} for player, name, finalTime, samples in rows]
+
+    def bestTime(self, map: str, space: str, playerName: str)->float:
+        """Returns the time of the record of a player or None if the player doesn't have a record."""
+        self.sync(map, space)
+        with self._connect() as connection:
+            row = connection.execute("SELECT finalTime FROM records WHERE map=? AND space=? AND player=?", (map, space, playerName)).fetchone()
+        return row[0] if row else None
+
+
+_recordStores = {}
+
+def getRecordStore(root: Path = USER_DIR)->recordStore:
+    """Returns the record store of a folder, creating it the first time."""
+    root = Path(root)
+    if root not in _recordStores:
+        _recordStores[root] = recordStore(root)
+    return _recordStores[root]
+
+
+def formatTime(seconds: float)->str:
+    """Returns the time on the format min:sec with only one digit to the mins."""
+    secInMin = 60
+    return str(round(seconds)//secInMin) + ":" + str(round(seconds)%secInMin)
+
+
+def getRecords(space: str, map: str, k: int = None)-> list[dict]:
+    """Gets the records of the players sorted by time.
+    Args:
+        space (str): The private name of the space.
+        map (str): The private name of the map.
+        k (int): The number of records. All of them if it is None.
+    Returns:
+        A list of dictionaries of the form {"time":t, "name":n, "finalTime": f} with the time on the format min:sec with only one digit to the mins.
+    """
+    return [{"time": formatTime(record["finalTime"]), "name": record["player"], "finalTime": record["finalTime"]}
+            for record in getRecordStore().topRecords(map, space, k)]
+
+def saveRecord(map: str, space: str, playerName: str, trajectory, encoding: int = ENCODING_RAW) -> bool:
+    """Saves the record as a file named recordplayer.rec in the respective file (map/space/).
+    If a record already existed, only saves the new time if it is lower than the previous one.
+    Args:
+        trajectory: The samples of the trajectory (a structured array or a dictionary of arrays with the columns t, x, y and angle).
+        encoding (int): The encoding of the columns (ENCODING_RAW or ENCODING_DELTA).
+    """
+    finalTime = float(trajectory["t"][-1])
+    store = getRecordStore()
+    bestTime = store.bestTime(map, space, playerName)
+    if bestTime is not None and finalTime >= bestTime:
+        return False
+    directory = getRecordDir(map, space, playerName)
+    writeBinaryRecord(directory, map, space, playerName, trajectory, finalTime, encoding)
+    removeRecordFiles(map, space, playerName, keep=directory)
+    store.register(map, space, playerName, directory, {"player": playerName, "finalTime": finalTime, "samples": len(trajectory["t"])})
     return True
 
+def saveReplay(map: str, space: str, playerName: str, replay: dict, trajectory = None) -> bool:
+    """Saves a replay (see replay.py) as a file named recordplayer.rpl in the respective file (map/space/).
+    If a record already existed, only saves the new time if it is lower than the previous one.
+    Args:
+        trajectory: The trajectory of the replay re-simulated on the dimensions where it was recorded (see simulateReplay). It is cached, so
+            loading the replay as a rival doesn't simulate it again. By default, the replay is simulated here.
+    """
+    finalTime = replay["finalTime"]
+    store = getRecordStore()
+    bestTime = store.bestTime(map, space, playerName)
+    if bestTime is not None and finalTime >= bestTime:
+        return False
+    if trajectory is None:
+        trajectory = simulateReplay(replay)["trajectory"]
+    replay = dict(replay, samples=len(trajectory["t"]))
+    directory = getReplayDir(map, space, playerName)
+    writeReplay(directory, replay)
+    removeRecordFiles(map, space, playerName, keep=directory)
+    cacheReplayTrajectory(directory, replay, (replay["dimX"], replay["dimY"]), trajectory)
+    store.register(map, space, playerName, directory, {"player": playerName, "finalTime": finalTime, "samples": replay["samples"]})
+    return True
 
-def loadRecord(space:str, map:str, playerName:str):
-    """Loads a record of a previous race into the clone."""
-    directory = USER_DIR / map / space / ("record" + playerName + ".json")
-    with open(directory, 'r', encoding='utf-8') as f:
-        record = json.load(f)
-    return record["trajectory"]
+
+def loadRecord(space:str, map:str, playerName:str, dims: tuple[float] = None, useCache: bool = True)->dict:
+    """Loads a record of a previous race into the clone.
+    Args:
+        dims (tuple[float]): The width and height of the local space where the clone races.
+        useCache (bool): If False, the trajectory of a replay isn't read from or written to the cache.
+    Returns:
+        A dictionary with an array for each column (t, x, y and angle).
+    """
+    record = readRecord(map, space, playerName, dims, useCache)
+    return {column: record[column] for column, _ in RECORD_COLUMNS}
+
+
+def migrateRecords(root: Path = USER_DIR, removeJSON: bool = False)->int:
+    """Converts all the JSON records of a folder tree to the binary format.
+    Args:
+        root (Path): The folder where the records are searched.
+        removeJSON (bool): If True, the JSON records are removed once they have been converted.
+    Returns:
+        The number of converted records.
+    """
+    converted = 0
+    for JSONDir in sorted(Path(root).rglob("record*.json")):
+        binaryDir = JSONDir.with_suffix(".rec")
+        if not binaryDir.exists():
+            record = readJSONRecord(JSONDir)
+            writeBinaryRecord(binaryDir, record["map"], record["space"], record["player"], record, record["finalTime"])
+            converted += 1
+        if removeJSON:
+            JSONDir.unlink()
+    return converted
+
+
+def getTerrainRasterDir(map: str, space: str, key: str)->Path:
+    """Returns the path of a compiled terrain raster.
+    Args:
+        map (str): The private name of the map.
+        space (str): The private name of the space.
+        key (str): A hash that identifies the dimensions and the geometry of the terrain.
+    """
+    return USER_DIR / map / space / ("terrain" + key + ".npy")
+
+def loadTerrainRaster(map: str, space: str, key: str):
+    """Loads a compiled terrain raster. Returns None if it hasn't been cached."""
+    directory = getTerrainRasterDir(map, space, key)
+    if not directory.exists():
+        return None
+    try:
+        return np.load(directory)
+    except (OSError, ValueError):
+        return None
+
+def saveTerrainRaster(map: str, space: str, key: str, raster: np.ndarray)->None:
+    """Caches a compiled terrain raster."""
+    directory = getTerrainRasterDir(map, space, key)
+    directory.parent.mkdir(parents=True, exist_ok=True)
+    np.save(directory, raster)
+
+
+def getTrackImageDir(map: str, space: str, key: str, parity: tuple[int])->Path:
+    """Returns the path of the image of the static geometry of a track on the cells of a certain parity.
+    Args:
+        map (str): The private name of the map.
+        space (str): The private name of the space.
+        key (str): A hash that identifies the dimensions and the geometry of the track.
+        parity (tuple[int]): The parity of the row and the column of the cells.
+    """
+    return USER_DIR / map / space / ("track" + key + str(parity[0]) + str(parity[1]) + ".png")
+
+def loadTrackImages(map: str, space: str, key: str)->dict:
+    """Loads the images of the static geometry of a track, as a dictionary {parity: image}. Returns None if they haven't been cached."""
+    images = {}
+    for parity in ((0, 0), (0, 1), (1, 0), (1, 1)):
+        directory = getTrackImageDir(map, space, key, parity)
+        if not directory.exists():
+            return None
+        try:
+            with Image.open(directory) as image:
+                images[parity] = image.convert("RGB")
+        except OSError:
+            return None
+    return images
+
+def saveTrackImages(map: str, space: str, key: str, images: dict)->None:
+    """Caches the images of the static geometry of a track."""
+    for parity, image in images.items():
+        directory = getTrackImageDir(map, space, key, parity)
+        directory.parent.mkdir(parents=True, exist_ok=True)
+        image.save(directory)
+
+
+def getProfileDir(map: str, space: str, stamp: str)->Path:
+    """Returns the direction of the CSV file with the frame times of a race, creating its folder if needed."""
+    folder = USER_DIR / map / space / "profiles"
+    folder.mkdir(parents=True, exist_ok=True)
+    return folder / ("profile" + stamp + ".csv")
 
 
 def loadImage(iconName: str)->Image.Image:
@@ -81,3 +586,11 @@ def resourcePath(relativePath):
 
     return basePath/relativePath
 
+
+if __name__=="__main__":
+    if len(sys.argv)>1 and sys.argv[1]=="migrate":
+        root = Path(sys.argv[2]) if len(sys.argv)>2 and not sys.argv[2].startswith("--") else USER_DIR
+        nConverted = migrateRecords(root, removeJSON="--remove-json" in sys.argv)
+        print("Converted", nConverted, "records in", root)
+    else:
+        print("Usage: python filesManager.py migrate [folder] [--remove-json]")
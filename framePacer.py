@@ -0,0 +1,142 @@
+import time
+
+
+class qualityGovernor:
+    """Lowers the quality of the game when the frames take longer than their budget and raises it back when they are fast again.
+
+    The quality is a level: 0 is the full quality, and each level above applies one more degradation step.
+
+    Attributes:
+        budget (float): The time available for each frame.
+        steps (list[tuple]): The degradation steps sorted by the order in which they are applied. Each step is a tuple (name, degrade, restore) where degrade and restore are functions without arguments.
+        level (int): The number of degradation steps applied.
+        smoothing (float): The weight of the last frame on the average frame time.
+        averageTime (float): The exponential moving average of the frame time.
+        patience (int): The number of frames the average has to stay over the budget (or well under it) before changing the level.
+        recovery (float): The fraction of the budget under which the average has to stay to restore a step.
+        overFrames (int): The number of consecutive frames over the budget.
+        underFrames (int): The number of consecutive frames under the recovery threshold.
+    """
+    def __init__(self, budget: float, steps: list[tuple] = (), smoothing: float = 0.1, patience: int = 30, recovery: float = 0.6):
+        self.budget = budget
+        self.steps = list(steps)
+        self.level = 0
+        self.smoothing = smoothing
+        self.averageTime = 0
+        self.patience = patience
+        self.recovery = recovery
+        self.overFrames = 0
+        self.underFrames = 0
+
+    def addStep(self, name: str, degrade, restore)->None:
+        """Adds a degradation step after the existing ones.
+        Args:
+            name (str): The name of the step.
+            degrade (function): The function that lowers the quality.
+            restore (function): The function that restores the quality.
+        """
+        self.steps.append((name, degrade, restore))
+
+    def report(self, frameTime: float)->None:
+        """Registers the time a frame took and changes the quality level if needed."""
+        self.averageTime += self.smoothing*(frameTime - self.averageTime)
+        if self.averageTime>self.budget:
+            self.overFrames += 1
+            self.underFrames = 0
+        elif self.averageTime<self.budget*self.recovery:
+            self.underFrames += 1
+            self.overFrames = 0
+        else:
+            self.overFrames = 0
+            self.underFrames = 0
+
+        if self.overFrames>=self.patience and self.level<len(self.steps):
+            self.steps[self.level][1]()
+            self.level += 1
+            self.overFrames = 0
+        elif self.underFrames>=self.patience*4 and self.level>0:
+            self.level -= 1
+            self.steps[self.level][2]()
+            self.underFrames = 0
+
+    def reset(self)->None:
+        """Restores all the degradation steps."""
+        while self.level>0:
+            self.level -= 1
+            self.steps[self.level][2]()
+
+
+class framePacer:
+    """Calls a function at a target frame rate using the tkinter event loop.
+
+    After each frame it waits the remaining time of the frame budget with after(), so the process sleeps instead of spinning.
+
+    Attributes:
+        widget: The tkinter widget whose after() schedules the frames.
+        frame (function): The function called on each frame.
+        targetFPS (float): The desired number of frames per second.
+        budget (float): The time available for each frame.
+        governor (qualityGovernor): The governor that receives the time of each frame.
+        running (bool): If the pacer is scheduling frames.
+        afterId (str): The id of the next scheduled frame.
+        nextTime (float): The time at which the next frame should start.
+        lastStart (float): The time at which the last frame started.
+        lastSleep (float): The time the pacer waited after the last frame.
+        lastEnd (float): The time at which the last frame ended.
+        idleTime (float): The time tkinter spent between the last two frames without waiting (redrawing and handling events).
+    """
+    def __init__(self, widget, frame, targetFPS: float = 60, governor: qualityGovernor = None):
+        self.widget = widget
+        self.frame = frame
+        self.targetFPS = targetFPS
+        self.budget = 1/targetFPS
+        self.governor = governor if governor else qualityGovernor(self.budget)
+        self.running = False
+        self.afterId = None
+        self.nextTime = 0
+        self.lastStart = None
+        self.lastSleep = 0
+        self.lastEnd = None
+        self.idleTime = 0
+
+    def start(self)->None:
+        """Starts calling the frame function."""
+        self.running = True
+        self.nextTime = time.perf_counter()
+        self.lastStart = None
+        self.lastEnd = None
+        self.afterId = self.widget.after_idle(self._tick)
+
+    def stop(self)->None:
+        """Stops calling the frame function."""
+        self.running = False
+        if self.afterId:
+            self.widget.after_cancel(self.afterId)
+            self.afterId = None
+
+    def _tick(self)->None:
+        """Runs a frame and schedules the next one at the start of the next frame budget.
+
+        The time reported to the governor is the time between two frames minus the time waited, so it includes the redraws and the events handled by tkinter.
+        """
+        self.afterId = None
+        if not self.running:
+            return
+        start = time.perf_counter()
+        if self.lastStart is not None:
+            self.governor.report(start - self.lastStart - self.lastSleep)
+        if self.lastEnd is not None:
+            self.idleTime = max(start - self.lastEnd - self.lastSleep, 0)
+        self.lastStart = start
+        self.frame()
+        if not self.running:
+            return
+
+        end = time.perf_counter()
+        self.lastEnd = end
+        self.nextTime += self.budget
+        if self.nextTime<end: #Don't try to catch up the frames that have been lost
+            self.nextTime = end
+        waitMs = max(int((self.nextTime - end)*1000), 1)
+        self.lastSleep = waitMs/1000
+        self.afterId = self.widget.after(waitMs, self._tick)
@@ -1,9 +1,15 @@
-from tkinter import Tk
+import time
+from tkinter import Tk, BooleanVar
 
 from topologicalCanvas import torus, KleinBottleH, projectivePlane, topologicalCanvas
 from topologicalCar import topologicalCar
 from chronometer import finishLine
-from inGameInterface import layout
+from inGameInterface import layout, profilerOverlay
+from simulation import fixedClock
+from framePacer import framePacer, qualityGovernor
+from renderer import renderer, bakingRenderer
+from profiler import frameProfiler
+from filesManager import getProfileDir
 from topologicalTerrain import *
 
 
@@ -25,67 +31,205 @@ def selectMap(TCanvas: topologicalCanvas, map:str)->terrainManager:
     if map==MAP2_PRIVATE_NAME:
         return ZHomology(TCanvas)
 
-def selectSpace(interface:Tk, space:str, SIZE:float, extraSIZE: float, visualHelp:bool =False)->topologicalCanvas:
+def selectSpace(interface:Tk, space:str, SIZE:float, extraSIZE: float, visualHelp:bool =False, renderer: renderer = None)->topologicalCanvas:
     """Returns a topological space.
     Args:
         interface (Tk): The base parent.
         space (str): The name of the space. Options: "torus", "klein", "projective".
         SIZE (float): The size of the space.
         visualHelp (bool): If true it draws visual clues to help the player navigate.
+        renderer (renderer): The backend that draws the space. By default, a tkRenderer on the interface.
     """
     windowSize = SIZE*1
     if space==TORUS_PRIVATE_NAME:
-        Topos = torus(interface, dimX= SIZE, dimY= SIZE, windowH=windowSize-extraSIZE, windowW=windowSize, visualHelp= visualHelp)
+        Topos = torus(interface, dimX= SIZE, dimY= SIZE, windowH=windowSize-extraSIZE, windowW=windowSize, visualHelp= visualHelp, renderer=renderer)
     elif space==KLEIN_PRIVATE_NAME:
-        Topos = KleinBottleH(interface, dimX= SIZE, dimY= SIZE, windowH=windowSize-extraSIZE, windowW=windowSize, visualHelp= visualHelp)
+        Topos = KleinBottleH(interface, dimX= SIZE, dimY= SIZE, windowH=windowSize-extraSIZE, windowW=windowSize, visualHelp= visualHelp, renderer=renderer)
     elif space==RP2_PRIVATE_NAME:
-        Topos = projectivePlane(interface, dimX= SIZE, dimY= SIZE, windowH=windowSize-extraSIZE, windowW=windowSize, visualHelp= visualHelp)
+        Topos = projectivePlane(interface, dimX= SIZE, dimY= SIZE, windowH=windowSize-extraSIZE, windowW=windowSize, visualHelp= visualHelp, renderer=renderer)
     return Topos
 
 
-def configureGame(interface:Tk, space: str, mapName:str, playerName:str, rival:str):
-    """Starts a race on the desired map and space.
+def createRace(interface:Tk, space: str, mapName:str, playerName:str, rivals:list[str], renderer: renderer = None, useCache: bool = True)->tuple:
+    """Builds the space, the track, the car and the finish line of a race.
     Args:
-        interface (Tk): The parent class.
+        interface (Tk): The parent class. It can be None if the renderer doesn't draw on tkinter.
         space (str): The name of the space. Options: "torus", "klein", "projective".
         mapName (str): The name of the map. Options: "pseudo-circle".
         playerName (str): The name of the player.
-        rival (str): The name of the rival.
-    """
+        rivals (list[str]): The names of the players whose records will race as rivals.
+        renderer (renderer): The backend that draws the space. By default, a tkRenderer on the interface.
+        useCache (bool): If False, nothing is read from or written to the caches of the user folder (terrain raster, track images and replay trajectories).
+    Returns:
+        The topological canvas, the car and the finish line.
 
-    
+    If BAKE_STATIC_TRACK is set and the space is drawn on tkinter, the static geometry of the track is drawn as images (see bakeStaticLayer).
+    """
     SIZE = 750
     LAYOUT_SIZE = 80
 
-    Topos = selectSpace(interface, space, SIZE, LAYOUT_SIZE)
+    Topos = selectSpace(interface, space, SIZE, LAYOUT_SIZE, renderer=renderer)
+    bake = BAKE_STATIC_TRACK and Topos.canvas is not None
+    if bake:
+        Topos.renderer = bakingRenderer(Topos.renderer, STATIC_TAG)
     #d = topologicalDecorationFamily(Topos, 50) #Too slow to work
     #d.startCalculations()
     terrain = selectMap(Topos, mapName)
+    if useCache:
+        terrain.compileRaster(mapName, space)
+    else:
+        terrain.compileRaster()
     car = topologicalCar(Topos, x0=20, y0=20, height=20, width=10, ground=terrain, v0x=0, v0y=0)
 
-    timer = finishLine(terrain.terrains[0], car, spaceName=space, mapName=mapName, space=space, playerName=playerName, rivalName=rival)
-    interface.protocol("VM_DELETE_WINDOW", timer.saveRecord)
+    timer = finishLine(terrain.terrains[0], car, spaceName=space, mapName=mapName, space=space, playerName=playerName, rivalNames=rivals, useCache=useCache)
+    if bake:
+        bakeStaticLayer(Topos, mapName, space, useCache)
+    return Topos, car, timer
+
+
+def stepRace(car:topologicalCar, timer:finishLine, clock:fixedClock, frameTime:float, profiler:frameProfiler)->None:
+    """Advances a race the time of a frame and renders it, timing each phase.
+    Args:
+        car (topologicalCar): The car of the player.
+        timer (finishLine): The finish line of the race.
+        clock (fixedClock): The clock that splits the frame time into physics steps.
+        frameTime (float): The time elapsed since the last frame.
+        profiler (frameProfiler): The profiler of the frames.
+    """
+    for _ in range(clock.advance(frameTime)):
+        car.stepPhysics(clock.step)
+        profiler.mark("physics")
+        timer.update(clock.step)
+        profiler.mark("laps")
+    car.render(clock.alpha)
+    profiler.mark("car")
+    timer.render(clock.alpha, clock.step)
+    profiler.mark("ghosts")
+    car.TCanvas.flush()
+    profiler.mark("flush")
+
+
+def raceReport(timer:finishLine, profiler:frameProfiler)->dict:
+    """Returns the results of a race and the percentiles of the times of all its frames (in seconds).
+    Returns:
+        A dictionary of the form {"laps": n, "finished": bool, "time": t, "lapTimes": [t1, ...], "frames": f, "frameTimes": {phase: [p50, p95, p99]}}.
+    """
+    window = profiler.window
+    profiler.window = len(profiler)
+    frameTimes = profiler.percentiles()
+    profiler.window = window
+    return {"laps": max(timer.laps-1, 0), "finished": timer.finishTick is not None, "time": timer.time,
+            "lapTimes": timer.lapTimes, "frames": len(profiler), "frameTimes": frameTimes}
+
+
+def configureGame(interface:Tk, space: str, mapName:str, playerName:str, rivals:list[str], script=None, useCache:bool=True)->dict:
+    """Starts a race on the desired map and space.
+    Args:
+        interface (Tk): The parent class.
+        space (str): The name of the space. Options: "torus", "klein", "projective".
+        mapName (str): The name of the map. Options: "pseudo-circle".
+        playerName (str): The name of the player.
+        rivals (list[str]): The names of the players whose records will race as rivals.
+        script (keyScript): If it is given, the keys are pressed by the script instead of the keyboard (see scenarios.py).
+        useCache (bool): If False, nothing is read from or written to the caches of the user folder (see createRace).
+    Returns:
+        The report of the race (see raceReport), with "windowClosed": True if the window was closed (and destroyed) during the race.
+    """
+    Topos, car, timer = createRace(interface, space, mapName, playerName, rivals, useCache=useCache)
     l = layout(interface)
+    clock = fixedClock(PHYSICS_RATE)
+    finished = BooleanVar(interface, False)
+    hud = {"interval": 1, "frame": 0}
+    profiler = frameProfiler(PROFILER_PHASES, PROFILER_WINDOW)
+    overlay = profilerOverlay(interface)
+    Topos.renderer.bind("<KeyPress-" + PROFILER_KEY + ">", lambda e: overlay.toggle())
+    closed = {"window": False}
+
+    def endRace():
+        """Stops the frames and releases the wait of configureGame."""
+        pacer.stop()
+        finished.set(True)
+
+    def closeWindow():
+        """Ends the race when the window is closed. The window is destroyed once the race has been saved."""
+        closed["window"] = True
+        endRace()
+
+    interface.protocol("WM_DELETE_WINDOW", closeWindow)
+    Topos.renderer.bind("<Destroy>", lambda e: endRace())
+
+    def frame():
+        """Runs one frame of the race. If it fails (e.g. the canvas has been destroyed), the race ends instead of waiting forever."""
+        try:
+            runFrame()
+        except BaseException:
+            endRace()
+            raise
+
+    def runFrame():
+        """Runs one frame of the race, timing each of its phases."""
+        profiler.beginFrame()
+        profiler.add("redraw", pacer.idleTime)
+        if script:
+            script.apply(Topos.keyStates, clock.ticks*clock.step)
+        if Topos.keyStates["escape"]:
+            endRace()
+            return
+        if hud["frame"]%hud["interval"]==0:
+            l.speed.updateNumber(int(np.linalg.norm(car.v)))
+            l.timer.showTime(int(timer.time))
+            l.laps.updateNumber(timer.laps)
+        if overlay.visible and hud["frame"]%PROFILER_OVERLAY_INTERVAL==0:
+            overlay.showText(profiler.summary())
+        hud["frame"] += 1
+        Topos.updateDelta()
+        profiler.mark("hud")
+        stepRace(car, timer, clock, Topos.getDelta(), profiler)
+        profiler.endFrame()
+
+    governor = qualityGovernor(1/TARGET_FPS)
+    margin = Topos.cullingMargin
+    culling = Topos.culling
+    def cullOffscreenCells():
+        Topos.culling = True
+        Topos.cullingMargin = 0
+        Topos.catchUp = False
+    def restoreOffscreenCells():
+        Topos.culling = culling
+        Topos.cullingMargin = margin
+        Topos.catchUp = True
+        Topos.syncVisibleCells()
+    def setRivalRotation(rotate:bool):
+        if timer.ghosts:
+            timer.ghosts.rotate = rotate
+    def setHudInterval(interval:int):
+        hud["interval"] = interval
+    governor.addStep("offscreen cells", cullOffscreenCells, restoreOffscreenCells)
+    governor.addStep("rival rotation", lambda: setRivalRotation(False), lambda: setRivalRotation(True))
+    governor.addStep("HUD refresh rate", lambda: setHudInterval(HUD_DEGRADED_INTERVAL), lambda: setHudInterval(1))
+
+    pacer = framePacer(interface, frame, TARGET_FPS, governor)
+    Topos.updateDelta()
+    pacer.start()
+    interface.wait_variable(finished)
+    governor.reset()
 
-    while(not Topos.keyStates["escape"]):
-        l.speed.updateNumber(int(np.linalg.norm(car.v)))
-        l.timer.showTime(int(timer.time))
-        l.laps.updateNumber(timer.laps)
-        car.TCanvas.updateDelta()
-        car.updateCar()
-        timer.update()
-        
-        print(Topos.delta)
-
-        Topos.canvas.update()
     timer.saveRecord()
+    if PROFILER_EXPORT and len(profiler):
+        profiler.writeCSV(getProfileDir(mapName, space, time.strftime("%Y%m%d-%H%M%S")))
+    overlay.destroy()
     l.destroy()
     Topos.destroy()
-    interface.protocol("VM_DELETE_WINDOW", interface.destroy)
+    interface.protocol("WM_DELETE_WINDOW", interface.destroy)
+    if closed["window"]:
+        interface.destroy()
+    report = raceReport(timer, profiler)
+    report["windowClosed"] = closed["window"]
+    return report
 
 
 
 
 if __name__=="__main__":
     tk = Tk()
-    configureGame(tk, TORUS_PRIVATE_NAME, MAP1_PRIVATE_NAME, "DRS", None)
\ No newline at end of file
+    configureGame(tk, TORUS_PRIVATE_NAME, MAP1_PRIVATE_NAME, "DRS", [])
\ No newline at end of file
@@ -179,6 +179,33 @@ class layout(): # BUG if the speed is small, the number oscilates between 0, 1 a
     def destroy(self) -> None:
         self.banner.destroy()
         self.border.destroy()
+
+
+class profilerOverlay():
+    """A panel placed over the game that shows the times of the phases of the frames.
+    Attributes:
+        label (Label): The tkInter label with the table of times.
+        visible (bool): If the panel is shown.
+    """
+    def __init__(self, window: Tk):
+        self.label = Label(window, bg=BGCOLOR, fg=COLOR_CHARS, font=("Courier", 10), justify="left", anchor="nw")
+        self.visible = False
+
+    def toggle(self)->None:
+        """Shows the panel if it is hidden and hides it otherwise."""
+        self.visible = not self.visible
+        if self.visible:
+            self.label.place(x=10, y=10)
+            self.label.lift()
+        else:
+            self.label.place_forget()
+
+    def showText(self, text: str)->None:
+        """Changes the text of the panel."""
+        self.label.configure(text=text)
+
+    def destroy(self) -> None:
+        self.label.destroy()
     
 
 
@@ -0,0 +1,91 @@
+import time
+
+import numpy as np
+
+
+class frameProfiler:
+    """Measures how long each phase of the frames takes.
+
+    The frame is split with marks: each mark attributes the time elapsed since the previous mark to a phase, so timing a phase costs a
+    single call to the clock. A phase can be marked several times per frame (for example once per physics step) and its times are added.
+    The time of each phase on each frame is kept on a preallocated array whose capacity is doubled when it is full.
+
+    Attributes:
+        phases (list[str]): The names of the phases, in the order of the columns.
+        columns (dict): The column of each phase.
+        times (array): A matrix where the element i,j is the time the phase j took on the frame i. The last column is the time between the start and the end of the frame.
+        size (int): The number of frames recorded.
+        current (array): The times of the phases of the frame being recorded.
+        lastMark (float): The time of the last mark.
+        frameStart (float): The time at which the frame being recorded started.
+        window (int): The number of frames used by the rolling percentiles.
+    """
+    def __init__(self, phases: list[str], window: int = 300, capacity: int = 4096):
+        """Creates an empty profiler.
+        Args:
+            phases (list[str]): The names of the phases.
+            window (int): The number of frames used by the rolling percentiles.
+            capacity (int): The number of frames that can be recorded before the array grows.
+        """
+        self.phases = list(phases)
+        self.columns = {phase: i for i, phase in enumerate(self.phases)}
+        self.times = np.zeros((max(capacity, 1), len(self.phases)+1))
+        self.size = 0
+        self.current = np.zeros(len(self.phases)+1)
+        self.lastMark = None
+        self.frameStart = None
+        self.window = window
+
+    def __len__(self)->int:
+        return self.size
+
+    def beginFrame(self)->None:
+        """Starts the timing of a frame."""
+        self.current[:] = 0
+        self.frameStart = self.lastMark = time.perf_counter()
+
+    def mark(self, phase: str)->None:
+        """Attributes the time elapsed since the previous mark (or the start of the frame) to a phase."""
+        now = time.perf_counter()
+        self.current[self.columns[phase]] += now - self.lastMark
+        self.lastMark = now
+
+    def add(self, phase: str, seconds: float)->None:
+        """Attributes a time measured elsewhere to a phase of the current frame."""
+        self.current[self.columns[phase]] += seconds
+
+    def endFrame(self)->None:
+        """Finishes the timing of the frame and records it."""
+        if self.frameStart is None:
+            return
+        self.current[-1] = time.perf_counter() - self.frameStart
+        if self.size==len(self.times):
+            times = np.zeros((2*len(self.times), self.times.shape[1]))
+            times[:self.size] = self.times
+            self.times = times
+        self.times[self.size] = self.current
+        self.size += 1
+        self.frameStart = None
+
+    def percentiles(self, q: tuple[float] = (50, 95, 99))->dict:
+        """Returns the percentiles of the time of each phase (and of the whole frame, "frame") over the last frames of the window.
+        Args:
+            q (tuple[float]): The percentiles.
+        Returns:
+            A dictionary of the form {phase: [p1, p2, ...]} with the times in seconds.
+        """
+        if self.size==0:
+            return {}
+        values = np.percentile(self.times[max(self.size-self.window, 0):self.size], q, axis=0)
+        return {phase: values[:, i].tolist() for i, phase in enumerate(self.phases + ["frame"])}
+
+    def summary(self, q: tuple[float] = (50, 95, 99))->str:
+        """Returns a table with the percentiles of the last frames in milliseconds."""
+        lines = ["{:<8}".format("ms") + "".join("{:>7}".format("p"+str(p)) for p in q)]
+        for phase, values in self.percentiles(q).items():
+            lines.append("{:<8}".format(phase[:8]) + "".join("{:>7.2f}".format(1000*value) for value in values))
+        return "\n".join(lines)
+
+    def writeCSV(self, directory)->None:
+        """Writes the time of each phase on each frame, in milliseconds, to a CSV file."""
+        np.savetxt(directory, 1000*self.times[:self.size], delimiter=",", fmt="%.4f", header=",".join(self.phases + ["frame"]), comments="")
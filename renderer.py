@@ -0,0 +1,427 @@
+"""
+The backends that draw the topological canvas.
+
+A topological canvas doesn't talk to tkinter directly: it creates its items and queues their changes through a renderer.
+The changes are queued during the frame and sent on flush, which marks the end of the frame.
+
+- tkRenderer draws on a tkinter Canvas, sending the changes of each frame as a single Tcl script.
+- nullRenderer doesn't draw anything, so the game can run without a display (benchmarks, scenarios, tests).
+- recordingRenderer counts (and optionally logs) every call made to another renderer, per frame.
+- bakingRenderer keeps the static items out of another renderer and draws them as images, one per cell.
+"""
+from abc import ABC, abstractmethod
+from tkinter import Canvas, Tk
+from PIL import Image, ImageDraw, ImageTk
+import hashlib
+
+import numpy as np
+
+
+class renderer(ABC):
+    """The interface of the drawing backends. A backend has to implement all of its methods.
+
+    The items are referenced by the id returned when they are created or by any of their tags.
+
+    Attributes:
+        widget: The tkinter widget where the items are drawn. None if the backend doesn't draw.
+    """
+    widget = None
+
+    @abstractmethod
+    def createPolygon(self, coordinates: list[float], fill: str = "black", tags: tuple[str] = ())->int:
+        """Creates a polygon and returns its id.
+        Args:
+            coordinates (list[float]): The flattened list of coordinates [x0, y0, x1, y1, ...].
+            fill (str): The interior color.
+            tags (tuple[str]): The tags of the item.
+        """
+
+    @abstractmethod
+    def createLine(self, coordinates: list[float], fill: str = "black", tags: tuple[str] = ())->int:
+        """Creates a line through some points and returns its id.
+        Args:
+            coordinates (list[float]): The flattened list of coordinates [x0, y0, x1, y1, ...].
+            fill (str): The color of the line.
+            tags (tuple[str]): The tags of the item.
+        """
+
+    @abstractmethod
+    def createImage(self, x: float, y: float, image: Image.Image, tags: tuple[str] = ())->int:
+        """Creates an image with its top left corner at a point and returns its id.
+        Args:
+            x (float): The x coordinate of the corner.
+            y (float): The y coordinate of the corner.
+            image (Image): The image (PIL).
+            tags (tuple[str]): The tags of the item.
+        """
+
+    @abstractmethod
+    def queueCommand(self, *words)->None:
+        """Queues a canvas command, e.g. "itemconfigure", tag, "-state", "hidden"."""
+
+    @abstractmethod
+    def queueCoords(self, item, coordinates: list[float])->None:
+        """Queues the change of the coordinates of an item."""
+
+    @abstractmethod
+    def queueMove(self, item, dx: float, dy: float)->None:
+        """Queues a displacement of an item."""
+
+    @abstractmethod
+    def flush(self)->None:
+        """Sends the queued changes. It is called once per frame."""
+
+    @abstractmethod
+    def view(self)->tuple[float]:
+        """Returns the fractions of the scroll region at the left and the top of the window."""
+
+    @abstractmethod
+    def setView(self, fractionX: float, fractionY: float)->None:
+        """Scrolls the window so the given fractions of the scroll region are at its left and top."""
+
+    @abstractmethod
+    def bind(self, sequence: str, function)->None:
+        """Calls a function when an event happens on the canvas."""
+
+    @abstractmethod
+    def items(self)->list:
+        """Returns the ids of all the items."""
+
+    @abstractmethod
+    def tags(self, item)->tuple[str]:
+        """Returns the tags of an item."""
+
+    @abstractmethod
+    def destroy(self)->None:
+        """Removes everything that has been drawn."""
+
+
+class tkRenderer(renderer):
+    """Draws on a tkinter Canvas.
+
+    The changes are written as Tcl commands and sent together on flush, so a frame costs one call to the interpreter.
+
+    Attributes:
+        widget (Canvas): The canvas where the items are drawn.
+        canvasPath (str): The Tcl name of the canvas.
+        commands (list[str]): The commands queued to be sent on the next flush.
+        photos (dict): The tkinter version of each image drawn, by the id of the PIL image. tkinter needs them to be kept alive.
+    """
+    def __init__(self, tk: Tk, width: float, height: float, scrollregion: tuple[float], bg: str):
+        self.widget = Canvas(tk, width=width, height=height, scrollregion=scrollregion, bg=bg)
+        self.widget.pack(expand=True, fill="both")
+        self.canvasPath = str(self.widget)
+        self.commands = []
+        self.photos = {}
+
+        self.widget.config(takefocus=True)
+        self.widget.focus_set()
+
+    def createPolygon(self, coordinates: list[float], fill: str = "black", tags: tuple[str] = ())->int:
+        return self.widget.create_polygon(coordinates, fill=fill, tags=tags)
+
+    def createLine(self, coordinates: list[float], fill: str = "black", tags: tuple[str] = ())->int:
+        return self.widget.create_line(coordinates, fill=fill, tags=tags)
+
+    def createImage(self, x: float, y: float, image: Image.Image, tags: tuple[str] = ())->int:
+        if id(image) not in self.photos:
+            self.photos[id(image)] = (image, ImageTk.PhotoImage(image, master=self.widget))
+        return self.widget.create_image(x, y, image=self.photos[id(image)][1], anchor="nw", tags=tags)
+
+    def queueCommand(self, *words)->None:
+        self.commands.append(self.canvasPath+" "+" ".join(map(str, words)))
+
+    def queueCoords(self, item, coordinates: list[float])->None:
+        self.commands.append(self.canvasPath+" coords "+str(item)+(" %.3f"*len(coordinates) % tuple(coordinates)))
+
+    def queueMove(self, item, dx: float, dy: float)->None:
+        # Displacements accumulate on tkinter, so they are sent with full precision.
+        self.commands.append("%s move %s %r %r" % (self.canvasPath, item, float(dx), float(dy)))
+
+    def flush(self)->None:
+        if self.commands:
+            script = "\n".join(self.commands)
+            self.commands = []
+            self.widget.tk.eval(script)
+
+    def view(self)->tuple[float]:
+        return self.widget.xview()[0], self.widget.yview()[0]
+
+    def setView(self, fractionX: float, fractionY: float)->None:
+        self.widget.xview_moveto(fractionX)
+        self.widget.yview_moveto(fractionY)
+
+    def bind(self, sequence: str, function)->None:
+        self.widget.bind(sequence, function)
+
+    def items(self)->list:
+        return self.widget.find_all()
+
+    def tags(self, item)->tuple[str]:
+        return self.widget.gettags(item)
+
+    def destroy(self)->None:
+        self.commands = []
+        self.photos = {}
+        self.widget.destroy()
+
+
+class nullRenderer(renderer):
+    """A backend that doesn't draw anything.
+
+    It only keeps the tags of the items and the position of the view, so the canvas behaves the same way without a display.
+
+    Attributes:
+        itemTags (dict): The tags of each item.
+        fractions (tuple[float]): The fractions of the scroll region at the left and the top of the window.
+    """
+    def __init__(self):
+        self.itemTags = {}
+        self.fractions = (0, 0)
+
+    def _create(self, tags: tuple[str])->int:
+        item = len(self.itemTags)+1
+        self.itemTags[item] = tuple(tags)
+        return item
+
+    def createPolygon(self, coordinates: list[float], fill: str = "black", tags: tuple[str] = ())->int:
+        return self._create(tags)
+
+    def createLine(self, coordinates: list[float], fill: str = "black", tags: tuple[str] = ())->int:
+        return self._create(tags)
+
+    def createImage(self, x: float, y: float, image: Image.Image, tags: tuple[str] = ())->int:
+        return self._create(tags)
+
+    def queueCommand(self, *words)->None:
+        pass
+
+    def queueCoords(self, item, coordinates: list[float])->None:
+        pass
+
+    def queueMove(self, item, dx: float, dy: float)->None:
+        pass
+
+    def flush(self)->None:
+        pass
+
+    def view(self)->tuple[float]:
+        return self.fractions
+
+    def setView(self, fractionX: float, fractionY: float)->None:
+        self.fractions = (min(max(fractionX, 0), 1), min(max(fractionY, 0), 1))
+
+    def bind(self, sequence: str, function)->None:
+        pass
+
+    def items(self)->list:
+        return list(self.itemTags)
+
+    def tags(self, item)->tuple[str]:
+        return self.itemTags[item]
+
+    def destroy(self)->None:
+        self.itemTags = {}
+
+
+class recordingRenderer(renderer):
+    """Counts every call made to another renderer, frame by frame.
+
+    A frame ends on each flush. The calls of the frame being recorded are counted by operation (e.g. {"queueCoords": 40, "queueMove": 4}).
+
+    Attributes:
+        backend (renderer): The renderer that receives the calls.
+        counts (dict): The number of calls of each operation on the current frame.
+        frames (list[dict]): The counts of the finished frames.
+        created (int): The number of items created.
+        log (list[tuple]): If it isn't None, every call as a tuple (frame, operation, arguments).
+    """
+    def __init__(self, backend: renderer = None, keepLog: bool = False):
+        """Creates the recorder.
+        Args:
+            backend (renderer): The renderer that receives the calls. By default, a nullRenderer.
+            keepLog (bool): If every call (with its arguments) is kept, not only counted.
+        """
+        self.backend = backend if backend is not None else nullRenderer()
+        self.widget = self.backend.widget
+        self.counts = {}
+        self.frames = []
+        self.created = 0
+        self.log = [] if keepLog else None
+
+    def _record(self, operation: str, arguments: tuple)->None:
+        self.counts[operation] = self.counts.get(operation, 0)+1
+        if self.log is not None:
+            self.log.append((len(self.frames), operation, arguments))
+
+    def createPolygon(self, coordinates: list[float], fill: str = "black", tags: tuple[str] = ())->int:
+        self._record("createPolygon", (coordinates, fill, tags))
+        self.created += 1
+        return self.backend.createPolygon(coordinates, fill, tags)
+
+    def createLine(self, coordinates: list[float], fill: str = "black", tags: tuple[str] = ())->int:
+        self._record("createLine", (coordinates, fill, tags))
+        self.created += 1
+        return self.backend.createLine(coordinates, fill, tags)
+
+    def createImage(self, x: float, y: float, image: Image.Image, tags: tuple[str] = ())->int:
+        self._record("createImage", (x, y, image, tags))
+        self.created += 1
+        return self.backend.createImage(x, y, image, tags)
+
+    def queueCommand(self, *words)->None:
+        self._record(words[0], words[1:])
+        self.backend.queueCommand(*words)
+
+    def queueCoords(self, item, coordinates: list[float])->None:
+        self._record("coords", (item, coordinates))
+        self.backend.queueCoords(item, coordinates)
+
+    def queueMove(self, item, dx: float, dy: float)->None:
+        self._record("move", (item, dx, dy))
+        self.backend.queueMove(item, dx, dy)
+
+    def flush(self)->None:
+        self.frames.append(self.counts)
+        self.counts = {}
+        self.backend.flush()
+
+    def view(self)->tuple[float]:
+        return self.backend.view()
+
+    def setView(self, fractionX: float, fractionY: float)->None:
+        self.backend.setView(fractionX, fractionY)
+
+    def bind(self, sequence: str, function)->None:
+        self.backend.bind(sequence, function)
+
+    def items(self)->list:
+        return self.backend.items()
+
+    def tags(self, item)->tuple[str]:
+        return self.backend.tags(item)
+
+    def destroy(self)->None:
+        self.backend.destroy()
+
+    def callsPerFrame(self)->list[int]:
+        """Returns the number of calls of each finished frame."""
+        return [sum(counts.values()) for counts in self.frames]
+
+    def summary(self)->dict:
+        """Returns a dictionary of the form {"items": n, "frames": f, "maxCalls": m, "meanCalls": a, "operations": {operation: total}}."""
+        calls = self.callsPerFrame()
+        operations = {}
+        for counts in self.frames:
+            for operation, count in counts.items():
+                operations[operation] = operations.get(operation, 0)+count
+        return {"items": self.created, "frames": len(calls), "maxCalls": max(calls, default=0),
+                "meanCalls": sum(calls)/len(calls) if calls else 0, "operations": operations}
+
+
+class bakingRenderer(renderer):
+    """Keeps the static items out of another renderer, so they can be drawn as images.
+
+    The items created with the static tag aren't sent to the backend: their kind, coordinates and color are kept to be rasterized, and
+    they get an id that doesn't match any item of the backend (so the commands sent to them do nothing). Once the static geometry is
+    complete, placeImages draws it as one image per cell, below all the other items.
+
+    Attributes:
+        backend (renderer): The renderer that receives the calls of the items that aren't static.
+        tag (str): The tag of the static items.
+        staticItems (list[tuple]): The static items, in the order they were created, as tuples (kind, coordinates, fill).
+    """
+    def __init__(self, backend: renderer, tag: str):
+        self.backend = backend
+        self.widget = backend.widget
+        self.tag = tag
+        self.staticItems = []
+
+    def _keep(self, kind: str, coordinates: list[float], fill: str)->str:
+        self.staticItems.append((kind, coordinates, fill))
+        return "baked" + str(len(self.staticItems))
+
+    def createPolygon(self, coordinates: list[float], fill: str = "black", tags: tuple[str] = ())->int:
+        if self.tag in tags:
+            return self._keep("polygon", coordinates, fill)
+        return self.backend.createPolygon(coordinates, fill, tags)
+
+    def createLine(self, coordinates: list[float], fill: str = "black", tags: tuple[str] = ())->int:
+        if self.tag in tags:
+            return self._keep("line", coordinates, fill)
+        return self.backend.createLine(coordinates, fill, tags)
+
+    def createImage(self, x: float, y: float, image: Image.Image, tags: tuple[str] = ())->int:
+        return self.backend.createImage(x, y, image, tags)
+
+    def queueCommand(self, *words)->None:
+        self.backend.queueCommand(*words)
+
+    def queueCoords(self, item, coordinates: list[float])->None:
+        self.backend.queueCoords(item, coordinates)
+
+    def queueMove(self, item, dx: float, dy: float)->None:
+        self.backend.queueMove(item, dx, dy)
+
+    def flush(self)->None:
+        self.backend.flush()
+
+    def view(self)->tuple[float]:
+        return self.backend.view()
+
+    def setView(self, fractionX: float, fractionY: float)->None:
+        self.backend.setView(fractionX, fractionY)
+
+    def bind(self, sequence: str, function)->None:
+        self.backend.bind(sequence, function)
+
+    def items(self)->list:
+        return self.backend.items()
+
+    def tags(self, item)->tuple[str]:
+        return self.backend.tags(item)
+
+    def destroy(self)->None:
+        self.staticItems = []
+        self.backend.destroy()
+
+    def staticKey(self, dimX: float, dimY: float)->str:
+        """Returns a hash that identifies the static geometry, to cache its images."""
+        digest = hashlib.sha1(np.array([dimX, dimY], np.float64).tobytes())
+        for kind, coordinates, fill in self.staticItems:
+            digest.update((kind + fill).encode())
+            digest.update(np.asarray(coordinates, np.float32).tobytes())
+        return digest.hexdigest()[:16]
+
+    def bakeImages(self, dimX: int, dimY: int, background: str)->dict:
+        """Rasterizes the static items into the image of each orientation of the cells.
+
+        The cells whose row and column have the same parity look the same, so a block of 4x4 cells is drawn and the 4 cells of its center,
+        which have all their neighbours, are cut out. Each copy is drawn where the canvas would draw it, so the pieces of the geometry that
+        overflow a cell are drawn on its neighbours.
+
+        Returns:
+            A dictionary of the form {(r%2, c%2): image}.
+        """
+        block = Image.new("RGB", (4*dimX, 4*dimY), background)
+        draw = ImageDraw.Draw(block)
+        origin = np.array([dimX, dimY], float)
+        for kind, coordinates, fill in self.staticItems:
+            points = [tuple(point) for point in (np.asarray(coordinates, float).reshape(-1, 2) - origin).tolist()]
+            if kind=="polygon":
+                draw.polygon(points, fill=fill)
+            else:
+                draw.line(points, fill=fill, width=1)
+        images = {}
+        for r in (2, 3):
+            for c in (2, 3):
+                left, top = (c-1)*dimX, (r-1)*dimY
+                images[(r%2, c%2)] = block.crop((left, top, left+dimX, top+dimY))
+        return images
+
+    def placeImages(self, images: dict, dimX: int, dimY: int)->None:
+        """Draws the image of its orientation on each cell, below all the other items."""
+        for r in range(6):
+            for c in range(6):
+                self.backend.createImage(c*dimX, r*dimY, images[(r%2, c%2)], (self.tag,))
+        self.backend.queueCommand("lower", self.tag)
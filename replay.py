@@ -0,0 +1,115 @@
+"""
+Deterministic replays of the races.
+
+A replay stores the keys pressed on each physics step (run-length encoded) and the initial state of the car, instead of its trajectory.
+The trajectory is reproduced by re-simulating the race with the simulation core, so it can also be verified.
+
+A replay is a dictionary of the form {"map": m, "space": s, "player": p, "dimX": x, "dimY": y, "rate": r, "start": {"x", "y", "vx", "vy", "angle"},
+"finishTick": n, "finalTime": t, "codes": array, "counts": array}, where the key codes[i] (see INPUT_BITS) was pressed during counts[i] steps.
+"""
+import numpy as np
+
+from simulation import raceSimulation, carInput, carState
+from trajectory import trajectoryResampler
+from constants import *
+
+
+class inputRecorder:
+    """Records the encoded keys of each physics step with run-length encoding.
+    Attributes:
+        codes (list[int]): The encoded keys of each run.
+        counts (list[int]): The number of steps of each run.
+        ticks (int): The number of steps recorded.
+    """
+    def __init__(self):
+        self.codes = []
+        self.counts = []
+        self.ticks = 0
+
+    def append(self, code: int)->None:
+        """Records the keys of a physics step."""
+        if self.codes and self.codes[-1]==code:
+            self.counts[-1] += 1
+        else:
+            self.codes.append(code)
+            self.counts.append(1)
+        self.ticks += 1
+
+    def arrays(self)->tuple[np.ndarray]:
+        """Returns the codes and the counts of the runs as arrays."""
+        return np.array(self.codes, np.uint8), np.array(self.counts, np.uint32)
+
+
+def createReplay(map: str, space: str, playerName: str, dims: tuple[float], start: carState, inputs: inputRecorder, finishTick: int, finalTime: float, rate: float = PHYSICS_RATE)->dict:
+    """Creates a replay.
+    Args:
+        map (str): The private name of the map.
+        space (str): The private name of the space.
+        playerName (str): The name of the player.
+        dims (tuple[float]): The width and the height of the local space where the race was simulated.
+        start (carState): The state of the car before the first step.
+        inputs (inputRecorder): The keys pressed on each step.
+        finishTick (int): The number of steps until the car finished the race.
+        finalTime (float): The time of the race.
+        rate (float): The number of physics steps per second.
+    """
+    codes, counts = inputs.arrays()
+    return {"map": map, "space": space, "player": playerName, "dimX": float(dims[0]), "dimY": float(dims[1]), "rate": float(rate),
+            "start": {"x": float(start.position[0][0]), "y": float(start.position[0][1]), "vx": float(start.velocity[0][0]),
+                      "vy": float(start.velocity[0][1]), "angle": float(start.angle[0])},
+            "finishTick": int(finishTick), "finalTime": float(finalTime), "codes": codes, "counts": counts}
+
+
+def simulateReplay(replay: dict, dims: tuple[float] = None, sampleRate: float = RECORD_RATE)->dict:
+    """Re-simulates a replay on the space where it was recorded.
+    Args:
+        replay (dict): The replay.
+        dims (tuple[float]): The width and the height of the local space where the trajectory will be shown. The positions are scaled to it.
+        sampleRate (float): The number of samples per second of the trajectory.
+    Returns:
+        A dictionary of the form {"trajectory": array, "finishTick": n, "finalTime": t}, where the trajectory is a structured array
+        with the columns of TRAJECTORY_DTYPE that starts when the car crosses the finish line. If the car doesn't finish, n and t are None.
+    """
+    simulation = raceSimulation(replay["space"], replay["map"], 1, replay["dimX"], dimY=replay["dimY"])
+    start = replay["start"]
+    state = simulation.state
+    state.position[0] = (start["x"], start["y"])
+    state.velocity[0] = (start["vx"], start["vy"])
+    state.angle[0] = start["angle"]
+    state.speed = np.linalg.norm(state.velocity, axis=1)
+
+    dt = 1/replay["rate"]
+    recorder = trajectoryResampler(simulation.space, sampleRate)
+    finishTick = None
+    tick = 0
+    for code, count in zip(replay["codes"].tolist(), replay["counts"].tolist()):
+        inputs = carInput.fromCodes(code)
+        for _ in range(count):
+            started, finished = simulation.step(inputs, dt)
+            tick += 1
+            if simulation.laps.counting[0] or started[0] or finished[0]:
+                recorder.append(state.position[0][0], state.position[0][1], state.angle[0], simulation.laps.time[0])
+            if finished[0]:
+                finishTick = tick
+                recorder.finish()
+                break
+        if finishTick:
+            break
+
+    trajectory = recorder.buffer.data.copy()
+    if dims is not None:
+        trajectory["x"] *= dims[0]/replay["dimX"]
+        trajectory["y"] *= dims[1]/replay["dimY"]
+    finalTime = float(simulation.laps.time[0]) if finishTick else None
+    return {"trajectory": trajectory, "finishTick": finishTick, "finalTime": finalTime}
+
+
+def verifyReplay(replay: dict, result: dict = None)->bool:
+    """Returns True if re-simulating the replay finishes the race on the same step and with the same time that it claims.
+    Args:
+        replay (dict): The replay.
+        result (dict): The re-simulation of the replay on its own dimensions (see simulateReplay), if it has already been run.
+    """
+    if result is None:
+        result = simulateReplay(replay)
+    return result["finishTick"]==replay["finishTick"] and result["finalTime"]==replay["finalTime"]
@@ -0,0 +1,302 @@
+"""
+Scripted races to measure the performance of the game end to end.
+
+A scenario is a key script: a timed list of presses and releases of the keys of the keyStateMachine (w, a, s, d and escape).
+The script is applied at the start of each frame, at the time simulated by the physics, so a headless run is reproducible.
+
+The stock scenarios are recorded by an autopilot that drives the lap of the track on the space until it finishes the race (see driveScript).
+The exit status is 1 if a stock scenario doesn't finish its race when it is replayed.
+
+Usage: python scenarios.py [--map pseudo] [--space torus] [--scenario name|all] [--script file.json] [--rivals name,...] [--display] [--output report.json] [--no-cache]
+
+Without --display, the race is drawn with the null renderer and the frames are simulated back to back at TARGET_FPS.
+With --display, the race runs on a real window (use xvfb-run on a headless machine) and the script replaces the keyboard.
+The report (JSON) has the percentiles of the time of each phase of the frames, the lap times and the peak memory of the process.
+With --no-cache, nothing is read from or written to the caches of the user folder, so the runs don't depend on previous ones.
+"""
+from contextlib import redirect_stdout
+from pathlib import Path
+import argparse
+import json
+import sys
+
+import numpy as np
+
+from stateMachine import keyStateMachine
+from constants import *
+
+
+class keyScript:
+    """A timed sequence of key presses and releases.
+
+    Attributes:
+        name (str): The name of the scenario.
+        duration (float): The time at which the script ends. The escape key is pressed then.
+        events (list[tuple]): The events sorted by time. Each event is a tuple (time, key, pressed).
+        cursor (int): The index of the next event.
+    """
+    def __init__(self, name: str, duration: float, events: list[tuple] = ()):
+        self.name = name
+        self.duration = duration
+        self.events = sorted(events, key=lambda event: event[0])
+        self.cursor = 0
+
+    def hold(self, key: str, start: float, end: float = None):
+        """Adds a press of a key at a certain time and its release at another (by default, the key is held until the end)."""
+        self.events.append((start, key, True))
+        if end is not None:
+            self.events.append((end, key, False))
+        self.events.sort(key=lambda event: event[0])
+        return self
+
+    def alternate(self, key: str, period: float, start: float = 0, end: float = None, offset: float = 0):
+        """Holds a key during every other period of time, starting after the offset."""
+        end = self.duration if end is None else end
+        time = start + offset
+        while time<end:
+            self.hold(key, time, min(time+period, end))
+            time += 2*period
+        return self
+
+    def reset(self)->None:
+        """Rewinds the script to its start."""
+        self.cursor = 0
+
+    def apply(self, keyStates: keyStateMachine, time: float)->None:
+        """Sets the keys as they are at a certain time. The time can't go backwards."""
+        while self.cursor<len(self.events) and self.events[self.cursor][0]<=time:
+            _, key, pressed = self.events[self.cursor]
+            keyStates[key] = pressed
+            self.cursor += 1
+        if time>=self.duration:
+            keyStates["escape"] = True
+
+    def toDict(self)->dict:
+        """Returns the script as a dictionary of the form {"name": n, "duration": d, "events": [[t, key, pressed], ...]}."""
+        return {"name": self.name, "duration": self.duration, "events": [list(event) for event in self.events]}
+
+    @classmethod
+    def fromDict(cls, script: dict):
+        """Inverts toDict."""
+        return cls(script["name"], script["duration"], [tuple(event) for event in script["events"]])
+
+
+class autopilot:
+    """A driver that follows the center line of a lap, pressing the keys a player would.
+
+    It keeps track of the nearest point of the route ahead of the car and aims at the first point farther than a radius from the car.
+    It turns when the heading is off by more than the deadband, and lifts the throttle when it is off by more than the lift angle (unless it crawls, since a car that doesn't move can't turn).
+    If it weaves, the heading it aims at swings from side to side every period, so the car slides from one side of the road to the other.
+
+    Attributes:
+        space (quotientSpace): The space where the car races.
+        route (array): The local points of the lap, in the order they are followed (see trackRoute).
+        radius (float): The distance to the point of the route aimed at.
+        deadband (float): The heading error (in radians) below which the car goes straight.
+        lift (float): The heading error (in radians) above which the car doesn't accelerate.
+        crawl (float): The speed below which the car always accelerates.
+        weave (float): The angle (in radians) that the heading swings to each side.
+        period (float): The time the heading spends on each side.
+        progress (int): The index of the nearest point of the route reached.
+    """
+    LOOKAHEAD = 12 # Points of the route where the nearest one is searched
+
+    def __init__(self, space, route: np.ndarray, radius: float = 60, deadband: float = 0.05, lift: float = 0.6, crawl: float = 30, weave: float = 0, period: float = 1):
+        self.space = space
+        self.route = route
+        self.radius = radius
+        self.deadband = deadband
+        self.lift = lift
+        self.crawl = crawl
+        self.weave = weave
+        self.period = period
+        self.progress = 0
+
+    def keys(self, position: np.ndarray, angle: float, speed: float, time: float)->dict:
+        """Returns the state of the keys w, a and d for a car with a certain position, angle and speed at a certain time."""
+        ahead = (self.progress + np.arange(self.LOOKAHEAD))%len(self.route)
+        displacements = self.space.minimalImage(self.route[ahead], position[None])[:, 0]
+        distances = np.hypot(displacements[:, 0], displacements[:, 1])
+        nearest = distances.argmin()
+        self.progress = ahead[nearest]
+        far = np.nonzero(distances[nearest:]>=self.radius)[0]
+        displacement = displacements[nearest + far[0]] if len(far) else displacements[-1]
+        heading = np.arctan2(displacement[1], displacement[0])
+        if self.weave:
+            heading += self.weave if int(time/self.period)%2 else -self.weave
+        error = (heading-angle+np.pi)%(2*np.pi)-np.pi
+        return {"w": bool(abs(error)<self.lift or speed<self.crawl), "a": bool(error<-self.deadband), "d": bool(error>self.deadband)}
+
+
+def driveScript(name: str, space: str, mapName: str, reverse: bool = False, weave: float = 0, period: float = 1, timeLimit: float = 240, useCache: bool = True)->keyScript:
+    """Records the keys pressed by an autopilot during a race, so the race can be replayed as a key script.
+
+    The frames are simulated as in runHeadless, so the script reproduces the same race. It ends a second after the race is finished, or at the time limit.
+
+    Args:
+        name (str): The name of the scenario.
+        space (str): The private name of the space.
+        mapName (str): The private name of the map.
+        reverse (bool): If the lap is run backwards.
+        weave (float): The angle that the heading of the autopilot swings to each side. A weaving autopilot has no deadband.
+        period (float): The time the heading spends on each side.
+        timeLimit (float): The time at which the recording stops if the race isn't finished.
+        useCache (bool): If the caches of the user folder are used (see createRace).
+    """
+    from gameManager import createRace
+    from simulation import fixedClock
+    from renderer import nullRenderer
+    from tracks import selectTrack, trackRoute
+
+    Topos, car, timer = createRace(None, space, mapName, "", [], nullRenderer(), useCache)
+    route = trackRoute(Topos.space, selectTrack(mapName, Topos.dimX, Topos.dimY))
+    driver = autopilot(Topos.space, route[::-1] if reverse else route, deadband=0 if weave else 0.05, weave=weave, period=period)
+    clock = fixedClock(PHYSICS_RATE)
+    script = keyScript(name, timeLimit)
+    pressed = {}
+    time = 0
+    while time<timeLimit and timer.finishTick is None:
+        for key, state in driver.keys(car.getPosition(), car.angle, car.speed, time).items():
+            if pressed.get(key, False)!=state:
+                script.events.append((time, key, state))
+                pressed[key] = state
+        script.apply(Topos.keyStates, time)
+        for _ in range(clock.advance(1/TARGET_FPS)):
+            car.stepPhysics(clock.step)
+            timer.update(clock.step)
+        time = clock.ticks*clock.step
+    Topos.destroy()
+    if timer.finishTick is not None:
+        script.duration = time + 1
+    return script
+
+
+# The options of the autopilot that records each stock scenario (see driveScript).
+STOCK_SCENARIOS = {
+    "full-throttle": {},
+    "drift-heavy": {"weave": 0.3, "period": 0.3},
+    "reverse-lap": {"reverse": True},
+}
+
+def stockScenarios(mapName: str, spaceName: str, names: list[str] = None, useCache: bool = True)->dict:
+    """Returns the stock scenarios of a track, each recorded from an autopilot that finishes the race.
+
+    full-throttle follows the lap, drift-heavy weaves along it and reverse-lap turns around and runs it backwards.
+
+    Args:
+        mapName (str): The private name of the map.
+        spaceName (str): The private name of the space.
+        names (list[str]): The scenarios recorded. By default, all of them.
+        useCache (bool): If the caches of the user folder are used while recording.
+    Returns:
+        A dictionary of the form {name: keyScript}.
+    """
+    names = STOCK_SCENARIOS if names is None else names
+    return {name: driveScript(name, spaceName, mapName, **STOCK_SCENARIOS[name], useCache=useCache) for name in names}
+
+
+def peakMemory()->float:
+    """Returns the peak resident memory of the process in MB, or None if it can't be measured on this platform."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak/2**20 if sys.platform=="darwin" else peak/2**10
+
+
+def runHeadless(script: keyScript, space: str, mapName: str, rivals: list[str] = (), frameRate: float = TARGET_FPS, stopOnFinish: bool = True, useCache: bool = True)->dict:
+    """Runs a scenario with the null renderer, simulating the frames back to back.
+    Args:
+        script (keyScript): The keys pressed.
+        space (str): The private name of the space.
+        mapName (str): The private name of the map.
+        rivals (list[str]): The names of the players whose records race as rivals.
+        frameRate (float): The frames per second simulated.
+        stopOnFinish (bool): If the scenario ends when the car finishes the race.
+        useCache (bool): If the caches of the user folder are used (see createRace).
+    Returns:
+        The report of the race (see raceReport).
+    """
+    from gameManager import createRace, stepRace, raceReport
+    from simulation import fixedClock
+    from profiler import frameProfiler
+    from renderer import nullRenderer
+
+    Topos, car, timer = createRace(None, space, mapName, "", list(rivals), nullRenderer(), useCache)
+    clock = fixedClock(PHYSICS_RATE)
+    profiler = frameProfiler(PROFILER_PHASES, PROFILER_WINDOW)
+    while True:
+        profiler.beginFrame()
+        script.apply(Topos.keyStates, clock.ticks*clock.step)
+        if Topos.keyStates["escape"] or (stopOnFinish and timer.finishTick is not None):
+            break
+        profiler.mark("hud")
+        stepRace(car, timer, clock, 1/frameRate, profiler)
+        profiler.endFrame()
+    Topos.destroy()
+    return raceReport(timer, profiler)
+
+
+def runDisplay(script: keyScript, space: str, mapName: str, rivals: list[str] = (), useCache: bool = True)->dict:
+    """Runs a scenario on a real window, with the script in place of the keyboard. It takes the duration of the script."""
+    from tkinter import Tk, TclError
+    from gameManager import configureGame
+
+    tk = Tk()
+    try:
+        return configureGame(tk, space, mapName, "", list(rivals), script=script, useCache=useCache)
+    finally:
+        try:
+            tk.destroy()
+        except TclError: # The window was closed during the race
+            pass
+
+
+def runScenario(script: keyScript, space: str, mapName: str, rivals: list[str] = (), display: bool = False, useCache: bool = True)->dict:
+    """Runs a scenario and returns its report, with the scenario and the peak memory added."""
+    script.reset()
+    if display:
+        report = runDisplay(script, space, mapName, rivals, useCache)
+    else:
+        report = runHeadless(script, space, mapName, rivals, useCache=useCache)
+    report.update({"scenario": script.name, "space": space, "map": mapName, "rivals": list(rivals), "display": display, "peakMemoryMB": peakMemory()})
+    return report
+
+
+def main(argv: list[str] = None)->int:
+    parser = argparse.ArgumentParser(description="Runs scripted races and reports their performance as JSON.")
+    parser.add_argument("--map", default=MAP1_PRIVATE_NAME, choices=MAPS)
+    parser.add_argument("--space", default=TORUS_PRIVATE_NAME, choices=SPACES)
+    parser.add_argument("--scenario", default="all", choices=list(STOCK_SCENARIOS)+["all"], help="stock scenario, recorded on the map and space by an autopilot")
+    parser.add_argument("--script", type=Path, help="JSON file with a key script, instead of the stock scenarios")
+    parser.add_argument("--rivals", default="", help="comma-separated names of the rivals")
+    parser.add_argument("--display", action="store_true", help="run on a real window instead of the null renderer")
+    parser.add_argument("--output", type=Path, help="file where the report is written (by default, the standard output)")
+    parser.add_argument("--no-cache", dest="useCache", action="store_false", help="don't read or write the caches of the user folder (terrain, track images and replays)")
+    args = parser.parse_args(argv)
+
+    rivals = [name for name in args.rivals.split(",") if name]
+    with redirect_stdout(sys.stderr): # The messages of the race don't mix with the report
+        if args.script:
+            with open(args.script, "r") as f:
+                scripts = [keyScript.fromDict(json.load(f))]
+        else:
+            names = None if args.scenario=="all" else [args.scenario]
+            scripts = list(stockScenarios(args.map, args.space, names, args.useCache).values())
+        reports = [runScenario(script, args.space, args.map, rivals, args.display, args.useCache) for script in scripts]
+    text = json.dumps(reports, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+    unfinished = [report["scenario"] for report in reports if not report["finished"]]
+    if unfinished and not args.script:
+        print("Stock scenarios that didn't finish the race: " + ", ".join(unfinished), file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__=="__main__":
+    sys.exit(main())
@@ -0,0 +1,544 @@
+"""
+The simulation core of the game: terrain lookup, car physics and lap counting.
+
+It only depends on NumPy, so it runs without a display. The tkinter classes are views that sync from it.
+"""
+import numpy as np
+import hashlib
+
+from Tmath import quotientSpace
+from tracks import selectTrack, roadPolygon, finishLineGeometry
+from constants import *
+
+
+class terrainIndex:
+    """A uniform grid over the local space that stores, for each cell, the polygon edges that a point of the cell has to test.
+
+    The polygons check if a point is inside by counting the edges that a vertical ray cast from the point (towards greater y) crosses.
+    Therefore, a cell only stores the edges that overlap its column and that reach below its top.
+
+    Attributes:
+        dimX (float): Width of the local space.
+        dimY (float): Height of the local space.
+        resolution (int): The number of cells on each side of the grid.
+        nPolygons (int): The number of indexed polygons.
+        prevPoints (array): The first point of each edge.
+        nextPoints (array): The second point of each edge.
+        owners (array): The index of the polygon each edge belongs to.
+        cells (list[list[array]]): A matrix where the element i,j are the indices of the edges that the points of the cell i,j have to test.
+    """
+    def __init__(self, dimX:float, dimY:float, polygons:list[np.ndarray], resolution:int=32):
+        """Builds the index.
+        Args:
+            dimX (float): Width of the local space.
+            dimY (float): Height of the local space.
+            polygons (list[array]): The local vertices of each polygon, sorted by priority.
+            resolution (int): The number of cells on each side of the grid.
+        """
+        self.dimX = dimX
+        self.dimY = dimY
+        self.resolution = resolution
+        self.nPolygons = len(polygons)
+
+        if polygons:
+            vertices = [np.asarray(polygon, float).reshape(-1, 2) for polygon in polygons]
+            self.prevPoints = np.concatenate([np.roll(polygon, 1, axis=0) for polygon in vertices])
+            self.nextPoints = np.concatenate(vertices)
+            self.owners = np.concatenate([np.full(len(polygon), i) for i, polygon in enumerate(vertices)])
+        else:
+            self.prevPoints = np.zeros((0, 2))
+            self.nextPoints = np.zeros((0, 2))
+            self.owners = np.zeros(0, int)
+
+        minX = np.minimum(self.prevPoints[:, 0], self.nextPoints[:, 0])
+        maxX = np.maximum(self.prevPoints[:, 0], self.nextPoints[:, 0])
+        maxY = np.maximum(self.prevPoints[:, 1], self.nextPoints[:, 1])
+
+        cellW = dimX/resolution
+        cellH = dimY/resolution
+        self.cells = []
+        for row in range(resolution):
+            cellsRow = []
+            reachesRow = maxY > row*cellH
+            for col in range(resolution):
+                overlapsCol = (maxX > col*cellW) & (minX < (col+1)*cellW)
+                cellsRow.append(np.flatnonzero(reachesRow & overlapsCol))
+            self.cells.append(cellsRow)
+
+    def query(self, localPoint:np.ndarray)->int:
+        """Given a local point, it returns the index of the first polygon that contains it.
+        Args:
+            localPoint (array): The local coordinates of the point.
+        Returns:
+            The index of the polygon or -1 if no polygon contains the point.
+        """
+        x, y = localPoint
+        col = min(max(int(x*self.resolution/self.dimX), 0), self.resolution-1)
+        row = min(max(int(y*self.resolution/self.dimY), 0), self.resolution-1)
+        edges = self.cells[row][col]
+        if edges.size==0:
+            return -1
+        prevPoints = self.prevPoints[edges]
+        nextPoints = self.nextPoints[edges]
+        crossed = ((prevPoints[:, 1]>y) | (nextPoints[:, 1]>y)) & ((prevPoints[:, 0]-x)*(nextPoints[:, 0]-x)<0)
+        counts = np.bincount(self.owners[edges][crossed], minlength=self.nPolygons)
+        inside = np.flatnonzero(counts%2==1)
+        if inside.size==0:
+            return -1
+        return inside[0]
+
+    def queryMany(self, localPoints:np.ndarray)->np.ndarray:
+        """Given N local points, it returns the index of the first polygon that contains each of them.
+
+        The points are grouped by cell, so each cell tests its edges against all its points at once.
+
+        Args:
+            localPoints (array): An Nx2 array with the local coordinates of the points.
+        Returns:
+            An array with the index of the polygon containing each point or -1 if no polygon contains it.
+        """
+        localPoints = np.asarray(localPoints, float).reshape(-1, 2)
+        cols = np.clip((localPoints[:, 0]*self.resolution/self.dimX).astype(int), 0, self.resolution-1)
+        rows = np.clip((localPoints[:, 1]*self.resolution/self.dimY).astype(int), 0, self.resolution-1)
+        cellIds = rows*self.resolution + cols
+        result = np.full(len(localPoints), -1)
+
+        order = np.argsort(cellIds, kind="stable")
+        uniqueCells, starts = np.unique(cellIds[order], return_index=True)
+        for cellId, pointIds in zip(uniqueCells, np.split(order, starts[1:])):
+            edges = self.cells[cellId//self.resolution][cellId%self.resolution]
+            if edges.size==0:
+                continue
+            x = localPoints[pointIds, 0][:, None]
+            y = localPoints[pointIds, 1][:, None]
+            prevPoints = self.prevPoints[edges]
+            nextPoints = self.nextPoints[edges]
+            crossed = ((prevPoints[:, 1]>y) | (nextPoints[:, 1]>y)) & ((prevPoints[:, 0]-x)*(nextPoints[:, 0]-x)<0)
+            ownership = self.owners[edges][:, None]==np.arange(self.nPolygons)
+            inside = (crossed.astype(int)@ownership)%2==1
+            containing = inside.any(axis=1)
+            result[pointIds[containing]] = inside.argmax(axis=1)[containing]
+        return result
+
+
+
+class terrainField:
+    """The properties ([friction, grip, traction]) of the terrain at any point of a quotient space.
+
+    Attributes:
+        space (quotientSpace): The space where the terrain lives.
+        polygons (list[array]): The local vertices of each terrain, sorted by priority.
+        properties (array): A Kx3 matrix with the [friction, grip, traction] of each terrain.
+        background (array): The [friction, grip, traction] outside of every terrain.
+        table (array): The background properties followed by the properties of each terrain.
+        index (terrainIndex): The spatial index of the edges of the terrains.
+        raster (array): If compiled, a matrix where the element i,j is the [friction, grip, traction] of the local space at that pixel.
+        rasterCell (float): The size of a pixel of the raster in local units.
+        blend (bool): If True, the values of the raster are blended bilinearly.
+    """
+    def __init__(self, space: quotientSpace, polygons: list[np.ndarray], properties: list[list[float]], background: list[float]):
+        """Creates the terrain field.
+        Args:
+            space (quotientSpace): The space where the terrain lives.
+            polygons (list[array]): The local vertices of each terrain, sorted by priority.
+            properties (list[list[float]]): The [friction, grip, traction] of each terrain.
+            background (list[float]): The [friction, grip, traction] outside of every terrain.
+        """
+        self.space = space
+        self.polygons = polygons
+        self.properties = np.array(properties, float).reshape(-1, 3)
+        self.background = np.array(background, float)
+        self.table = np.vstack((self.background, self.properties))
+        self.index = terrainIndex(space.dimX, space.dimY, polygons)
+        self.raster = None
+        self.rasterCell = 1
+        self.blend = False
+
+    @classmethod
+    def fromTrack(cls, space: quotientSpace, track: dict):
+        """Creates the terrain field of a track (see tracks.py)."""
+        polygons = [roadPolygon(road) for road in track["roads"]]
+        properties = [[road["friction"], road["grip"], road["traction"]] for road in track["roads"]]
+        return cls(space, polygons, properties, track["background"])
+
+    def geometryHash(self, cellSize: float)->str:
+        """Returns a hash that identifies the geometry and the properties of the terrains rasterized with a certain cell size."""
+        h = hashlib.sha1()
+        h.update(np.array([self.space.dimX, self.space.dimY, cellSize, *self.background], float).tobytes())
+        for polygon, properties in zip(self.polygons, self.properties):
+            h.update(np.asarray(polygon, float).tobytes())
+            h.update(properties.tobytes())
+        return h.hexdigest()[:16]
+
+    def rasterize(self, cellSize: float = 1)->np.ndarray:
+        """Samples the terrain properties at the center of each pixel of the local space.
+        Args:
+            cellSize (float): The size of a pixel in local units.
+        Returns:
+            A matrix where the element i,j is the [friction, grip, traction] at the pixel of row i and column j.
+        """
+        width = int(np.ceil(self.space.dimX/cellSize))
+        height = int(np.ceil(self.space.dimY/cellSize))
+        xs = (np.arange(width)+0.5)*cellSize
+        ys = (np.arange(height)+0.5)*cellSize
+        gridX, gridY = np.meshgrid(xs, ys)
+        owners = self.index.queryMany(np.column_stack((gridX.ravel(), gridY.ravel())))
+        return self.table.astype(np.float32)[owners+1].reshape(height, width, 3)
+
+    def compileRaster(self, cellSize: float = 1, blend: bool = False, raster: np.ndarray = None)->None:
+        """Compiles the terrains into a raster, so the lookups become an array index.
+        Args:
+            cellSize (float): The size of a pixel of the raster in local units.
+            blend (bool): If True, the values are blended bilinearly, which smooths the borders of the roads.
+            raster (array): A raster previously compiled with the same geometry. If it is None, the raster is computed.
+        """
+        if raster is None:
+            raster = self.rasterize(cellSize)
+        self.raster = raster
+        self.rasterCell = cellSize
+        self.blend = blend
+
+    def sampleRaster(self, localPoints: np.ndarray)->np.ndarray:
+        """Given an Nx2 array of local points, it returns the Nx3 [friction, grip, traction] stored in the raster."""
+        height, width, _ = self.raster.shape
+        u = localPoints[:, 0]/self.rasterCell
+        v = localPoints[:, 1]/self.rasterCell
+        if not self.blend:
+            return self.raster[np.clip(v.astype(int), 0, height-1), np.clip(u.astype(int), 0, width-1)]
+
+        u = np.clip(u-0.5, 0, width-1)
+        v = np.clip(v-0.5, 0, height-1)
+        col = np.minimum(u.astype(int), width-2)
+        row = np.minimum(v.astype(int), height-2)
+        du = (u-col)[:, None]
+        dv = (v-row)[:, None]
+        top = self.raster[row, col]*(1-du) + self.raster[row, col+1]*du
+        bottom = self.raster[row+1, col]*(1-du) + self.raster[row+1, col+1]*du
+        return top*(1-dv) + bottom*dv
+
+    def findPolygon(self, point: np.ndarray)->int:
+        """Given a point in normal coordinates, it returns the index of the terrain with highest priority that contains it or -1."""
+        return self.index.query(self.space.canonicalizePoint(float(point[0]), float(point[1])))
+
+    def getFrictions(self, points: np.ndarray)->np.ndarray:
+        """Given an Nx2 array of points in normal coordinates, it returns the Nx3 [friction, grip, traction] at each point."""
+        localPoints = self.space.canonicalize(np.asarray(points, float).reshape(-1, 2))
+        if self.raster is not None:
+            return self.sampleRaster(localPoints).astype(float)
+        return self.table[self.index.queryMany(localPoints)+1]
+
+    def getFriction(self, point: np.ndarray)->tuple[float]:
+        """Given a point in normal coordinates, it returns the friction, grip and traction at the point.
+
+        A single point is wrapped with plain float arithmetic, so a compiled raster (without blending) is read with one index.
+        """
+        x, y = self.space.canonicalizePoint(float(point[0]), float(point[1]))
+        if self.raster is not None and not self.blend:
+            height, width, _ = self.raster.shape
+            friction, grip, traction = self.raster[min(int(y/self.rasterCell), height-1), min(int(x/self.rasterCell), width-1)].tolist()
+            return friction, grip, traction
+        if self.raster is not None:
+            friction, grip, traction = self.sampleRaster(np.array([[x, y]]))[0]
+        else:
+            friction, grip, traction = self.table[self.index.query((x, y))+1]
+        return float(friction), float(grip), float(traction)
+
+
+class carParams:
+    """The constants that define how a car behaves.
+    Attributes:
+        acc (float): The acceleration of the car.
+        angVel (float): The speed at which the car turns.
+        airFriction (float): The friction of the air.
+    """
+    def __init__(self, acc: float = 16, angVel: float = 1, airFriction: float = 1):
+        self.acc = acc
+        self.angVel = angVel
+        self.airFriction = airFriction
+
+
+class carState:
+    """The state of N cars, stored as arrays so they can be simulated at once.
+    Attributes:
+        position (array): An Nx2 array with the global position of each car.
+        velocity (array): An Nx2 array with the velocity of each car.
+        angle (array): The angle at which each car is oriented.
+        momentum (array): The time each car has been accelerating (it controls the torque).
+        speed (array): The norm of the velocity of each car.
+    """
+    def __init__(self, nCars: int = 1, position = (0, 0), velocity = (0, 0), angle = np.pi/2):
+        self.position = np.zeros((nCars, 2)) + position
+        self.velocity = np.zeros((nCars, 2)) + velocity
+        self.angle = np.zeros(nCars) + angle
+        self.momentum = np.zeros(nCars)
+        self.speed = np.linalg.norm(self.velocity, axis=1)
+
+    def copy(self):
+        """Returns an independent copy of the state."""
+        new = carState(0)
+        new.position = self.position.copy()
+        new.velocity = self.velocity.copy()
+        new.angle = self.angle.copy()
+        new.momentum = self.momentum.copy()
+        new.speed = self.speed.copy()
+        return new
+
+    def __len__(self)->int:
+        return len(self.angle)
+
+
+class carInput:
+    """The controls pressed on N cars.
+    Attributes:
+        throttle (array): True if the car is accelerating ("w").
+        reverse (array): True if the car is reversing ("s").
+        left (array): True if the car is turning left ("a").
+        right (array): True if the car is turning right ("d").
+    """
+    def __init__(self, throttle = False, reverse = False, left = False, right = False, nCars: int = 1):
+        self.throttle = np.zeros(nCars, bool) | throttle
+        self.reverse = np.zeros(nCars, bool) | reverse
+        self.left = np.zeros(nCars, bool) | left
+        self.right = np.zeros(nCars, bool) | right
+
+    @classmethod
+    def fromKeys(cls, keyStates: dict, nCars: int = 1):
+        """Creates the input from the state of the keyboard (see keyStateMachine)."""
+        return cls(keyStates["w"], keyStates["s"], keyStates["a"], keyStates["d"], nCars)
+
+    @classmethod
+    def fromCodes(cls, codes):
+        """Creates the input of N cars from their encoded keys (see INPUT_BITS)."""
+        codes = np.atleast_1d(np.asarray(codes, int))
+        return cls((codes&INPUT_BITS["w"])>0, (codes&INPUT_BITS["s"])>0, (codes&INPUT_BITS["a"])>0, (codes&INPUT_BITS["d"])>0, len(codes))
+
+
+def wrapPositions(space: quotientSpace, positions: np.ndarray)->np.ndarray:
+    """Brings the global positions that are out of bounds back to their corresponding global space."""
+    limits = 2*space.dims
+    positions = np.where(positions<0, positions+limits, positions)
+    return np.where(positions>limits, positions-limits, positions)
+
+
+def stepCars(state: carState, inputs: carInput, field: terrainField, params: carParams, dt: float)->None:
+    """
+    Advances the state of N cars a certain amount of time.
+
+    It computes the acceleration from the terrain, the friction and the power, then it turns the cars and finally it moves them.
+
+    Args:
+        state (carState): The state of the cars. It is updated in place.
+        inputs (carInput): The controls pressed on each car.
+        field (terrainField): The terrain on which the cars move.
+        params (carParams): The constants of the cars.
+        dt (float): The time step.
+    """
+    momentum = state.momentum.copy()
+    reverse = inputs.reverse
+    throttle = inputs.throttle & ~reverse
+    coasting = ~reverse & ~inputs.throttle
+
+    torque = np.zeros(len(state))
+    torque[reverse] = -0.1
+    state.momentum[throttle & (momentum<30)] += dt
+    torque[throttle] = 1-1/(momentum[throttle]/5+1.2)
+    state.momentum[coasting & (momentum>0)] -= dt*3
+
+    groundFriction, grip, traction = field.getFrictions(state.position).T
+
+    tangDirection = np.column_stack((np.cos(state.angle), np.sin(state.angle)))
+    perpDirection = np.column_stack((tangDirection[:, 1], -tangDirection[:, 0]))
+    v = state.velocity
+    acc = tangDirection*params.acc*traction[:, None]*torque[:, None]
+    acc -= v*params.airFriction
+    acc -= (np.sign(np.einsum("nk,nk->n", v, tangDirection)))[:, None]*tangDirection*groundFriction[:, None]
+    gripCoef = 1/(state.speed/250+1)
+    acc -= (gripCoef*grip*np.einsum("nk,nk->n", v, perpDirection))[:, None]*perpDirection
+
+    state.velocity += acc*dt
+    state.speed = np.linalg.norm(state.velocity, axis=1)
+
+    turnCoef = (1-1/(state.speed/50+1)) #Don't allow the car to turn when its speed is low.
+    for sign, pressed in ((1, inputs.left), (-1, inputs.right)):
+        forward = np.einsum("nk,nk->n", state.velocity, np.column_stack((np.cos(state.angle), np.sin(state.angle))))
+        orientation = np.where(forward<0, sign, -sign)
+        state.angle += np.where(pressed, orientation*dt*params.angVel*turnCoef, 0)
+
+    state.position = wrapPositions(field.space, state.position + state.velocity*dt)
+
+
+def interpolatePositions(space: quotientSpace, previous: np.ndarray, current: np.ndarray, alpha: float)->np.ndarray:
+    """
+    Interpolates between two sets of global positions.
+
+    If a position was teleported to its global space between both states, the previous position is displaced by the same
+    translation (which is a symmetry of the global space), so the interpolation doesn't cross the whole canvas.
+
+    Args:
+        space (quotientSpace): The space where the positions live.
+        previous (array): An Nx2 array with the previous positions.
+        current (array): An Nx2 array with the current positions.
+        alpha (float): The interpolation factor (0 is the previous state, 1 the current one).
+    """
+    limits = 2*space.dims
+    previous = previous + np.round((current-previous)/limits)*limits
+    return wrapPositions(space, previous + alpha*(current-previous))
+
+
+class fixedClock:
+    """
+    A clock that splits the rendered frames into physics steps of a fixed duration.
+
+    The time of each frame is added to an accumulator, and a step is consumed for each full step it contains, so the simulation
+    doesn't depend on how long each frame took. The remainder is used to interpolate the rendered state between the last two steps.
+
+    Attributes:
+        rate (float): The number of physics steps per second.
+        step (float): The duration of a physics step.
+        maxSteps (int): The maximum number of steps per frame. The time beyond it is dropped, so a hitch slows down the game instead of stalling it.
+        accumulator (float): The time that hasn't been simulated yet.
+        ticks (int): The number of steps simulated.
+    """
+    def __init__(self, rate: float = PHYSICS_RATE, maxSteps: int = 12):
+        self.rate = rate
+        self.step = 1/rate
+        self.maxSteps = maxSteps
+        self.accumulator = 0
+        self.ticks = 0
+
+    def advance(self, frameTime: float)->int:
+        """Adds the time of a frame and returns the number of physics steps that have to be simulated."""
+        self.accumulator += frameTime
+        steps = int(self.accumulator/self.step)
+        if steps>self.maxSteps:
+            steps = self.maxSteps
+            self.accumulator = steps*self.step
+        self.accumulator -= steps*self.step
+        self.ticks += steps
+        return steps
+
+    @property
+    def alpha(self)->float:
+        """The fraction of step between the last simulated state and the rendered time."""
+        return self.accumulator/self.step
+
+
+class lapCounter:
+    """Counts the laps of N cars crossing a finish line.
+
+    A crossing only counts if the line is active. It is deactivated when the car crosses it and reactivated when the car gets far enough,
+    so crossing the line and going backwards doesn't count as a lap.
+
+    Attributes:
+        space (quotientSpace): The space where the cars race.
+        index (terrainIndex): The index of the hitbox of the finish line.
+        position (array): The global position of the finish line.
+        totalLaps (int): The number of laps that have to be completed to finish the race.
+        resetDistance (float): The distance at which the line is reactivated.
+        laps (array): The number of times each car has crossed the line.
+        active (array): If the line is active for each car.
+        counting (array): If the timer of each car is counting.
+        time (array): The time elapsed since each car started the race.
+    """
+    def __init__(self, space: quotientSpace, hitbox: list[np.ndarray], nCars: int = 1, totalLaps: int = 3, resetDistance: float = None):
+        """Creates the lap counter.
+        Args:
+            space (quotientSpace): The space where the cars race.
+            hitbox (list[array]): The local vertices of the hitbox of the finish line.
+            nCars (int): The number of cars.
+            totalLaps (int): The number of laps of the race.
+            resetDistance (float): The distance at which the line is reactivated (a third of the width of the space by default).
+        """
+        self.space = space
+        self.index = terrainIndex(space.dimX, space.dimY, [hitbox])
+        self.position = np.mean(np.asarray(hitbox, float), axis=0)
+        self.totalLaps = totalLaps
+        self.resetDistance = space.dimX/3 if resetDistance is None else resetDistance
+        self.laps = np.zeros(nCars, int)
+        self.active = np.ones(nCars, bool)
+        self.counting = np.zeros(nCars, bool)
+        self.time = np.zeros(nCars)
+
+    def advanceTime(self, dt: float)->None:
+        """Advances the timers that are counting."""
+        self.time[self.counting] += dt
+
+    def check(self, positions: np.ndarray)->tuple[np.ndarray]:
+        """Checks which cars have crossed the finish line.
+        Args:
+            positions (array): An Nx2 array with the global position of each car.
+        Returns:
+            Two boolean arrays: the cars that have started the race and the cars that have finished it.
+        """
+        positions = np.asarray(positions, float).reshape(-1, 2)
+        wasActive = self.active.copy()
+        inside = self.index.queryMany(self.space.canonicalize(positions))==0
+        crossing = wasActive & inside
+        started = crossing & (self.laps==0)
+        finished = crossing & (self.laps==self.totalLaps)
+        self.counting[started] = True
+        self.counting[finished] = False
+        self.laps[crossing] += 1
+        self.active[crossing] = False
+
+        if not wasActive.all():
+            far = self.space.distance(positions[~wasActive], self.position)[:, 0]>self.resetDistance
+            reactivated = np.flatnonzero(~wasActive)[far]
+            self.active[reactivated] = True
+        return started, finished
+
+
+class raceSimulation:
+    """A race of N cars on a track, without any canvas.
+
+    Attributes:
+        space (quotientSpace): The space where the race takes place.
+        track (dict): The track (see tracks.py).
+        field (terrainField): The terrain of the track.
+        finishLine (dict): The geometry of the finish line.
+        laps (lapCounter): The lap counter.
+        params (carParams): The constants of the cars.
+        state (carState): The state of the cars.
+        time (float): The time simulated.
+    """
+    def __init__(self, spaceName: str, mapName: str, nCars: int = 1, dim: float = 750, cellSize: float = 1, params: carParams = None, distance: float = 30, dimY: float = None):
+        """Creates the race with the cars placed just behind the finish line.
+        Args:
+            spaceName (str): The private name of the space.
+            mapName (str): The private name of the map.
+            nCars (int): The number of cars.
+            dim (float): The size of the local space (its width if dimY is given).
+            cellSize (float): The size of a pixel of the terrain raster. If it is None, the terrain is not rasterized.
+            params (carParams): The constants of the cars.
+            distance (float): The distance between the cars and the finish line.
+            dimY (float): The height of the local space. By default, the same as its width.
+        """
+        dimY = dim if dimY is None else dimY
+        hOrientation, vOrientation = SPACE_ORIENTATIONS[spaceName]
+        self.space = quotientSpace(dim, dimY, hOrientation, vOrientation)
+        self.track = selectTrack(mapName, dim, dimY)
+        self.field = terrainField.fromTrack(self.space, self.track)
+        if cellSize:
+            self.field.compileRaster(cellSize)
+
+        self.finishLine = finishLineGeometry(self.track["roads"][0])
+        self.laps = lapCounter(self.space, self.finishLine["vertices"], nCars)
+        self.params = params if params else carParams()
+
+        angle = self.finishLine["angle"]
+        start = wrapPositions(self.space, self.laps.position - distance*np.array([np.cos(angle), np.sin(angle)]))
+        self.state = carState(nCars, start, angle=angle)
+        self.time = 0
+
+    def step(self, inputs: carInput, dt: float = 1/PHYSICS_RATE)->tuple[np.ndarray]:
+        """Advances the race a certain amount of time.
+        Args:
+            inputs (carInput): The controls pressed on each car.
+            dt (float): The time step (a physics step by default).
+        Returns:
+            Two boolean arrays: the cars that have started the race and the cars that have finished it.
+        """
+        stepCars(self.state, inputs, self.field, self.params, dt)
+        self.time += dt
+        self.laps.advanceTime(dt)
+        return self.laps.check(self.state.position)
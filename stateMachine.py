@@ -1,5 +1,7 @@
 from tkinter import Event
 
+from constants import INPUT_BITS
+
 class keyStateMachine(dict):
     """
     A dictionary used as a state machine designed to monitor which keys are pressed.
@@ -33,4 +35,14 @@ class keyStateMachine(dict):
         """
         key = key.keysym.lower()
         if key in self:
-            self[key] = False
\ No newline at end of file
+            self[key] = False
+
+    def encode(self)->int:
+        """
+        Returns the state of the driving keys as an integer where each key is a bit (see INPUT_BITS).
+        """
+        code = 0
+        for key, bit in INPUT_BITS.items():
+            if self[key]:
+                code |= bit
+        return code
@@ -2,7 +2,9 @@ from tkinter import Tk, Label, Button, Frame, Listbox, Entry, Canvas
 from functools import partial
 from PIL import ImageTk
 import tkinter as tk
+import threading
 import winsound
+import queue
 
 
 from filesManager import getRecords, loadImage, getSoundDir
@@ -25,6 +27,78 @@ BG_PADDINGS = BGCOLOR_2
 
 INTERIOR_WIDTH = DIMX-2*EXTERNAL_PADDING
 
+RIVALS_PAGE_SIZE = 25
+
+
+class recordsLoader:
+    """Queries the records on a worker thread and delivers them on the tkinter thread.
+
+    Only the last request matters: the requests that are replaced before the worker takes them are skipped and the results of old requests are discarded.
+
+    Attributes:
+        widget: The tkinter widget whose after() polls the results.
+        callback (function): The function that receives the records of the last request.
+        pollMs (int): The milliseconds between two checks of the results.
+        generation (int): The id of the last request.
+        requests (Queue): The requests waiting for the worker.
+        results (Queue): The results waiting for the tkinter thread.
+        worker (Thread): The thread that runs the queries.
+        afterId (str): The id of the next scheduled check.
+    """
+    def __init__(self, widget, callback, pollMs: int = 30):
+        self.widget = widget
+        self.callback = callback
+        self.pollMs = pollMs
+        self.generation = 0
+        self.requests = queue.Queue()
+        self.results = queue.Queue()
+        self.worker = threading.Thread(target=self._work, daemon=True)
+        self.worker.start()
+        self.afterId = None
+
+    def request(self, space: str, map: str)->None:
+        """Asks for the records of a space and map, cancelling the previous request."""
+        self.generation += 1
+        self.requests.put((self.generation, space, map))
+        if self.afterId is None:
+            self.afterId = self.widget.after(self.pollMs, self._poll)
+
+    def close(self)->None:
+        """Cancels the pending request, stops checking the results and finishes the worker."""
+        self.generation += 1
+        self.requests.put(None)
+        if self.afterId is not None:
+            self.widget.after_cancel(self.afterId)
+            self.afterId = None
+
+    def _work(self)->None:
+        """Runs the queries of the requests (on the worker thread)."""
+        while True:
+            request = self.requests.get()
+            while request and not self.requests.empty(): #Only the last request is answered
+                request = self.requests.get_nowait()
+            if request is None:
+                return
+            generation, space, map = request
+            if generation!=self.generation:
+                continue
+            try:
+                records = getRecords(space, map)
+            except Exception as error:
+                print("ERROR LOADING RIVALS:", error)
+                records = []
+            self.results.put((generation, records))
+
+    def _poll(self)->None:
+        """Delivers the results of the last request (on the tkinter thread)."""
+        self.afterId = None
+        while not self.results.empty():
+            generation, records = self.results.get_nowait()
+            if generation==self.generation:
+                self.callback(records)
+                return
+        self.afterId = self.widget.after(self.pollMs, self._poll)
+
 
 
 def createInterface(main:Tk):
@@ -36,13 +110,27 @@ def createInterface(main:Tk):
             return
         map = mapsList[mapId]["privateName"]
         space = spaceList[spaceId]["privateName"]
-        rivalList.delete(2, tk.END)
-        records = getRecords(space, map)
+        showRivals([])
+        rivalsLoader.request(space, map)
+
+    def showRivals(records: list[dict]):
+        """Replaces the rivals of the list. Only the first page is inserted, the others are inserted when the list is scrolled to the bottom."""
         global racers
         racers = records
-        print(records)
-        for record in records:
-            rivalList.insert("end", record["time"]+" | "+str(record["name"]))
+        rivalList.delete(len(items), tk.END)
+        rivalsSelection["last"] = {index for index in rivalsSelection["last"] if index<len(items)} or {NONE_ITEM}
+        for index in rivalsSelection["last"]:
+            rivalList.select_set(index)
+        rivalsPage["shown"] = 0
+        showMoreRivals()
+
+    def showMoreRivals():
+        """Inserts the next page of rivals on the list."""
+        start = rivalsPage["shown"]
+        page = racers[start:start+RIVALS_PAGE_SIZE]
+        if page:
+            rivalList.insert("end", *[record["time"]+" | "+str(record["name"]) for record in page])
+        rivalsPage["shown"] = start + len(page)
 
 
     def changeSelection(index: int, options: list, e):
@@ -214,6 +302,9 @@ def createInterface(main:Tk):
 
     def manageScrollIndicators(*args):
         scrollPosition = rivalList.yview()
+        if scrollPosition[1]>=1 and rivalsPage["shown"]<len(racers):
+            showMoreRivals()
+            scrollPosition = rivalList.yview()
         if scrollPosition[0]>0:
             rivalSuperiorIndicator.config(bg=ALTERNATIVE_COLOR_1)
         else:
@@ -234,7 +325,10 @@ def createInterface(main:Tk):
 
     global racers
     racers = []
-    items = ["", "E:RR | None"] #There is a bug where you can select the empty item
+    rivalsPage = {"shown": 0}
+    items = ["", "E:RR | None", "TOP " + str(TOP_GHOSTS) + " | Best records", "BEST | My best"] #There is a bug where you can select the empty item
+    NONE_ITEM, TOP_ITEM, OWN_ITEM = 1, 2, 3
+    rivalsSelection = {"last": {NONE_ITEM}}
     rivalList = Listbox(
         listFrame,
         font=("Segoe UI", SUBTITLE_SIZE),
@@ -246,7 +340,8 @@ def createInterface(main:Tk):
         relief="flat",
         height=4,
         yscrollcommand=manageScrollIndicators,
-        exportselection=False # To fix the bug where the item gets unselected when double-clicking on the entry
+        exportselection=False, # To fix the bug where the item gets unselected when double-clicking on the entry
+        selectmode="multiple"
     )
     for item in items:
         rivalList.insert("end", item)
@@ -254,6 +349,21 @@ def createInterface(main:Tk):
     rivalList.place(x=0, y=-20, relwidth=1, relheight=1.2)
     rivalList.bind("<MouseWheel>", mousewheelManager)
 
+    def manageRivalsSelection(e):
+        """Keeps "None" exclusive: selecting it clears the rivals, and selecting a rival clears it."""
+        selection = set(rivalList.curselection()) - {0}
+        added = selection - rivalsSelection["last"]
+        if NONE_ITEM in added or not selection:
+            selection = {NONE_ITEM}
+        else:
+            selection.discard(NONE_ITEM)
+        rivalList.selection_clear(0, tk.END)
+        for index in selection:
+            rivalList.select_set(index)
+        rivalsSelection["last"] = selection
+    rivalList.bind("<<ListboxSelect>>", manageRivalsSelection)
+    rivalsLoader = recordsLoader(main, showRivals)
+
     rivalInferiorIndicator = Frame(rivalFrame, bg=BGCOLOR, height=2)
     rivalInferiorIndicator.pack_propagate(False)
     rivalInferiorIndicator.pack(fill="x")
@@ -331,24 +441,22 @@ def createInterface(main:Tk):
         else:
             parameters["map"] = mapsList[mapId]["privateName"]
         
-        rivalId = rivalList.curselection()
-        print(rivalId)
-        print(racers)
-        if rivalId:
-            rivalId = rivalId[0]
-            if rivalId>1:
-                parameters["rival"] = racers[rivalId-2]["name"]
-            else:
-                parameters["rival"] = None  
-        else:
-            parameters["rival"] = None  
-
         name = nameEntry.get()
         parameters["name"] = name
+
+        rivalIds = rivalList.curselection()
+        rivals = []
+        if TOP_ITEM in rivalIds:
+            rivals += [record["name"] for record in racers[:TOP_GHOSTS]]
+        if OWN_ITEM in rivalIds and name in [record["name"] for record in racers]:
+            rivals.append(name)
+        rivals += [racers[rivalId-len(items)]["name"] for rivalId in rivalIds if rivalId>=len(items)]
+        parameters["rivals"] = list(dict.fromkeys(rivals))[:MAX_GHOSTS]
+        rivalsLoader.close()
         for widget in main.winfo_children():
             widget.destroy()
-        beginGame(main, parameters)
-        createInterface(main)
+        if not beginGame(main, parameters): #The title screen isn't rebuilt if the window was closed during the race
+            createInterface(main)
 
 
     BUTTON_WIDTH = 200
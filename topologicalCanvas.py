@@ -1,12 +1,12 @@
-from tkinter import Canvas, Tk
+from tkinter import Tk
 import numpy as np
 import time
 
 from stateMachine import keyStateMachine
+from Tmath import quotientSpace
+from renderer import renderer, tkRenderer
 from constants import BGCOLOR
 
-# If optimization is necessary, a modification that could help is to only draw to the external squares the moving parts, and not the fixed ones
-
 class topologicalCanvas():
     """
     Canvas with the sides glued.
@@ -22,7 +22,8 @@ class topologicalCanvas():
     When we talk about a normal property, we refer to the property of the object on the original canvas.
 
     Attributes:
-        canvas (tkinter.Canvas): The canvas used to model the topological space.
+        renderer (renderer): The backend that draws the items of the canvas.
+        canvas (tkinter.Canvas): The canvas used to model the topological space. None if the renderer doesn't draw on tkinter.
         hOrientation (sign): The relation between the orientation of the left and right sides.
         vOrientation (sign): The relation between the orientation of the top and bottom sides.
         dimX (int): Width of the local space.
@@ -31,6 +32,14 @@ class topologicalCanvas():
         lastTime (time): The last time the canvas was updated.
         delta (float): The time elapsed between the last frame and the current one.
         keyStates (keyStateMachine): A state machine to monitor which keys are pressed.
+        space (quotientSpace): The vectorized geometry of the glued space.
+        culling (bool): If True, the updates of the copies placed on cells that the camera can't see are deferred.
+        cullingMargin (float): Extra pixels around the window in which the cells are still considered visible.
+        catchUp (bool): If True, the deferred copies are rebuilt as soon as their cells come into view. Otherwise they wait for the next update of their object (or syncVisibleCells).
+        visibleCells (array): A 6x6 boolean matrix where the element i,j is True if the cell i,j is visible.
+        dirtyObjects (set): The objects with deferred updates on cells that are not visible.
+        cellScales (array): A 6x6x2 tensor where the element i,j is the diagonal of the linear part of the transform of the cell i,j.
+        cellOffsets (array): A 6x6x2 tensor where the element i,j is the translation of the transform of the cell i,j.
     """
     
     def gluingFuncH(self, y: float)->float:
@@ -63,7 +72,7 @@ class topologicalCanvas():
         if self.vOrientation==-1:
             return self.dimX-x
 
-    def __init__(self, tk:Tk, hOrientation: int, vOrientation: int,  dimX=300, dimY=300, windowW= 400, windowH=400, bg:str=BGCOLOR, visualHelp = False):
+    def __init__(self, tk:Tk, hOrientation: int, vOrientation: int,  dimX=300, dimY=300, windowW= 400, windowH=400, bg:str=BGCOLOR, visualHelp = False, culling = True, cullingMargin = 60, renderer: renderer = None):
         """
         Initializes a topological canvas.
 
@@ -74,24 +83,31 @@ class topologicalCanvas():
             dimX (int): Width of the space.
             dimY (int): Height of the space.
             visualHelp (bool): If True, it shows some visual help to make navigation easier.
+            culling (bool): If True, the copies placed on cells that can't be seen are updated only when they come into view.
+            cullingMargin (float): Extra pixels around the window in which the cells are still considered visible.
+            renderer (renderer): The backend that draws the canvas. By default, a tkRenderer on the parent.
 
         Returns:
             A topological canvas with the initialized values.
         """
         self.root = tk
-        self.canvas: Canvas = Canvas(tk, width=windowW, height=windowH,
-                                     scrollregion=(0,0,dimX*6,dimY*6), bg=BGCOLOR)
+        if renderer is None:
+            renderer = tkRenderer(tk, windowW, windowH, (0,0,dimX*6,dimY*6), BGCOLOR)
+        self.renderer = renderer
+        self.canvas = renderer.widget
         self.visualHelp = visualHelp
         if visualHelp:
             for i in range(6):
-                self.canvas.create_line(i*dimX, 0, i*dimX, dimY*6)
-                self.canvas.create_line(0, i*dimY, 6*dimY, i*dimY)
+                renderer.createLine([i*dimX, 0, i*dimX, dimY*6])
+                renderer.createLine([0, i*dimY, 6*dimY, i*dimY])
         
-        self.canvas.pack(expand=True, fill="both")
         self.vOrientation = vOrientation
         self.hOrientation = hOrientation
         self.dimX = dimX
         self.dimY = dimY
+        self.space = quotientSpace(dimX, dimY, hOrientation, vOrientation)
+        self.cellScales = self.space.cellScales
+        self.cellOffsets = self.space.cellOffsets
 
         self.windowX = windowH
         self.windowY = windowW
@@ -103,25 +119,77 @@ class topologicalCanvas():
 
         self.keyStates = keyStateMachine()
 
-        self.canvas.bind("<KeyPress>", self.keyStates.keyPresed)
-        self.canvas.bind("<KeyRelease>", self.keyStates.keyReleased)
-        self.canvas.bind("<Configure>", self.changeOptions)
+        self.culling = culling
+        self.cullingMargin = cullingMargin
+        self.catchUp = True
+        self.visibleCells = np.ones((6,6), bool)
+        self.dirtyObjects = set()
 
-        self.canvas.config(takefocus=True)
-        self.canvas.focus_set()
+        renderer.bind("<KeyPress>", self.keyStates.keyPresed)
+        renderer.bind("<KeyRelease>", self.keyStates.keyReleased)
+        renderer.bind("<Configure>", self.changeOptions)
     
     
+    def newTid(self)->str:
+        """Returns a new topological ID, with the format "Tid"+int."""
+        Tid = "Tid"+str(self.nElements)
+        self.nElements = self.nElements+1
+        return Tid
+
+    @staticmethod
+    def parityTag(Tid:str, r:int, c:int)->str:
+        """
+        Returns the tag shared by the copies of an object placed on the cells with the same orientation as the cell r,c.
+
+        The copies placed on cells whose row and column have the same parity are transformed in the same way, so there are 4 of these tags per object.
+        """
+        return Tid+"p"+str(r%2)+str(c%2)
+
+    def cellTags(self, tags:list[str], Tid:str, r:int, c:int)->tuple[str]:
+        """
+        Returns the tags of the copy of an object placed on the cell r,c.
+
+        Args:
+            tags (list[str]): The tags given to the object.
+            Tid (str): The topological ID of the object.
+            r (int): The row of the cell.
+            c (int): The column of the cell.
+        """
+        return (*tags, Tid, self.parityTag(Tid, r, c))
+
+    def tagStatistics(self)->dict:
+        """
+        Counts the items drawn on the canvas and the tags they carry.
+
+        Returns:
+            A dictionary of the form {"items": n, "tagReferences": m, "distinctTags": k, "tagBytes": b}.
+        """
+        items = self.renderer.items()
+        tagReferences = 0
+        tagBytes = 0
+        distinctTags = set()
+        for item in items:
+            tags = self.renderer.tags(item)
+            tagReferences += len(tags)
+            tagBytes += sum(len(tag) for tag in tags)
+            distinctTags.update(tags)
+        return {"items": len(items), "tagReferences": tagReferences, "distinctTags": len(distinctTags), "tagBytes": tagBytes}
+
     def reflectedPoint(self, point:np.ndarray)->np.ndarray:
-        """Given the normal coordinates of a point, returns its local coordinates."""
-        newX=point[0]%self.dimX
-        newY=point[1]%self.dimY
-        #This could be optimized if needed
-        if point[0]%(2*self.dimX)>self.dimX:
-            newY = self.gluingFuncH(newY)
-        if point[1]%(2*self.dimY)>self.dimY:
-            newX = self.gluingFuncV(newX)
-        return ([newX,newY])
-        
+        """Given the normal coordinates of a point (or an Nx2 array of points), returns its local coordinates."""
+        return self.space.canonicalize(point)
+
+    def topologicalPoints(self, points: np.ndarray)->np.ndarray:
+        """
+        Given the local coordinates of N points, returns the normal coordinates of every point on each cell.
+
+        Args:
+            points (array): An Nx2 array with the local coordinates of the points.
+
+        Returns:
+            An Nx6x6x2 array where the element n,i,j are the normal coordinates of the point n on the i,j cell.
+        """
+        return self.space.images(points)
 
     def topologicalPoint(self, x: float, y: float)->np.ndarray:
         """
@@ -134,23 +202,20 @@ class topologicalCanvas():
         Returns:
             A matrix where the element i,j are the normal coordinates of the point on the i,j cell.
         """
-        pointsMatrix = np.zeros((6,6,2))
-        """ TODO It would be better if loc was calculated twice and placed on the corresponding indexes instead of calculating them every time """
-        for r in range(6):
-            for c in range(6):
-                if c%2==1:
-                    yloc = self.gluingFuncH(y)
-                else:
-                    yloc = y
-                if r%2==1:
-                    xloc = self.gluingFuncV(x)
-                else:
-                    xloc = x
-
-                pointsMatrix[r][c][0] = xloc + c*self.dimX
-                pointsMatrix[r][c][1] = yloc + r*self.dimY
-        
-        return pointsMatrix
+        return np.array([x, y], float)*self.cellScales + self.cellOffsets
+
+    def cellsCoordinates(self, points: np.ndarray)->np.ndarray:
+        """
+        Given the local coordinates of the vertices of a shape, returns the flattened normal coordinates of the shape on each cell.
+
+        Args:
+            points (array): An Nx2 array with the local coordinates of the vertices.
+
+        Returns:
+            A 6x6x2N array where the element i,j is the list [x0, y0, x1, y1, ...] of the shape on the i,j cell.
+        """
+        tPoints = self.topologicalPoints(points)
+        return tPoints.transpose(1, 2, 0, 3).reshape(6, 6, -1)
     
     def updateDelta(self)->None:
         """
@@ -165,15 +230,13 @@ class topologicalCanvas():
 
     def getCamaraPosition(self) -> np.ndarray:
         """Returns the global position of the camera on the canvas."""
-        fraccionx = self.canvas.xview()[0]
-        fracciony = self.canvas.yview()[0]
+        fraccionx, fracciony = self.renderer.view()
 
         camarax = fraccionx * 6*self.dimX + self.windowX/2
         camaray = fracciony * 6*self.dimY + self.windowY/2
 
         camarax = camarax - self.dimX*2
         camaray = camaray - self.dimY*2
-        print([camarax, camaray])
         return np.array([camarax, camaray])
     
     def setCamaraPosition(self, x:float, y:float)->np.ndarray:
@@ -183,17 +246,125 @@ class topologicalCanvas():
         fraccionx = (camarax - self.windowX/2)/(6*self.dimX)
         fracciony = (camaray - self.windowY/2)/(6*self.dimY)
 
-        self.canvas.xview_moveto(fraccionx)
-        self.canvas.yview_moveto(fracciony)
+        self.renderer.setView(fraccionx, fracciony)
+
+        self.updateVisibleCells(camarax - self.windowX/2, camaray - self.windowY/2)
 
         return np.array([camarax, camaray])
+
+    def computeVisibleCells(self, left:float, top:float)->np.ndarray:
+        """
+        Computes which cells can be seen from the window.
+
+        Args:
+            left (float): The normal x coordinate of the left side of the window.
+            top (float): The normal y coordinate of the top side of the window.
+
+        Returns:
+            A 6x6 boolean matrix where the element i,j is True if the cell i,j is visible.
+        """
+        if not self.culling:
+            return np.ones((6,6), bool)
+        # tkinter doesn't scroll outside the scroll region, so the window is clamped the same way.
+        left = min(max(left, 0), max(6*self.dimX-self.windowX, 0))
+        top = min(max(top, 0), max(6*self.dimY-self.windowY, 0))
+
+        margin = self.cullingMargin
+        firstC = max(int((left-margin)//self.dimX), 0)
+        lastC = min(int((left+self.windowX+margin)//self.dimX), 5)
+        firstR = max(int((top-margin)//self.dimY), 0)
+        lastR = min(int((top+self.windowY+margin)//self.dimY), 5)
+
+        visibleCells = np.zeros((6,6), bool)
+        visibleCells[firstR:lastR+1, firstC:lastC+1] = True
+        return visibleCells
+
+    def updateVisibleCells(self, left:float, top:float)->None:
+        """
+        Updates the visible cells and brings up to date the copies placed on the cells that have come into view.
+
+        Args:
+            left (float): The normal x coordinate of the left side of the window.
+            top (float): The normal y coordinate of the top side of the window.
+        """
+        visibleCells = self.computeVisibleCells(left, top)
+        newCells = visibleCells & ~self.visibleCells
+        self.visibleCells = visibleCells
+        if self.catchUp and newCells.any():
+            self.syncDirtyObjects(newCells)
+
+    def syncDirtyObjects(self, cells:np.ndarray)->None:
+        """
+        Rebuilds the deferred copies placed on the given cells.
+
+        Args:
+            cells (array): A 6x6 boolean matrix with the cells that have to be brought up to date.
+        """
+        for obj in list(self.dirtyObjects):
+            if obj.syncCells(cells):
+                self.dirtyObjects.discard(obj)
+
+    def syncVisibleCells(self)->None:
+        """Rebuilds the deferred copies of all the visible cells, e.g. the ones that came into view while catchUp was off."""
+        self.syncDirtyObjects(self.visibleCells)
+
+    def queueCommand(self, *words)->None:
+        """
+        Queues a canvas command to be sent on the next flush.
+
+        Args:
+            words: The words of the Tcl canvas command, e.g. "move", tag, dx, dy.
+        """
+        self.renderer.queueCommand(*words)
+
+    def queueCoords(self, item, coordinates:list[float])->None:
+        """
+        Queues the change of the coordinates of an item to be sent on the next flush.
+
+        Args:
+            item: The tkinter id or tag of the item.
+            coordinates (list[float]): The flattened list of coordinates [x0, y0, x1, y1, ...].
+        """
+        self.renderer.queueCoords(item, coordinates)
+
+    def queueMove(self, item, dx:float, dy:float)->None:
+        """
+        Queues a displacement of an item to be sent on the next flush.
+
+        Args:
+            item: The tkinter id or tag of the item.
+            dx (float): The displacement in the x direction.
+            dy (float): The displacement in the y direction.
+        """
+        self.renderer.queueMove(item, dx, dy)
+
+    def flush(self)->None:
+        """
+        Sends all the queued canvas commands to the renderer (with tkinter, as a single Tcl script).
+
+        It must be called before the canvas is redrawn, once per frame.
+        """
+        self.renderer.flush()
+
+    def markDirty(self, obj)->None:
+        """
+        Registers an object that has deferred updates on cells that are not visible.
+
+        Args:
+            obj (topologicalObject): The object with deferred updates.
+        """
+        self.dirtyObjects.add(obj)
     
     def changeOptions(self, event)->None:
         self.windowX = event.width
         self.windowY = event.height
+        fractionX, fractionY = self.renderer.view()
+        left = fractionX*6*self.dimX
+        top = fractionY*6*self.dimY
+        self.updateVisibleCells(left, top)
     
     def destroy(self)->None:
-        self.canvas.destroy()
+        self.renderer.destroy()
 
 
 
@@ -201,27 +372,27 @@ class torus(topologicalCanvas):
     """
     A topological canvas that represents a Torus.
     """
-    def __init__(self, tk, dimX=300, dimY=300, windowW= 400, windowH=400, visualHelp=False):
-        super().__init__(tk, 1, 1, dimX, dimY, windowW=windowW, windowH=windowH, visualHelp=visualHelp)
+    def __init__(self, tk, dimX=300, dimY=300, windowW= 400, windowH=400, visualHelp=False, renderer: renderer = None):
+        super().__init__(tk, 1, 1, dimX, dimY, windowW=windowW, windowH=windowH, visualHelp=visualHelp, renderer=renderer)
 
 class projectivePlane(topologicalCanvas):
     """
     A topological canvas that represents the projective plane.
     """
-    def __init__(self, tk, dimX=300, dimY=300, windowW= 400, windowH=400, visualHelp=False):
-        super().__init__(tk, -1, -1, dimX, dimY, windowW=windowW, windowH=windowH, visualHelp=visualHelp)
+    def __init__(self, tk, dimX=300, dimY=300, windowW= 400, windowH=400, visualHelp=False, renderer: renderer = None):
+        super().__init__(tk, -1, -1, dimX, dimY, windowW=windowW, windowH=windowH, visualHelp=visualHelp, renderer=renderer)
 
 class KleinBottleH(topologicalCanvas):
     """
     A topological canvas that represents a Klein bottle (mantains the H orientation).
     """
-    def __init__(self, tk, dimX=300, dimY=300, windowW= 400, windowH=400, visualHelp=False):
-        super().__init__(tk, 1, -1, dimX, dimY, windowW=windowW, windowH=windowH, visualHelp=visualHelp)
+    def __init__(self, tk, dimX=300, dimY=300, windowW= 400, windowH=400, visualHelp=False, renderer: renderer = None):
+        super().__init__(tk, 1, -1, dimX, dimY, windowW=windowW, windowH=windowH, visualHelp=visualHelp, renderer=renderer)
 
 class KleinBottleV(topologicalCanvas):
     """
     A topological canvas that represents a Klein bottle (mantains the V orientation).
     """
-    def __init__(self, tk, dimX=300, dimY=300, windowW= 400, windowH=400, visualHelp=False):
-        super().__init__(tk, -1, 1, dimX, dimY, windowW=windowW, windowH=windowH, visualHelp=visualHelp)
+    def __init__(self, tk, dimX=300, dimY=300, windowW= 400, windowH=400, visualHelp=False, renderer: renderer = None):
+        super().__init__(tk, -1, 1, dimX, dimY, windowW=windowW, windowH=windowH, visualHelp=visualHelp, renderer=renderer)
 
@@ -4,7 +4,7 @@ import numpy as np
 from topologicalObjects import topologicalPolygon
 from topologicalCanvas import topologicalCanvas
 from topologicalTerrain import terrainManager
-from Tmath import direction2D
+from simulation import carState, carParams, carInput, stepCars, wrapPositions, interpolatePositions
 from constants import *
 
 class topologicalCar():
@@ -15,12 +15,13 @@ class topologicalCar():
         TCanvas (topologicalCanvas): The topological canvas where the car is placed.
         body (topologicalPolygon): The rectangle representing the car on the canvas.
         ground (terrainManager): The terrain on which the car moves.
-        v (array): The velocity vector of the car.
-        acc (float): The acceleration of the car.
-        angle (float): The angle at which the car is oriented.
+        state (carState): The physical state of the car in the simulation core.
+        previousState (carState): The state of the car before the last physics step.
+        inputCode (int): The keys pressed during the last physics step (see INPUT_BITS).
+        params (carParams): The acceleration, turning speed and air friction of the car.
+        modelAngle (float): The angle at which the body of the car was created.
         width (float): The width of the car.
         height (float): The height of the car.
-        angVel (float): The speed at which the car turns.
     """
 
     def __init__(self, TCanvas: topologicalCanvas, ground:terrainManager, x0:float, y0:float, height:float, width:float, color=MAINCOLOR, acc=16, v0x = 0, v0y=0,rotationSpeed = 1):
@@ -47,40 +48,87 @@ class topologicalCar():
         self.TCanvas = TCanvas
         self.ground = ground
         
-        self.v = np.array([v0x, v0y], float)
-        self.speed = 0
-        self.a = acc
-        self.angle = pi/2
-        self.momentum = 0
-        self.angVel = rotationSpeed
+        self.state = carState(1, (x0, y0), (v0x, v0y), pi/2)
+        self.params = carParams(acc, rotationSpeed)
 
         self.width = width
         self.height = height
 
         self.createModel(x0, y0, color)
+        self.previousState = self.state.copy()
+        self.inputCode = 0
+
+    @property
+    def v(self)->np.ndarray:
+        """The velocity vector of the car."""
+        return self.state.velocity[0]
+
+    @property
+    def angle(self)->float:
+        """The angle at which the car is oriented."""
+        return self.state.angle[0]
+
+    @angle.setter
+    def angle(self, angle:float):
+        self.state.angle[0] = angle
+
+    @property
+    def speed(self)->float:
+        """The norm of the velocity of the car."""
+        return self.state.speed[0]
+
+    @property
+    def momentum(self)->float:
+        """The time the car has been accelerating."""
+        return self.state.momentum[0]
     
     def createModel(self, x0:float, y0:float, color=MAINCOLOR):
         w = self.width
         h = self.height
+        self.modelAngle = self.angle
         self.body = topologicalPolygon(self.TCanvas, [np.array([x0-w/2,y0-h/2]), np.array([x0+w/2,y0-h/2]), np.array([x0+w/2,y0+h/2]), np.array([x0-w/2,y0+h/2])], fill=color, tags=["topologicalCar"])
         #self.tireFL = topologicalPolygon(self.TCanvas, [np.array([x0+w/2-10,y0+h/2-10]), np.array([x0+w/2-10,y0+h/2+10]), np.array([x0+w/2+10,y0+h/2+10]), np.array([x0+w/2+10,y0+h/2-10])], fill="black", tags=["topologicalCar"])
         
     
     def updateCar(self)->None:
         """
-        Updates the car's state on each frame. This method must be called regularly.
+        Updates the car's state on each frame, advancing the physics the time elapsed since the last frame.
         """
-        self.calcAcc()
-        self.keyboardManagment()
-        self.updatePosition()
-        self.centerCamera()
+        self.stepPhysics(self.TCanvas.getDelta())
+        self.render()
+
+    def stepPhysics(self, dt:float)->None:
+        """
+        Advances the physics of the car a certain amount of time. The previous state is kept to interpolate the rendering.
+
+        Args:
+            dt (float): The time step.
+        """
+        self.previousState = self.state.copy()
+        self.inputCode = self.TCanvas.keyStates.encode()
+        stepCars(self.state, carInput.fromCodes(self.inputCode), self.ground.field, self.params, dt)
+
+    def render(self, alpha:float=1)->None:
+        """
+        Places the body of the car and the camera between the last two physics states.
+
+        Args:
+            alpha (float): The interpolation factor (0 is the previous state, 1 the current one).
+        """
+        position = self.getPosition()
+        angle = self.angle
+        if alpha!=1:
+            position = interpolatePositions(self.TCanvas.space, self.previousState.position, self.state.position, alpha)[0]
+            angle = self.previousState.angle[0] + alpha*(angle-self.previousState.angle[0])
+        self.body.setPose(position, angle - self.modelAngle)
+        self.TCanvas.setCamaraPosition(*position)
         self.body.Traise()
     
     def getPosition(self)->np.ndarray:
         """
         Returns the current position of the car.
         """
-        return self.body.position
+        return self.state.position[0]
     
     def centerCamera(self)->None:
         """
@@ -88,79 +136,23 @@ class topologicalCar():
         """
         self.TCanvas.setCamaraPosition(*self.getPosition())
 
-    def updatePosition(self)->None:
+    def syncBody(self)->None:
         """
-        Updates the car's global position based on its velocity.
+        Places the body of the car at the position and angle of its state.
         """
-
-        displacement =self.v*self.TCanvas.getDelta()
-        self.move(displacement)
-        
+        self.body.setPose(self.getPosition(), self.angle - self.modelAngle)
     
     def move(self, dp:np.ndarray):
-        dx = dp[0]
-        dy = dp[1]
-        self.body.TMove(dx, dy)
-        #self.tireFL.TMove(dx, dy)
-
-    def rise(self):
-        self.body.Traise()
-        #self.tireFL.Traise()
-
-    def calcAcc(self)->None:
-        """
-        Computes the car's acceleration based on terrain, friction, and power, and updates its speed and angle.
-        """
-        torque = 0
-        dt = self.TCanvas.getDelta()
-        momentum = self.momentum
-        if self.TCanvas.keyStates["s"]:
-            torque = -0.1
-        elif self.TCanvas.keyStates["w"]:
-            if momentum<30:
-                self.momentum += dt
-            torque = 1-1/(momentum/5+1.2)
-        else:
-            if momentum>0:
-                self.momentum -= dt*3
-        
-        
-        AIR_FRICTION = 1
-        GROUND_FRICTION, GRIP, TRACTION = self.ground.getFriction(self.body.position)
-
-        tangDirection = direction2D(self.angle)
-        perpDirection = np.array((tangDirection[1], -tangDirection[0]))
-        acc = tangDirection*self.a*TRACTION*torque
-        acc -= self.v*AIR_FRICTION
-        acc -= (np.sign(np.dot(self.v,tangDirection)))*tangDirection*GROUND_FRICTION
-        gripCoef = 1/(self.speed/250+1)
-        acc -= gripCoef*GRIP*np.dot(self.v,perpDirection)*perpDirection
-        
-        self.v += acc*dt
-        self.speed = np.linalg.norm(self.v)
-        
-    def rotateCar(self, sign)->None:
         """
-        Rotates the car in the specified direction.
+        Displaces the car by dp, teleporting it to its global canvas if needed. The displacement isn't interpolated.
 
         Args:
-            sign (int): The direction of rotation. Positive for clockwise, negative for counterclockwise.
+            dp (array): The displacement.
         """
-        orientation = -sign
+        self.state.position = wrapPositions(self.TCanvas.space, self.state.position + dp)
+        self.previousState = self.state.copy()
+        self.syncBody()
 
-        if np.dot(self.v,direction2D(self.angle))<0:
-            orientation = -orientation
-        dt = self.TCanvas.getDelta()
-        turnCoef = (1-1/(self.speed/50+1)) #Don't allow the car to turn when its speed is low.
-        angle = orientation*dt*self.angVel*turnCoef 
-        self.angle += angle
-        self.body.TRotation(angle)
-
-    def keyboardManagment(self)->None:
-        """
-        Handles the car's interaction with keyboard inputs.
-        """
-        if self.TCanvas.keyStates["a"]:
-            self.rotateCar(1)
-        if self.TCanvas.keyStates["d"]:
-            self.rotateCar(-1)
\ No newline at end of file
+    def rise(self):
+        self.body.Traise()
+        #self.tireFL.Traise()
@@ -1,12 +1,13 @@
-from math import sqrt
+from abc import ABC, abstractmethod
+
 import numpy as np
 
 
 from topologicalCanvas import topologicalCanvas
-from Tmath import rotationMatrix, direction2D
+from Tmath import rotationMatrix, rectangleVertices, curveOffsets
 
 
-class topologicalObject:
+class topologicalObject(ABC):
     """
     An object on the topological canvas.
     
@@ -18,6 +19,7 @@ class topologicalObject:
         position (array): The position where the object is located.
         objects (List[List[int]]): A matrix where the i,j element is the id of the copy of the original object placed at the canvas i,j.
         zIndex: Used to manage some depth related aspects.
+        dirtyCells (array): A 6x6 boolean matrix where the element i,j is True if the copy of the cell i,j has deferred updates.
     """
     def __init__(self, instances:list[list[int]], Tid, canvas: topologicalCanvas, x0=0, y0=0, zIndex = 0):
         """
@@ -33,42 +35,88 @@ class topologicalObject:
         self.TCanvas = canvas
         self.zIndex = zIndex
         self.objects = instances.copy()
-    
+        self.dirtyCells = None
+
+
+    def _defer(self, r:int, c:int)->None:
+        """
+        Marks the copy of the cell r,c as outdated, so its coordinates are rebuilt when the cell comes into view.
+
+        The matrix of outdated copies is only allocated the first time it is needed, because most objects never change their shape.
+        """
+        if self.dirtyCells is None:
+            self.dirtyCells = np.zeros((6,6), bool)
+        self.dirtyCells[r][c] = True
+        self.TCanvas.markDirty(self)
+
+    @abstractmethod
+    def cellCoordinates(self, r:int, c:int)->list[float]:
+        """Returns the flattened normal coordinates of the copy of the cell r,c. syncCells uses it to rebuild the deferred copies."""
+
+    def syncCells(self, cells:np.ndarray)->bool:
+        """
+        Rebuilds, in a single update per copy, the outdated copies placed on the given cells.
+
+        Args:
+            cells (array): A 6x6 boolean matrix with the cells that have to be brought up to date.
+
+        Returns:
+            True if the object doesn't have outdated copies anymore.
+        """
+        if self.dirtyCells is None:
+            return True
+        for r, c in zip(*np.nonzero(cells & self.dirtyCells)):
+            self.TCanvas.queueCoords(self.objects[r][c], self.cellCoordinates(r, c))
+            self.dirtyCells[r][c] = False
+        return not self.dirtyCells.any()
 
     def move(self, dx, dy)->None:
         """
         Moves all the copies of the object by the specified amount.
 
+        The copies are moved through their parity tags, so it takes one command per orientation class instead of one per copy.
+        The commands are sent to tkinter on the next flush of the canvas.
+
         Args:
             dx (float): The displacement in the x direction.
             dy (float): The displacement in the y direction.
         """
         self.position = self.position + np.array([dx,dy])
-        for r in range(6):
-            for c in range(6):
-                particularId = self.objects[r][c]
-                if particularId:
-                    self.TCanvas.canvas.move(particularId, dx, dy)
-                dy = dy * self.TCanvas.hOrientation
-            
-            dx = dx*self.TCanvas.vOrientation
+        TCanvas = self.TCanvas
+        if TCanvas.hOrientation==1 and TCanvas.vOrientation==1:
+            TCanvas.queueMove(self.Tid, dx, dy)
+            return
+        for r in range(2):
+            for c in range(2):
+                TCanvas.queueMove(TCanvas.parityTag(self.Tid, r, c), dx*TCanvas.vOrientation**r, dy*TCanvas.hOrientation**c)
         
 
-    def checkBounds(self)->None:
+    def wrappedPosition(self, position:np.ndarray)->np.ndarray:
         """
-        Checks if the object is out of its global position and moves it back to its corresponding global space if needed.
+        Returns the position brought back to its corresponding global space if it is out of bounds.
+
+        Args:
+            position (array): The position of the object.
         """
-        x = self.position[0]
+        x, y = position
         if x<0:
-            self.move(2*self.TCanvas.dimX, 0)
+            x = x + 2*self.TCanvas.dimX
         elif x>2*self.TCanvas.dimX:
-            self.move(-2*self.TCanvas.dimX, 0)
+            x = x - 2*self.TCanvas.dimX
 
-        y=self.position[1]
         if y<0:
-            self.move(0, 2*self.TCanvas.dimY)
+            y = y + 2*self.TCanvas.dimY
         elif y>2*self.TCanvas.dimY:
-            self.move(0, -2*self.TCanvas.dimY)
+            y = y - 2*self.TCanvas.dimY
+        return np.array([x, y], float)
+
+    def checkBounds(self)->None:
+        """
+        Checks if the object is out of its global position and moves it back to its corresponding global space if needed.
+        """
+        displacement = self.wrappedPosition(self.position) - self.position
+        if displacement.any():
+            self.move(*displacement)
 
     def TMove(self, dx:float, dy:float)->None:
         """
@@ -84,23 +132,17 @@ class topologicalObject:
         
     def hide(self)->None:
         """Makes the object invisible"""
-        for r in range(6):
-            for c in range(6):
-                self.TCanvas.canvas.itemconfig(self.objects[r][c], state = "hidden")
+        self.TCanvas.queueCommand("itemconfigure", self.Tid, "-state", "hidden")
     
     def unhide(self)->None:
         """Makes the object visible"""
-        for r in range(6):
-            for c in range(6):
-                self.TCanvas.canvas.itemconfig(self.objects[r][c], state = "normal")
+        self.TCanvas.queueCommand("itemconfigure", self.Tid, "-state", "normal")
 
     def Traise(self) -> None:
         """
         Brings the object to the front.
         """
-        for r in range(6):
-            for c in range(6):
-                self.TCanvas.canvas.tag_raise(self.objects[r][c])
+        self.TCanvas.queueCommand("raise", self.Tid)
 
     def computeDistanceToPoint(self, point: np.ndarray) -> float:
         """
@@ -112,22 +154,30 @@ class topologicalObject:
         Returns:
             float: The distance to the point.
         """
-        points = self.TCanvas.topologicalPoint(*self.TCanvas.reflectedPoint(point))
-        objectCoodinates = self.position + 2*np.array([self.TCanvas.dimX, self.TCanvas.dimY])
-        distances = []
-        for r in range(6):
-            for c in range(6):
-                vec = points[r][c]-objectCoodinates
-                distances.append(np.dot(vec,vec))
-        return sqrt(min(distances))
+        return float(self.TCanvas.space.distance(point, self.position)[0][0])
+
+    def computeDistanceToPoints(self, points: np.ndarray) -> np.ndarray:
+        """
+        Computes the distance between N global points and the object in a single vectorized step.
+
+        Args:
+            points (array): An Nx2 array with the global points.
+
+        Returns:
+            array: The distance to each point.
+        """
+        return self.TCanvas.space.distance(points, self.position)[:, 0]
         
 
 
 class topologicalLine(topologicalObject):
     """
     Represents a line on a topological canvas.
+
+    Attributes:
+        vertices (array): The normal coordinates of the ends of the copy placed on the cell (0,0).
     """
-    def __init__(self, TCanvas:topologicalCanvas, pInitial: np.ndarray, pFinal: np.ndarray, color:str="black", tags: list[str] = [], zIndex = 0):
+    def __init__(self, TCanvas:topologicalCanvas, pInitial: np.ndarray, pFinal: np.ndarray, color:str="black", tags: list[str] = (), zIndex = 0):
         """
         Creates a line on the topological space.
 
@@ -141,27 +191,34 @@ class topologicalLine(topologicalObject):
         Returns:
             The topological ID of the line.
         """
-        tags.append("Tid"+str(TCanvas.nElements))
-        TCanvas.nElements = TCanvas.nElements+1
+        Tid = TCanvas.newTid()
 
-        initialPoints = TCanvas.topologicalPoint(pInitial[0],pInitial[1])
-        finalPoints = TCanvas.topologicalPoint(pFinal[0],pFinal[1])
+        self.vertices = np.array([pInitial, pFinal], float)
+        copies = TCanvas.cellsCoordinates(self.vertices)
 
         idMatrix = []
 
         for r in range(6):
             idRow = []
             for c in range(6):
-                idRow.append(TCanvas.canvas.create_line(initialPoints[r][c][0], initialPoints[r][c][1], finalPoints[r][c][0], finalPoints[r][c][1], fill=color, tags=tags))
+                idRow.append(TCanvas.renderer.createLine(copies[r][c].tolist(), fill=color, tags=TCanvas.cellTags(tags, Tid, r, c)))
             idMatrix.append(idRow)
-        position = (initialPoints[0][0]+finalPoints[0][0])/2
-        super().__init__(idMatrix,tags[-1], TCanvas, position[0], position[1], zIndex=zIndex)
+        position = (copies[0][0][:2]+copies[0][0][2:])/2
+        super().__init__(idMatrix, Tid, TCanvas, position[0], position[1], zIndex=zIndex)
+
+    def move(self, dx, dy)->None:
+        super().move(dx, dy)
+        self.vertices = self.vertices + np.array([dx, dy])
+
+    def cellCoordinates(self, r:int, c:int)->list[float]:
+        """Returns the flattened normal coordinates of the copy of the cell r,c."""
+        return (self.vertices*self.TCanvas.cellScales[r][c] + self.TCanvas.cellOffsets[r][c]).ravel().tolist()
 
 class topologicalCurve():
     """
     Represents a curve on a topological canvas.
     """
-    def __init__(self, TCanvas:topologicalCanvas, points: list[np.ndarray], color:str = "black", tags: list[str] = [], zIndex = 0):
+    def __init__(self, TCanvas:topologicalCanvas, points: list[np.ndarray], color:str = "black", tags: list[str] = (), zIndex = 0):
         """
         Creates a curve on the topological space.
 
@@ -171,12 +228,57 @@ class topologicalCurve():
             color (str): The color of the curve.
             tags (list[str]): Tags assigned to the object on the canvas.
         """
-        tags.append("Tid"+str(TCanvas.nElements))
-        TCanvas.nElements = TCanvas.nElements+1
+        self.Tid = TCanvas.newTid()
 
         self.segments = []
         for p in range(len(points)-1):
-            self.segments.append(topologicalLine(TCanvas, points[p], points[p+1], color, zIndex=zIndex))
+            self.segments.append(topologicalLine(TCanvas, points[p], points[p+1], color, tags=[*tags, self.Tid], zIndex=zIndex))
+
+
+class topologicalPolyline(topologicalObject):
+    """
+    Represents a curve on a topological canvas drawn as a single line through all its points on each cell.
+
+    Unlike topologicalCurve, which creates a topologicalLine per segment, it creates one item per cell whatever the number of points.
+
+    Attributes:
+        localPoints (list[array]): The local coordinates of the points of the curve.
+        vertices (array): The normal coordinates of the points of the copy placed on the cell (0,0).
+    """
+    def __init__(self, TCanvas:topologicalCanvas, points: list[np.ndarray], color:str = "black", tags: list[str] = (), zIndex = 0):
+        """
+        Creates a polyline on the topological space.
+
+        Args:
+            TCanvas (topologicalCanvas): The topological canvas where the polyline resides.
+            points (list[array]): List of points defining the curve.
+            color (str): The color of the curve.
+            tags (list[str]): Tags assigned to the object on the canvas.
+            zIndex (float): The zIndex of the polyline.
+        """
+        Tid = TCanvas.newTid()
+
+        self.localPoints = list(points)
+        self.vertices = np.array(points, float)
+
+        copies = TCanvas.cellsCoordinates(self.vertices)
+
+        idMatrix = []
+        for r in range(6):
+            idRow = []
+            for c in range(6):
+                idRow.append(TCanvas.renderer.createLine(copies[r][c].tolist(), fill=color, tags=TCanvas.cellTags(tags, Tid, r, c)))
+            idMatrix.append(idRow)
+        position = self.vertices.mean(axis=0)
+        super().__init__(idMatrix, Tid, TCanvas, position[0], position[1], zIndex=zIndex)
+
+    def move(self, dx, dy)->None:
+        super().move(dx, dy)
+        self.vertices = self.vertices + np.array([dx, dy])
+
+    def cellCoordinates(self, r:int, c:int)->list[float]:
+        """Returns the flattened normal coordinates of the copy of the cell r,c."""
+        return (self.vertices*self.TCanvas.cellScales[r][c] + self.TCanvas.cellOffsets[r][c]).ravel().tolist()
 
 
 class topologicalPolygon(topologicalObject):
@@ -186,9 +288,12 @@ class topologicalPolygon(topologicalObject):
     Attributes:
         color (str): The color of the interior of the polygon.
         localVertices (list[array]): A list of the local coordinates of the vertices of the polygon.
+        modelVertices (array): The vertices of the polygon relative to its position, as it was created.
+        poseAngle (float): The angle the polygon is rotated with respect to its model.
+        vertices (array): The current normal coordinates of the vertices of the copy placed on the cell (0,0).
 
     """
-    def __init__(self, TCanvas:topologicalCanvas, pointList: list[np.ndarray], fill:str="black", tags = [], zIndex = 0):
+    def __init__(self, TCanvas:topologicalCanvas, pointList: list[np.ndarray], fill:str="black", tags: list[str] = (), zIndex = 0):
         """
         Creates a polygon on the topological space.
 
@@ -205,14 +310,12 @@ class topologicalPolygon(topologicalObject):
 
         self.color = fill
 
-        tags.append("Tid"+str(TCanvas.nElements))
-        TCanvas.nElements = TCanvas.nElements+1
+        Tid = TCanvas.newTid()
 
         self.localVertices = pointList.copy()
+        self.vertices = np.array(pointList, float)
 
-        vertices = []
-        for point in pointList:
-            vertices.append(TCanvas.topologicalPoint(point[0], point[1]))
+        copies = TCanvas.cellsCoordinates(self.vertices)
 
         idMatrix = []
         
@@ -220,20 +323,66 @@ class topologicalPolygon(topologicalObject):
         for r in range(6):
             idRow = []
             for c in range(6):
-                flattenedList = []
-                for matrix in vertices:
-                    flattenedList = flattenedList + [matrix[r][c][0],matrix[r][c][1]]
                 color = fill
                 if TCanvas.visualHelp and c==2 and r==2:
                     color="red"
-                idRow.append(TCanvas.canvas.create_polygon(flattenedList, tags=tags, fill=color))
+                idRow.append(TCanvas.renderer.createPolygon(copies[r][c].tolist(), fill=color, tags=TCanvas.cellTags(tags, Tid, r, c)))
             idMatrix.append(idRow)
-        position = vertices[0][0][0]
-        for i in range(1,len(vertices)):
-            position = position + vertices[i][0][0]
-        position = position/len(vertices)
+        position = self.vertices.mean(axis=0)
+        self.modelVertices = self.vertices - position
+        self.poseAngle = 0
         
-        super().__init__(idMatrix,tags[-1], TCanvas, position[0], position[1], zIndex=zIndex)
+        super().__init__(idMatrix, Tid, TCanvas, position[0], position[1], zIndex=zIndex)
+
+    def poseVertices(self, position:np.ndarray, angle:float)->np.ndarray:
+        """
+        Returns the vertices of the model placed at a certain pose.
+
+        Args:
+            position (array): The position of the polygon.
+            angle (float): The angle the polygon is rotated with respect to its model.
+        """
+        return self.modelVertices@rotationMatrix(angle).T + position
+
+    def move(self, dx, dy)->None:
+        super().move(dx, dy)
+        self.vertices = self.poseVertices(self.position, self.poseAngle)
+
+    def setPose(self, position:np.ndarray, angle:float)->None:
+        """
+        Places the polygon at a certain position and angle.
+
+        The coordinates of all the copies are computed from the model in a single step and queued as one update per visible copy.
+        The copies placed on cells that can't be seen are rebuilt when they come into view.
+
+        Args:
+            position (array): The new position of the polygon.
+            angle (float): The angle the polygon is rotated with respect to its model.
+        """
+        self.position = np.array(position, float)
+        self.poseAngle = angle
+        self.vertices = self.poseVertices(self.position, angle)
+        self.placeCopies(self.TCanvas.cellsCoordinates(self.vertices))
+
+    def placeCopies(self, copies:np.ndarray)->None:
+        """
+        Queues the coordinates of the visible copies and defers the others.
+
+        Args:
+            copies (array): A 6x6x2N array where the element i,j is the list [x0, y0, x1, y1, ...] of the copy on the i,j cell, as returned by cellsCoordinates.
+        """
+        visibleCells = self.TCanvas.visibleCells
+        for r in range(6):
+            for c in range(6):
+                if self.objects[r][c]:
+                    if visibleCells[r][c]:
+                        self.TCanvas.queueCoords(self.objects[r][c], copies[r][c].tolist())
+                    else:
+                        self._defer(r, c)
+
+    def cellCoordinates(self, r:int, c:int)->list[float]:
+        """Returns the flattened normal coordinates of the copy of the cell r,c."""
+        return (self.vertices*self.TCanvas.cellScales[r][c] + self.TCanvas.cellOffsets[r][c]).ravel().tolist()
 
     def TRotation(self, rads: float)->None:
         """
@@ -242,34 +391,10 @@ class topologicalPolygon(topologicalObject):
         Args:
             rads (float): The angle of rotation.
         """
-        rotation = rotationMatrix(rads)
-        
-        vertices = np.array(self.TCanvas.canvas.coords(self.objects[0][0])).reshape(-1, 2)
-        
-        rotatedVertices = (vertices -self.position)@rotation.T + self.position
-        
-        rotatedCopies = []
-        for r in range(6):
-            rList = []
-            for c in range(6):
-                rList.append([])
-            rotatedCopies.append(rList)
-        
-        for point in rotatedVertices:
-            tPoint = self.TCanvas.topologicalPoint(point[0], point[1])
-            for r in range(6):
-                for c in range(6):
-                    if self.objects[r][c]:
-                        rotatedCopies[r][c].append(tPoint[r][c][0])
-                        rotatedCopies[r][c].append(tPoint[r][c][1])
-        for r in range(6):
-            for c in range(6):
-                if self.objects[r][c]:
-                    objId = self.objects[r][c]
-                    self.TCanvas.canvas.coords(objId, *rotatedCopies[r][c])
+        self.setPose(self.position, self.poseAngle + rads)
 
     @classmethod
-    def rectangle(cls, TCanvas:topologicalCanvas, center: np.array, hight: float, width:float, angle: float, fill:str="black", tags=[], zIndex=0):
+    def rectangle(cls, TCanvas:topologicalCanvas, center: np.array, hight: float, width:float, angle: float, fill:str="black", tags: list[str] = (), zIndex=0):
         """
         Creates a rectangle.
 
@@ -283,17 +408,10 @@ class topologicalPolygon(topologicalObject):
             tags (list[str]): Tags assigned to the object of the canvas.
             zIndex (float): Its zIndex.
         """
-        vector1 = direction2D(angle)
-        vector2 = np.array([vector1[1], -vector1[0]])
-        vertex1 = center+(width*vector2 - hight*vector1)/2
-        vertex2 = center+(width*vector2 + hight*vector1)/2
-        vertex3 = center+(-width*vector2 + hight*vector1)/2
-        vertex4 = center+(-width*vector2 - hight*vector1)/2
-
-        return cls(TCanvas, [vertex1, vertex2, vertex3, vertex4], fill, tags, zIndex)
+        return cls(TCanvas, rectangleVertices(center, hight, width, angle), fill, tags, zIndex)
     
     @classmethod
-    def square(cls, TCanvas:topologicalCanvas, center: np.array, size:float, angle: float, fill:str="black", tags=[], zIndex=0):
+    def square(cls, TCanvas:topologicalCanvas, center: np.array, size:float, angle: float, fill:str="black", tags: list[str] = (), zIndex=0):
         """
         Creates a square.
 
@@ -374,7 +492,7 @@ class topologicalThickCurve(topologicalPolygon):
         offset1 (list[array]): A list of one of the offsets of the curve.
         offset2 (list[array]): A list of the other of the offsets of the curve.
     """
-    def __init__(self, TCanvas:topologicalCanvas, points:list[np.array], amplitude: list[float], fill: str="black", zIndex = 0, tags: list[str] = []):
+    def __init__(self, TCanvas:topologicalCanvas, points:list[np.array], amplitude: list[float], fill: str="black", zIndex = 0, tags: list[str] = ()):
         """
         It generates the thick line.
         
@@ -410,22 +528,7 @@ class topologicalThickCurve(topologicalPolygon):
 
     def _createOffset(self)->None:
         """Given a curve (list of points), creates an offset to each side."""
-        curve = self.center
-        amplitudes = self.amplitudes
-        offset1 = []
-        offset2 = []
-
-        for i in range(len(curve)-1):
-            tangent = curve[i+1]-curve[i]
-            orto = np.array([-tangent[1], tangent[0]])
-            orto = 0.5*amplitudes[i]*orto/np.linalg.norm(orto)
-            offset1.append(curve[i]+orto)
-            offset2.append(curve[i]-orto)
-        orto = np.array([-tangent[1], tangent[0]])
-        orto = 0.5*amplitudes[-1]*orto/np.linalg.norm(orto)
-        offset1.append(curve[-1]+orto)
-        offset2.append(curve[-1]-orto)
-        return [offset1,offset2]
+        return curveOffsets(self.center, self.amplitudes)
     
     def getStart(self)->np.ndarray:
         """Returns the start of the curve, precisely it returns the first point of each offset"""
@@ -1,21 +1,32 @@
 import numpy as np
 
-from topologicalObjects import topologicalPolygon, topologicalThickCurve, topologicalCurve
+from topologicalObjects import topologicalPolygon, topologicalThickCurve, topologicalPolyline
 from topologicalCanvas import topologicalCanvas
+from filesManager import loadTerrainRaster, saveTerrainRaster, loadTrackImages, saveTrackImages
+from simulation import terrainField
+from tracks import pseudoCircleTrack, ZHomologyTrack
 from constants import *
 
 
 class topologicalRoad():
     def __init__(self, TCanvas: topologicalCanvas, pointsList: list[np.ndarray], amplitude: float, zIndex=0):
         self.TCanvas = TCanvas
-        self.road = topologicalThickCurve(TCanvas, pointsList, [amplitude], fill=BGCOLOR_2, zIndex=zIndex)
-        self.line1 = topologicalCurve(TCanvas, self.road.offset1, color=DETAILS_COLOR, zIndex=zIndex)
-        self.line2 = topologicalCurve(TCanvas, self.road.offset2, color=DETAILS_COLOR, zIndex=zIndex)
+        self.road = topologicalThickCurve(TCanvas, pointsList, [amplitude], fill=BGCOLOR_2, zIndex=zIndex, tags=[STATIC_TAG])
+        self.line1 = topologicalPolyline(TCanvas, self.road.offset1, color=DETAILS_COLOR, tags=[STATIC_TAG], zIndex=zIndex)
+        self.line2 = topologicalPolyline(TCanvas, self.road.offset2, color=DETAILS_COLOR, tags=[STATIC_TAG], zIndex=zIndex)
         
 
 
 class terrainManager:
-    """A class to manage terrains."""
+    """A class to manage terrains.
+
+    The lookups are delegated to a terrainField, so the canvas only holds the visual representation of the terrains.
+
+    Attributes:
+        TCanvas (topologicalCanvas): The topological canvas where the terrains live.
+        terrains (list[topologicalPolygon]): The terrains sorted by zIndex (highest first).
+        field (terrainField): The terrain properties of the local space.
+    """
     def __init__(self, TCanvas: topologicalCanvas, backgroundFriction:float = 8, backgoundGrip: float = 10, backgroundTraction: float = 5):
         """Initializes the terrain manager.
         Args:
@@ -26,6 +37,14 @@ class terrainManager:
         self.backgroundFriction = backgroundFriction
         self.backgoundGrip = backgoundGrip
         self.backgroundTraction = backgroundTraction
+        self._buildField()
+
+    def _buildField(self):
+        """Rebuilds the terrain field from the current terrains."""
+        self.field = terrainField(self.TCanvas.space,
+                                  [terrain.localVertices for terrain in self.terrains],
+                                  [[terrain.friction, terrain.grip, terrain.traction] for terrain in self.terrains],
+                                  [self.backgroundFriction, self.backgoundGrip, self.backgroundTraction])
     
     def addTerrain(self, newTerrain: topologicalPolygon, friction: float, grip: float, traction: float):
         """Adds a terrain to the terrain manager.
@@ -44,123 +63,91 @@ class terrainManager:
         for iTerrain in range(nTerrains):
             if self.terrains[iTerrain].zIndex<newTerrain.zIndex:
                 self.terrains.insert(iTerrain,newTerrain)
-                return
-        self.terrains.append(newTerrain)
+                break
+        else:
+            self.terrains.append(newTerrain)
+        self._buildField()
+
+    def compileRaster(self, mapName:str=None, spaceName:str=None, cellSize:float=1, blend:bool=False)->None:
+        """Compiles the terrains into a raster, so getFriction becomes an array lookup.
+
+        If the names of the map and the space are given, the raster is cached on disk and reused by the following races on the same track.
+
+        Args:
+            mapName (str): The private name of the map.
+            spaceName (str): The private name of the space.
+            cellSize (float): The size of a pixel of the raster in local units.
+            blend (bool): If True, the values are blended bilinearly, which smooths the borders of the roads.
+        """
+        cache = mapName is not None and spaceName is not None
+        key = self.field.geometryHash(cellSize)
+        raster = loadTerrainRaster(mapName, spaceName, key) if cache else None
+        self.field.compileRaster(cellSize, blend, raster)
+        if cache and raster is None:
+            saveTerrainRaster(mapName, spaceName, key, self.field.raster)
+
+    def findTerrain(self, point:np.ndarray)->topologicalPolygon:
+        """Given a point, it returns the terrain with highest zIndex that contains the point or None if there isn't any."""
+        iTerrain = self.field.findPolygon(point)
+        if iTerrain==-1:
+            return None
+        return self.terrains[iTerrain]
         
     def detectTerrain(self, point:np.ndarray)->str:
         """Given a point, it returns the TID of the terrain with highest zIndex that contains the point"""
-        for terrain in self.terrains:
-            if terrain.checkIfPointInside(point):
-                return terrain.Tid
+        terrain = self.findTerrain(point)
+        if terrain:
+            return terrain.Tid
     
     def getFriction(self, point:np.ndarray)->list[float]:
         """Given a point, it returns the friction and grip of the terrain with highest zIndex that contains the point.
         Args:
             point (array): The coordinates of the point.
         Returns:
-            A list with format [friction, grip].
+            A list with format [friction, grip, traction].
         """
-        for terrain in self.terrains:
-            if terrain.checkIfPointInside(point):
-                return terrain.friction, terrain.grip, terrain.traction
-        return self.backgroundFriction, self.backgoundGrip, self.backgroundTraction
+        return self.field.getFriction(point)
 
 
-def topologicalPseudoCircle(TCanvas:topologicalCanvas)->terrainManager:
-    """Returns the pseudocircle map"""
-    x = TCanvas.dimX
-    y = TCanvas.dimY
-    thickness = 50
-    radius = 1/2
-    precision = 42
+def buildTrack(TCanvas:topologicalCanvas, track:dict)->terrainManager:
+    """Draws a track (see tracks.py) and returns its terrain manager."""
+    roads = [topologicalRoad(TCanvas, road["points"], road["thickness"]) for road in track["roads"]]
+    terrain = terrainManager(TCanvas, *track["background"])
+    for TRoad, road in zip(roads, track["roads"]):
+        terrain.addTerrain(TRoad.road, road["friction"], road["grip"], road["traction"])
+    return terrain
 
-    halfCircle1 = [radius*np.array([x*np.sin(np.pi*alpha/((precision)*2-4)),y*np.cos(np.pi*alpha/((precision)*2-4))]) for alpha in range(precision)]
-    halfCircle2 = [np.array([x,y])-point for point in halfCircle1]
-    road1 = topologicalRoad(TCanvas, halfCircle1, thickness)
-    road2 = topologicalRoad(TCanvas, halfCircle2, thickness)
 
+def bakeStaticLayer(TCanvas:topologicalCanvas, mapName:str, spaceName:str, useCache:bool = True)->None:
+    """Draws the static geometry of the track as one image per cell.
 
-    terrain = terrainManager(TCanvas, 8, 8, 5)
-    terrain.addTerrain(road1.road, 5, 10, 12)
-    terrain.addTerrain(road2.road, 5, 10, 12)
-    return terrain
+    The renderer of the canvas has to be a bakingRenderer, which has kept the static items. The images are cached on disk, so the
+    following races on the same track only load them.
 
-def ZHomology(TCanvas:topologicalCanvas) -> terrainManager:
-    x = TCanvas.dimX
-    y = TCanvas.dimY
-    thickness = 50
-    
-    semiCirclePrecision = 20
-    semiCircleRadius = x/6
-    lin = np.linspace(0, 1, semiCirclePrecision)
-    angles = lin*lin*(3-2*lin)
-    s = 0.7
-    angles = (lin*(1-s)+s*angles)*np.pi
-    xCoords = semiCircleRadius*np.cos(angles)+x/2
-    yCoords = -semiCircleRadius*np.sin(angles)+y
-    semiCircle = np.column_stack((xCoords, yCoords))
-    TsemiCircle = topologicalRoad(TCanvas, semiCircle, thickness)
-
-
-    linePrecision = 10
-    startPointLineL = np.array([x/3, y/2])
-    endPointLineL = np.array([x/3, 0])
-    lineL = np.linspace(startPointLineL, endPointLineL, linePrecision)
-    TlineL = topologicalRoad(TCanvas, lineL, thickness)
-
-    startPointLineR = np.array([2*x/3, y/2])
-    endPointLineR = np.array([2*x/3, 0])
-    lineR = np.linspace(startPointLineR, endPointLineR, 10)
-    TlineR = topologicalRoad(TCanvas, lineR, thickness)
-
-    sigmoidPrecision = 15
-    sigmoid = lambda x: 1/(1+np.exp(-x))
-    ySigmoid = np.linspace(y/2, y+1, sigmoidPrecision)
-    xSigmoidR = sigmoid(np.linspace(-6, 6, sigmoidPrecision))*x/6+2*x/3
-    sigmoidR = np.column_stack((xSigmoidR, ySigmoid))
-    TSigmoidR = topologicalRoad(TCanvas, sigmoidR, thickness)
-
-    xSigmoidL = x-xSigmoidR
-    sigmoidL = np.column_stack((xSigmoidL, ySigmoid))
-    TSigmoidL = topologicalRoad(TCanvas, sigmoidL, thickness)
-
-    quarterCirclesPrecision = 17
-    angles = -(1-(1-np.linspace(0, 1, quarterCirclesPrecision))**2)*np.pi/2
-    xQuarterCircleL = np.cos(angles)*y/6
-    xQuarterCircleR = x-xQuarterCircleL
-    yQuarterCircleL = np.sin(angles)
-
-    smallQuarterCircleRadius = y/3
-    yQuarterCircleSmallL = -yQuarterCircleL*smallQuarterCircleRadius
-    yQuarterCircleSmallR = yQuarterCircleSmallL
-
-    quarterCircleSmallL = np.column_stack((xQuarterCircleL, yQuarterCircleSmallL))
-    TquarterCircleSmallL = topologicalRoad(TCanvas, quarterCircleSmallL, thickness)
-    quarterCircleSmallR = np.column_stack((xQuarterCircleR, yQuarterCircleSmallR))
-    TquarterCircleSmallR = topologicalRoad(TCanvas, quarterCircleSmallR, thickness)
-
-    bigQuarterCircleRadius = y-smallQuarterCircleRadius
-    yQuarterCircleBigL = -yQuarterCircleL*bigQuarterCircleRadius
-    yQuarterCircleBigR = yQuarterCircleBigL
-
-    quarterCircleBigL = np.column_stack((xQuarterCircleL, yQuarterCircleBigL))
-    TquarterCircleBigL = topologicalRoad(TCanvas, quarterCircleBigL, thickness)
-    quarterCircleBigR = np.column_stack((xQuarterCircleR, yQuarterCircleBigR))
-    TquarterCircleBigR = topologicalRoad(TCanvas, quarterCircleBigR, thickness)
-
-
-    terrain = terrainManager(TCanvas, 60, 8, 5)
-    terrain.addTerrain(TsemiCircle.road, 5, 10, 12)
-    terrain.addTerrain(TlineL.road, 5, 10, 12)
-    terrain.addTerrain(TlineR.road, 5, 10, 12)
-    terrain.addTerrain(TSigmoidL.road, 5, 10, 12)
-    terrain.addTerrain(TSigmoidR.road, 5, 10, 12)
-    terrain.addTerrain(TquarterCircleBigL.road, 5, 10, 12)
-    terrain.addTerrain(TquarterCircleBigR.road, 5, 10, 12)
-    terrain.addTerrain(TquarterCircleSmallL.road, 5, 10, 12)
-    terrain.addTerrain(TquarterCircleSmallR.road, 5, 10, 12)
+    Args:
+        TCanvas (topologicalCanvas): The topological canvas of the race.
+        mapName (str): The private name of the map.
+        spaceName (str): The private name of the space.
+        useCache (bool): If False, the images are always baked and nothing is written to disk.
+    """
+    renderer = TCanvas.renderer
+    dimX, dimY = int(TCanvas.dimX), int(TCanvas.dimY)
+    key = renderer.staticKey(dimX, dimY)
+    images = loadTrackImages(mapName, spaceName, key) if useCache else None
+    if images is None:
+        images = renderer.bakeImages(dimX, dimY, BGCOLOR)
+        if useCache:
+            saveTrackImages(mapName, spaceName, key, images)
+    renderer.placeImages(images, dimX, dimY)
 
-    return terrain
+
+def topologicalPseudoCircle(TCanvas:topologicalCanvas)->terrainManager:
+    """Returns the pseudocircle map"""
+    return buildTrack(TCanvas, pseudoCircleTrack(TCanvas.dimX, TCanvas.dimY))
+
+def ZHomology(TCanvas:topologicalCanvas) -> terrainManager:
+    """Returns the Z-homology map"""
+    return buildTrack(TCanvas, ZHomologyTrack(TCanvas.dimX, TCanvas.dimY))
 
 
 if __name__=="__main__":
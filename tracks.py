@@ -0,0 +1,178 @@
+"""
+The geometry of the race tracks, independent of any canvas.
+
+A track is a dictionary of the form {"background": [friction, grip, traction], "roads": [road, ...]}.
+Each road is a dictionary of the form {"points": array, "thickness": float, "friction": f, "grip": g, "traction": t}.
+The first road is where the finish line is placed.
+"""
+import numpy as np
+
+from Tmath import curveOffsets, rectangleVertices, quotientSpace
+from constants import *
+
+
+def createRoad(points: np.ndarray, thickness: float, friction: float = 5, grip: float = 10, traction: float = 12)->dict:
+    """Returns a road of a track.
+    Args:
+        points (array): The local points of the center line of the road.
+        thickness (float): The width of the road.
+        friction (float): The friction of the road.
+        grip (float): The grip of the road.
+        traction (float): The traction of the road.
+    """
+    return {"points": np.asarray(points, float), "thickness": thickness, "friction": friction, "grip": grip, "traction": traction}
+
+
+def roadPolygon(road: dict)->list[np.ndarray]:
+    """Returns the local vertices of the polygon covered by a road."""
+    offset1, offset2 = curveOffsets(road["points"], [road["thickness"]]*len(road["points"]))
+    return offset1 + offset2[::-1]
+
+
+def finishLineGeometry(road: dict, size: float = 20)->dict:
+    """Returns the geometry of the finish line placed at the start of a road.
+
+    The width of the line is rounded up so it is filled with squares of side size/3.
+
+    Args:
+        road (dict): The road where the finish line is placed.
+        size (float): The height of the finish line.
+    Returns:
+        A dictionary of the form {"center": c, "angle": a, "height": h, "width": w, "vertices": [v1, v2, v3, v4]}.
+    """
+    squareSide = size/3
+    nSquare = int(np.ceil(road["thickness"]/squareSide))
+    width = nSquare*squareSide
+    center = road["points"][0]
+    direction = road["points"][1]-road["points"][0]
+    angle = np.arctan2(direction[1], direction[0])
+    return {"center": center, "angle": angle, "height": size, "width": width, "vertices": rectangleVertices(center, size, width, angle)}
+
+
+def pseudoCircleTrack(x: float, y: float)->dict:
+    """Returns the pseudocircle track for a local space of size x, y."""
+    thickness = 50
+    radius = 1/2
+    precision = 42
+
+    halfCircle1 = [radius*np.array([x*np.sin(np.pi*alpha/((precision)*2-4)),y*np.cos(np.pi*alpha/((precision)*2-4))]) for alpha in range(precision)]
+    halfCircle2 = [np.array([x,y])-point for point in halfCircle1]
+
+    roads = [createRoad(halfCircle1, thickness), createRoad(halfCircle2, thickness)]
+    return {"background": [8, 8, 5], "roads": roads}
+
+
+def ZHomologyTrack(x: float, y: float)->dict:
+    """Returns the Z-homology track for a local space of size x, y."""
+    thickness = 50
+
+    semiCirclePrecision = 20
+    semiCircleRadius = x/6
+    lin = np.linspace(0, 1, semiCirclePrecision)
+    angles = lin*lin*(3-2*lin)
+    s = 0.7
+    angles = (lin*(1-s)+s*angles)*np.pi
+    xCoords = semiCircleRadius*np.cos(angles)+x/2
+    yCoords = -semiCircleRadius*np.sin(angles)+y
+    semiCircle = np.column_stack((xCoords, yCoords))
+
+
+    linePrecision = 10
+    startPointLineL = np.array([x/3, y/2])
+    endPointLineL = np.array([x/3, 0])
+    lineL = np.linspace(startPointLineL, endPointLineL, linePrecision)
+
+    startPointLineR = np.array([2*x/3, y/2])
+    endPointLineR = np.array([2*x/3, 0])
+    lineR = np.linspace(startPointLineR, endPointLineR, 10)
+
+    sigmoidPrecision = 15
+    sigmoid = lambda x: 1/(1+np.exp(-x))
+    ySigmoid = np.linspace(y/2, y+1, sigmoidPrecision)
+    xSigmoidR = sigmoid(np.linspace(-6, 6, sigmoidPrecision))*x/6+2*x/3
+    sigmoidR = np.column_stack((xSigmoidR, ySigmoid))
+
+    xSigmoidL = x-xSigmoidR
+    sigmoidL = np.column_stack((xSigmoidL, ySigmoid))
+
+    quarterCirclesPrecision = 17
+    angles = -(1-(1-np.linspace(0, 1, quarterCirclesPrecision))**2)*np.pi/2
+    xQuarterCircleL = np.cos(angles)*y/6
+    xQuarterCircleR = x-xQuarterCircleL
+    yQuarterCircleL = np.sin(angles)
+
+    smallQuarterCircleRadius = y/3
+    yQuarterCircleSmallL = -yQuarterCircleL*smallQuarterCircleRadius
+    yQuarterCircleSmallR = yQuarterCircleSmallL
+
+    quarterCircleSmallL = np.column_stack((xQuarterCircleL, yQuarterCircleSmallL))
+    quarterCircleSmallR = np.column_stack((xQuarterCircleR, yQuarterCircleSmallR))
+
+    bigQuarterCircleRadius = y-smallQuarterCircleRadius
+    yQuarterCircleBigL = -yQuarterCircleL*bigQuarterCircleRadius
+    yQuarterCircleBigR = yQuarterCircleBigL
+
+    quarterCircleBigL = np.column_stack((xQuarterCircleL, yQuarterCircleBigL))
+    quarterCircleBigR = np.column_stack((xQuarterCircleR, yQuarterCircleBigR))
+
+    centers = [semiCircle, lineL, lineR, sigmoidR, sigmoidL, quarterCircleSmallL, quarterCircleSmallR, quarterCircleBigL, quarterCircleBigR]
+    roads = [createRoad(center, thickness) for center in centers]
+    return {"background": [60, 8, 5], "roads": roads}
+
+
+def selectTrack(map: str, x: float, y: float)->dict:
+    """Returns the desired track.
+    Args:
+        map (str): The private name of the map.
+        x (float): The width of the local space.
+        y (float): The height of the local space.
+    """
+    if map==MAP1_PRIVATE_NAME:
+        return pseudoCircleTrack(x, y)
+    if map==MAP2_PRIVATE_NAME:
+        return ZHomologyTrack(x, y)
+    raise ValueError("Unknown map: " + str(map))
+
+
+def trackRoute(space: quotientSpace, track: dict)->np.ndarray:
+    """Returns the center line of a lap of a track: the roads chained where the space glues their ends.
+
+    The lap starts at the finish line, runs along the first road and ends where it started. The ends of two roads are chained if they are closer than the width of the road.
+    The ends of the roads are taken a little inside them, since a point that lies exactly on a glued side may be brought to the wrong side.
+
+    Args:
+        space (quotientSpace): The space where the track lives.
+        track (dict): The track (see selectTrack).
+    Returns:
+        An Nx2 array with the local points of the lap, in order.
+    """
+    roads = track["roads"]
+
+    def inner(points):
+        points = points.copy()
+        points[[0, -1]] += 1e-3*(points[[1, -2]]-points[[0, -1]])
+        return points
+
+    def glued(point, otherPoint, thickness):
+        return space.distance(point[None], otherPoint[None])[0, 0]<thickness
+
+    start = inner(roads[0]["points"])[0]
+
+    def extend(route, used):
+        end = route[-1][-1]
+        if len(route)>1 and glued(end, start, roads[0]["thickness"]):
+            return route
+        for index, road in enumerate(roads):
+            if index in used:
+                continue
+            for points in (inner(road["points"]), inner(road["points"][::-1])):
+                if glued(end, points[0], road["thickness"]):
+                    lap = extend(route + [points], used | {index})
+                    if lap is not None:
+                        return lap
+        return None
+
+    lap = extend([inner(roads[0]["points"])], {0})
+    if lap is None:
+        raise ValueError("The roads of the track don't close a lap on this space")
+    return np.concatenate(lap)
@@ -0,0 +1,284 @@
+"""
+The storage of the trajectories of the cars.
+
+A trajectory is a sequence of samples with the time, the global position and the angle of a car.
+In memory it is a structured NumPy array with the columns of TRAJECTORY_DTYPE.
+"""
+import numpy as np
+
+from Tmath import quotientSpace
+from simulation import interpolatePositions
+
+
+TRAJECTORY_DTYPE = np.dtype([("t", np.float64), ("x", np.float32), ("y", np.float32), ("angle", np.float32)])
+
+
+class trajectoryBuffer:
+    """A growable buffer of trajectory samples.
+
+    The samples are written on a preallocated structured array whose capacity is doubled when it is full, so recording a sample doesn't allocate.
+
+    Attributes:
+        buffer (array): The structured array where the samples are stored. Only the first size rows are valid.
+        size (int): The number of samples recorded.
+    """
+    def __init__(self, capacity: int = 4096):
+        """Creates an empty buffer.
+        Args:
+            capacity (int): The number of samples that can be recorded before the buffer grows.
+        """
+        self.size = 0
+        self._allocate(max(capacity, 1))
+
+    def _allocate(self, capacity: int)->None:
+        """Moves the samples to a new array with a certain capacity."""
+        buffer = np.empty(capacity, TRAJECTORY_DTYPE)
+        if self.size:
+            buffer[:self.size] = self.buffer[:self.size]
+        self.buffer = buffer
+        self._columns = [buffer["t"], buffer["x"], buffer["y"], buffer["angle"]]
+
+    def __len__(self)->int:
+        return self.size
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    @property
+    def data(self)->np.ndarray:
+        """A view of the recorded samples."""
+        return self.buffer[:self.size]
+
+    @property
+    def capacity(self)->int:
+        return len(self.buffer)
+
+    def append(self, x: float, y: float, angle: float, t: float)->None:
+        """Records a sample.
+        Args:
+            x (float): The x coordinate of the car.
+            y (float): The y coordinate of the car.
+            angle (float): The angle of the car.
+            t (float): The time of the sample.
+        """
+        if self.size==len(self.buffer):
+            self._allocate(2*len(self.buffer))
+        columnT, columnX, columnY, columnAngle = self._columns
+        columnT[self.size] = t
+        columnX[self.size] = x
+        columnY[self.size] = y
+        columnAngle[self.size] = angle
+        self.size += 1
+
+    def clear(self)->None:
+        """Removes all the samples, keeping the capacity."""
+        self.size = 0
+
+    def toRecords(self)->list[dict]:
+        """Returns the samples as a list of dictionaries of the form {"x": x, "y": y, "angle": a, "t": t}."""
+        data = self.data
+        return [{"x": x, "y": y, "angle": angle, "t": t} for t, x, y, angle in zip(data["t"].tolist(), data["x"].tolist(), data["y"].tolist(), data["angle"].tolist())]
+
+    @classmethod
+    def fromRecords(cls, records: list[dict]):
+        """Creates a buffer from a list of dictionaries of the form {"x": x, "y": y, "angle": a, "t": t}."""
+        trajectory = cls(len(records))
+        for record in records:
+            trajectory.append(record["x"], record["y"], record["angle"], record["t"])
+        return trajectory
+
+
+class trajectoryResampler:
+    """Records a trajectory on a fixed time grid, whatever the rate at which the samples arrive.
+
+    Each time a sample arrives, the points of the grid between the previous sample and the new one are interpolated and recorded.
+    The positions are interpolated through the gluing, so a teleport to the global space doesn't produce a sample in the middle of the canvas.
+
+    Attributes:
+        buffer (trajectoryBuffer): The buffer where the resampled trajectory is recorded.
+        space (quotientSpace): The space where the positions live.
+        rate (float): The number of samples per second.
+        nextSample (int): The index of the next point of the grid.
+        last (tuple): The last sample received (t, x, y, angle).
+    """
+    def __init__(self, space: quotientSpace, rate: float = 30, buffer: trajectoryBuffer = None):
+        self.space = space
+        self.rate = rate
+        self.buffer = buffer if buffer is not None else trajectoryBuffer()
+        self.nextSample = 0
+        self.last = None
+
+    def append(self, x: float, y: float, angle: float, t: float)->None:
+        """Receives a sample of the trajectory.
+        Args:
+            x (float): The x coordinate of the car.
+            y (float): The y coordinate of the car.
+            angle (float): The angle of the car.
+            t (float): The time of the sample.
+        """
+        if self.last is None or t<=self.last[0]:
+            if self.nextSample/self.rate<=t:
+                self.buffer.append(x, y, angle, t)
+                self.nextSample = int(np.floor(t*self.rate))+1
+            self.last = (t, x, y, angle)
+            return
+
+        lastT, lastX, lastY, lastAngle = self.last
+        while self.nextSample/self.rate<=t:
+            sampleT = self.nextSample/self.rate
+            alpha = (sampleT-lastT)/(t-lastT)
+            position = interpolatePositions(self.space, np.array([[lastX, lastY]]), np.array([[x, y]]), alpha)[0]
+            self.buffer.append(position[0], position[1], lastAngle + alpha*(angle-lastAngle), sampleT)
+            self.nextSample += 1
+        self.last = (t, x, y, angle)
+
+    def finish(self)->None:
+        """Records the last sample received if it isn't on the grid, so the trajectory ends at the exact final time."""
+        if self.last and (len(self.buffer)==0 or self.buffer.data["t"][-1]<self.last[0]):
+            self.buffer.append(self.last[1], self.last[2], self.last[3], self.last[0])
+
+
+def unwrapPositions(space: quotientSpace, positions: np.ndarray)->tuple[np.ndarray]:
+    """Removes the teleports to the global space from a sequence of positions.
+    Returns:
+        The continuous positions and a boolean array that is True where the sample i was teleported from the sample i-1.
+    """
+    limits = 2*space.dims
+    steps = np.diff(positions, axis=0)
+    shifts = np.round(steps/limits)*limits
+    jumps = np.concatenate(([False], (shifts!=0).any(axis=1)))
+    return positions - np.concatenate(([[0, 0]], np.cumsum(shifts, axis=0))), jumps
+
+
+def simplifyTrajectory(data: np.ndarray, space: quotientSpace, tolerance: float = 0.5, angleTolerance: float = 0.01)->np.ndarray:
+    """Removes the samples of a trajectory that can be interpolated from their neighbours with a bounded error.
+
+    It uses the Douglas-Peucker algorithm with the error measured at the time of each sample, so the replay at any time stays within the
+    tolerance. The samples on both sides of a teleport to the global space are always kept.
+
+    Args:
+        data (array): The trajectory (a structured array with the columns of TRAJECTORY_DTYPE).
+        space (quotientSpace): The space where the positions live.
+        tolerance (float): The maximum distance between the original and the simplified positions.
+        angleTolerance (float): The maximum difference between the original and the simplified angles.
+    Returns:
+        The simplified trajectory.
+    """
+    nSamples = len(data)
+    if nSamples<3:
+        return data.copy()
+    t = data["t"].astype(np.float64)
+    angle = data["angle"].astype(np.float64)
+    positions, jumps = unwrapPositions(space, np.column_stack((data["x"], data["y"])).astype(np.float64))
+
+    keep = np.zeros(nSamples, bool)
+    keep[[0, -1]] = True
+    jumpIds = np.flatnonzero(jumps)
+    keep[jumpIds] = True
+    keep[jumpIds-1] = True
+
+    anchors = np.flatnonzero(keep)
+    segments = [(start, end) for start, end in zip(anchors[:-1], anchors[1:]) if end-start>1]
+    while segments:
+        start, end = segments.pop()
+        inner = np.arange(start+1, end)
+        alpha = ((t[inner]-t[start])/(t[end]-t[start]))[:, None]
+        positionError = np.linalg.norm(positions[inner] - (positions[start] + alpha*(positions[end]-positions[start])), axis=1)
+        angleError = np.abs(angle[inner] - (angle[start] + alpha[:, 0]*(angle[end]-angle[start])))
+        error = np.maximum(positionError/tolerance, angleError/angleTolerance)
+        worst = np.argmax(error)
+        if error[worst]>1:
+            split = inner[worst]
+            keep[split] = True
+            segments += [(a, b) for a, b in ((start, split), (split, end)) if b-a>1]
+    return data[keep].copy()
+
+
+def deltaEncode(values: np.ndarray, quantum: float)->np.ndarray:
+    """Quantizes a column and returns the differences between consecutive values (the first one is kept as it is)."""
+    quantized = np.round(np.asarray(values, np.float64)/quantum).astype(np.int64)
+    return np.diff(quantized, prepend=0).astype(np.int32)
+
+
+def deltaDecode(deltas: np.ndarray, quantum: float)->np.ndarray:
+    """Inverts deltaEncode."""
+    return np.cumsum(deltas, dtype=np.int64)*quantum
+
+
+class multiTrajectoryPlayer:
+    """Plays several recorded trajectories back at once.
+
+    The trajectories are concatenated into the same contiguous arrays, so sampling all of them at a certain time is a single vectorized
+    interpolation. Each trajectory is closed with a copy of its last sample, so every trajectory has a segment of duration 0 where it
+    stays once it has finished. There is one cursor per trajectory, and they advance together.
+
+    Attributes:
+        space (quotientSpace): The space where the positions live.
+        t (array): The time of each sample.
+        x (array): The x coordinate of each sample.
+        y (array): The y coordinate of each sample.
+        angle (array): The angle of each sample.
+        dx (array): The displacement in x of each segment.
+        dy (array): The displacement in y of each segment.
+        dAngle (array): The rotation of each segment.
+        firstSegment (array): The index of the first segment of each trajectory.
+        lastSegment (array): The index of the last segment of each trajectory.
+        cursors (array): The index of the segment of the last sample of each trajectory.
+        maxScan (int): The number of segments the cursors advance before using a binary search.
+    """
+    def __init__(self, records: list, space: quotientSpace, maxScan: int = 8):
+        """Prepares the playback.
+        Args:
+            records (list): The trajectories. Anything indexable by the column names (a structured array or a dictionary of arrays).
+            space (quotientSpace): The space where the positions live.
+            maxScan (int): The number of segments the cursors advance before using a binary search.
+        """
+        self.space = space
+        columns = {}
+        for name in ("t", "x", "y", "angle"):
+            columns[name] = np.concatenate([np.append(record[name], record[name][-1]) for record in records]).astype(np.float64) if records else np.zeros(0)
+        self.t, self.x, self.y, self.angle = columns["t"], columns["x"], columns["y"], columns["angle"]
+        self.limits = 2*space.dims
+
+        lengths = np.array([len(record["t"])+1 for record in records], int)
+        ends = np.cumsum(lengths)
+        self.firstSegment = ends - lengths
+        self.lastSegment = ends - 2
+
+        self.dx = np.diff(self.x, append=0)
+        self.dx -= np.round(self.dx/self.limits[0])*self.limits[0]
+        self.dy = np.diff(self.y, append=0)
+        self.dy -= np.round(self.dy/self.limits[1])*self.limits[1]
+        self.dAngle = (np.diff(self.angle, append=0)+np.pi)%(2*np.pi)-np.pi
+        self.duration = np.diff(self.t, append=0)
+
+        self.cursors = self.firstSegment.copy()
+        self.maxScan = maxScan
+
+    def __len__(self)->int:
+        return len(self.firstSegment)
+
+    def seek(self, time: float)->np.ndarray:
+        """Returns the index of the segment of each trajectory that contains a time (the first or the last one if it is out of the trajectory)."""
+        cursors = self.cursors
+        t = self.t
+        lost = t[cursors]>time
+        for _ in range(self.maxScan):
+            advance = (cursors<self.lastSegment) & (t[cursors+1]<=time)
+            if not advance.any():
+                break
+            cursors += advance
+        else:
+            lost |= (cursors<self.lastSegment) & (t[cursors+1]<=time)
+        for i in np.flatnonzero(lost):
+            first, last = self.firstSegment[i], self.lastSegment[i]
+            cursors[i] = min(max(first + int(np.searchsorted(t[first:last+1], time, side="right"))-1, first), last)
+        return cursors
+
+    def sample(self, time: float)->tuple[np.ndarray]:
+        """Returns the positions (an Nx2 array) and the angles (an array of length N) of the trajectories at a certain time."""
+        i = self.seek(time)
+        duration = self.duration[i]
+        alpha = np.clip(np.divide(time-self.t[i], duration, out=np.ones(len(i)), where=duration>0), 0, 1)
+        positions = np.column_stack((self.x[i] + alpha*self.dx[i], self.y[i] + alpha*self.dy[i]))%self.limits
+        return positions, self.angle[i] + alpha*self.dAngle[i]
@@ -3,6 +3,7 @@ from tkinter import Tk
 
 
 
-def beginGame(tk: Tk, config: dict):
-    print(config)
-    configureGame(tk, config["space"], config["map"], config["name"], config["rival"])
\ No newline at end of file
+def beginGame(tk: Tk, config: dict)->bool:
+    """Runs a race with the configuration chosen on the title screen. Returns True if the window was closed during the race."""
+    report = configureGame(tk, config["space"], config["map"], config["name"], config["rivals"])
+    return report["windowClosed"]
\ No newline at end of file